@@ -42,7 +42,7 @@ else:
     # Manually construct the 'data' dictionary from flat CLI context if needed
     data_context = app.node.try_get_context("data")
     ecr_context = app.node.try_get_context("ecr")
-    if data_context is None or not isinstance(data_context, dict):
+    if data_context is None or not isinstance(data_context, (dict, list)):
         print("Constructing 'data' context from individual CLI parameters...")
         data_type_cli = app.node.try_get_context("data.type")
         if data_type_cli:
@@ -86,26 +86,32 @@ for key in required_context:
             f"Please pass it via the CLI (e.g., -c {key}=your_value) or define it in cdk.json."
         )
 
-# Validate the data structure
+# Validate the data structure: one [data] table, or a [[data]] list with at most one source per type
 data = app.node.try_get_context("data")
-data_type = data.get("type")
-if data_type not in ["iiif", "ead"]:
-    sys.exit(f"Error: Invalid data type '{data_type}'. The data.type must be either 'iiif' or 'ead'.")
-
-if data_type == "iiif" and not data.get("collection_url"):
-    sys.exit(
-        "Error: Missing required field 'collection_url' for data type 'iiif'. "
-        "Please provide it in the 'data' context object."
-    )
-
-if data_type == "ead":
-    s3_config = data.get("s3", {})
-    if not s3_config.get("bucket") or not s3_config.get("prefix"):
+sources = data if isinstance(data, list) else [data]
+data_types = [source.get("type") for source in sources]
+if len(set(data_types)) != len(data_types):
+    sys.exit("Error: Each data type may only be configured once in the [[data]] list.")
+
+for data_source in sources:
+    data_type = data_source.get("type")
+    if data_type not in ["iiif", "ead"]:
+        sys.exit(f"Error: Invalid data type '{data_type}'. The data.type must be either 'iiif' or 'ead'.")
+
+    if data_type == "iiif" and not data_source.get("collection_url"):
         sys.exit(
-            "Error: Missing required S3 configuration for data type 'ead'. "
-            "Please provide 'bucket' and 'prefix' in the 'data.s3' context object."
+            "Error: Missing required field 'collection_url' for data type 'iiif'. "
+            "Please provide it in the 'data' context object."
         )
 
+    if data_type == "ead":
+        s3_config = data_source.get("s3", {})
+        if not s3_config.get("bucket") or not s3_config.get("prefix"):
+            sys.exit(
+                "Error: Missing required S3 configuration for data type 'ead'. "
+                "Please provide 'bucket' and 'prefix' in the 'data.s3' context object."
+            )
+
 # We already determined stack_prefix at the beginning of the file
 # Just use the value we determined earlier for consistency
 stack_prefix = current_stack_prefix
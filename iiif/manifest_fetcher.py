@@ -1,5 +1,13 @@
+import asyncio
+import gzip
+import hashlib
+import io
+import json
 import logging
 import os
+import threading
+import time
+from urllib.parse import urljoin
 
 import boto3
 from loam_iiif.iiif import IIIFClient
@@ -7,20 +15,556 @@ from loam_iiif.iiif import IIIFClient
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+# Collections (and collection pages) fetched at the same time
+CRAWL_CONCURRENCY = int(os.environ.get("CRAWL_CONCURRENCY", "8"))
+# Seconds between checkpoints of the crawl state to S3 (0 disables checkpointing)
+CHECKPOINT_INTERVAL = float(os.environ.get("CHECKPOINT_INTERVAL", "60"))
+CHECKPOINT_PREFIX = os.environ.get("CHECKPOINT_PREFIX", "crawl-checkpoints/")
+# manifests.csv (one URI per line) or manifests.jsonl (uri, label, navDate and id_hash per line)
+MANIFEST_LIST_KEY = os.environ.get("MANIFEST_LIST_KEY", "manifests.csv")
+# S3 multipart parts must be at least 5 MiB, except the last one
+PART_SIZE = int(os.environ.get("PART_SIZE", str(8 * 1024 * 1024)))
+# "full" crawls everything in this task. A sharded crawl runs "plan" once, "shard" in
+# SHARD_COUNT tasks (SHARD_INDEX 0..SHARD_COUNT-1) and then "merge" once.
+CRAWL_MODE = os.environ.get("CRAWL_MODE", "full")
+SHARD_COUNT = int(os.environ.get("SHARD_COUNT", "1"))
+SHARD_INDEX = int(os.environ.get("SHARD_INDEX", "0"))
+SHARD_PREFIX = os.environ.get("SHARD_PREFIX", "crawl-shards/")
+# Seconds a Lambda crawl keeps back before its timeout to checkpoint and hand off to Fargate
+HANDOFF_MARGIN = float(os.environ.get("HANDOFF_MARGIN", "60"))
 
-def fetch_collection(url):
+COLLECTION = "collection"
+PAGE = "page"
+
+
+def status_key(key):
+    """``manifests.csv`` -> ``manifests.status.json``, which says whether the crawl behind a list was complete."""
+    return f"{key.rpartition('.')[0]}.status.json"
+
+
+def link_url(link, base_url):
+    """The absolute URL of a ``first``/``next`` link: a string, or an object with ``id``/``@id``."""
+    if isinstance(link, dict):
+        link = link.get("id") or link.get("@id")
+    if not isinstance(link, str) or not link.strip():
+        return None
+    return urljoin(base_url, link.strip())
+
+
+class CrawlHandoff(Exception):
+    """A Lambda crawl ran out of time; Step Functions hands it on to a Fargate task."""
+
+
+class Checkpoints:
+    """Crawl state saved to S3 so a restarted task resumes instead of starting over."""
+
+    def __init__(self, s3, bucket, root_url):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = f"{CHECKPOINT_PREFIX}{hashlib.sha256(root_url.encode('utf-8')).hexdigest()[:16]}.json.gz"
+        self.root_url = root_url
+
+    def load(self):
+        try:
+            body = self.s3.get_object(Bucket=self.bucket, Key=self.key)["Body"].read()
+        except self.s3.exceptions.NoSuchKey:
+            return None
+        state = json.loads(gzip.decompress(body))
+        if state.get("root") != self.root_url:
+            return None
+        return state
+
+    def save(self, state):
+        body = gzip.compress(json.dumps({"root": self.root_url, **state}).encode("utf-8"))
+        self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=body, ContentType="application/json")
+
+    def clear(self):
+        self.s3.delete_object(Bucket=self.bucket, Key=self.key)
+
+    def discard(self, list_key):
+        """Clear the checkpoint and abort the manifest list upload it was resuming."""
+        state = self.load()
+        upload_id = (state or {}).get("writer", {}).get("upload_id")
+        if upload_id:
+            abort_upload(self.s3, self.bucket, list_key, upload_id)
+        self.clear()
+
+
+def abort_upload(s3, bucket, key, upload_id):
+    """Abort a multipart upload so its parts don't linger until the bucket's lifecycle rule (best effort)."""
     try:
-        with IIIFClient() as client:
-            manifests, collections = client.get_manifests_and_collections_ids(url)
+        s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+    except Exception as e:
+        logger.warning(f"Could not abort the upload of s3://{bucket}/{key}: {e}")
+
+
+class ManifestListWriter:
+    """Streams manifest rows into an S3 multipart upload as the crawl discovers them.
+
+    Rows are buffered until a part is full, and the part is then uploaded while
+    the crawl continues. Lists smaller than one part are written with a single PUT.
+    """
+
+    def __init__(self, s3, bucket, key):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.jsonl = key.endswith(".jsonl")
+        self.content_type = "application/jsonl" if self.jsonl else "text/csv"
+        self.upload_id = None
+        self.parts = []
+        self.next_part = 1
+        self.buffer = io.BytesIO()
+        self.buffered = []
+        self.lock = threading.Lock()
+
+    def restore(self, state):
+        self.upload_id = state.get("upload_id")
+        self.parts = state.get("parts", [])
+        # Parts that were uploading when the checkpoint was taken are written again under new numbers
+        self.next_part = max((part["PartNumber"] for part in self.parts), default=0) + 1
+
+    def state(self):
+        return {"upload_id": self.upload_id, "parts": self.parts}
+
+    def row(self, uri, info):
+        if not self.jsonl:
+            return f"{uri}\n"
+        record = {"uri": uri, **info, "id_hash": hashlib.sha256(uri.encode("utf-8")).hexdigest()}
+        return json.dumps(record, ensure_ascii=False) + "\n"
+
+    def write(self, uri, info):
+        self.buffer.write(self.row(uri, info).encode("utf-8"))
+        self.buffered.append(uri)
+
+    def take_part(self):
+        """Swap out the buffer if it holds a full part; returns (part_number, body, uris) or None."""
+        if self.buffer.tell() < PART_SIZE:
+            return None
+        return self._take()
+
+    def _take(self):
+        part = (self.next_part, self.buffer.getvalue(), self.buffered)
+        self.next_part += 1
+        self.buffer = io.BytesIO()
+        self.buffered = []
+        return part
+
+    def upload_part(self, part_number, body):
+        """Upload one part and return its entry for ``parts``; called from worker threads."""
+        with self.lock:
+            if self.upload_id is None:
+                self.upload_id = self.s3.create_multipart_upload(
+                    Bucket=self.bucket, Key=self.key, ContentType=self.content_type
+                )["UploadId"]
+        response = self.s3.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=part_number, Body=body
+        )
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    def abort(self):
+        if self.upload_id is not None:
+            abort_upload(self.s3, self.bucket, self.key, self.upload_id)
+            self.upload_id = None
+            self.parts = []
+
+    def close(self, failed=()):
+        """Upload whatever is buffered and finish the object, then record the collections that failed.
+
+        A list missing some collections' manifests is marked incomplete, so the
+        steps after the crawl don't take those manifests for removed.
+        """
+        if self.upload_id is None:
+            self.s3.put_object(
+                Bucket=self.bucket, Key=self.key, Body=self.buffer.getvalue(), ContentType=self.content_type
+            )
+        else:
+            if self.buffer.tell():
+                part_number, body, _uris = self._take()
+                self.parts.append(self.upload_part(part_number, body))
+            self.s3.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id,
+                MultipartUpload={"Parts": sorted(self.parts, key=lambda part: part["PartNumber"])},
+            )
+        status = {"complete": not failed, "failed": sorted(failed)}
+        self.s3.put_object(
+            Bucket=self.bucket,
+            Key=status_key(self.key),
+            Body=json.dumps(status).encode("utf-8"),
+            ContentType="application/json",
+        )
+
+
+class CollectionCrawler:
+    """Walks a IIIF collection tree with a pool of asyncio workers.
+
+    Follows the same rules as ``IIIFClient.get_manifests_and_collections_ids``:
+    Presentation 3 ``items``, Presentation 2 ``collections``/``manifests`` and
+    2.1.1 paginated collections (``first``/``next``). Each page is a separate
+    unit of work, so sub-collections and pages are fetched concurrently.
+    """
+
+    def __init__(self, root_url, concurrency=CRAWL_CONCURRENCY, checkpoints=None, writer=None, start=None, seen=()):
+        self.root_url = root_url
+        self.concurrency = concurrency
+        self.checkpoints = checkpoints
+        self.writer = writer
+        # Queued and in-flight work, in discovery order; both are saved in checkpoints.
+        # A shard starts from its share of the sub-collections instead of the root.
+        start = start if start is not None else [root_url]
+        self.pending = {(COLLECTION, url): None for url in start}
+        self.seen = {*seen, *start}
+        self.in_flight = set()
+        # Manifest URI -> row details, or None once its row is safely in an uploaded part
+        self.manifests = {}
+        self.failed = []
+        self.processed = 0
+
+    def restore(self, state):
+        self.pending = dict.fromkeys(tuple(entry) for entry in state["frontier"])
+        self.seen = set(state["seen"])
+        self.manifests = state["manifests"]
+        if isinstance(self.manifests, list):
+            # Checkpoints written before the list was streamed hold bare URIs
+            self.manifests = {uri: {"label": None, "navDate": None} for uri in self.manifests}
+        self.failed = state.get("failed", [])
+        self.processed = state.get("processed", 0)
+        if self.writer:
+            self.writer.restore(state.get("writer", {}))
+            # Rows that never made it into an uploaded part are written again
+            for uri, info in self.manifests.items():
+                if info is not None:
+                    self.writer.write(uri, info)
+
+    def snapshot(self):
+        # Work that was in flight is put back on the frontier; re-fetching it is harmless
+        return {
+            "frontier": [list(entry) for entry in [*sorted(self.in_flight), *self.pending]],
+            "seen": sorted(self.seen),
+            "manifests": self.manifests,
+            "failed": self.failed,
+            "processed": self.processed,
+            "writer": self.writer.state() if self.writer else {},
+        }
+
+    def enqueue(self, queue, kind, url):
+        if url and url not in self.seen:
+            self.seen.add(url)
+            self.pending[(kind, url)] = None
+            queue.put_nowait((kind, url))
+
+    def visit(self, client, queue, kind, url, data):
+        """Record the manifests in one collection or page and queue what it links to."""
+        if (
+            kind == COLLECTION
+            and "first" in data
+            and not any(key in data for key in ("items", "collections", "manifests"))
+        ):
+            self.enqueue(queue, PAGE, link_url(data.get("first"), url))
+            return
+        if kind == PAGE and data.get("next"):
+            self.enqueue(queue, PAGE, link_url(data.get("next"), url))
+
+        items = data.get("items")
+        if items is None:
+            items = data.get("collections", []) + data.get("manifests", [])
+        if not isinstance(items, list):
+            logger.warning(f"Expected a list of items in {url}, found {type(items)}. Skipping items.")
+            return
+
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            # loam-iiif's item helpers are private; requirements.txt pins the version they were checked against
+            item_type = client._normalize_item_type(item)
+            item_id = client._normalize_item_id(item, url)
+            if not item_id:
+                continue
+            if "manifest" in item_type and item_id not in self.manifests:
+                info = {"label": client._extract_iiif_text(item.get("label")), "navDate": item.get("navDate")}
+                self.manifests[item_id] = info
+                if self.writer:
+                    self.writer.write(item_id, info)
+            elif "collection" in item_type:
+                self.enqueue(queue, COLLECTION, item_id)
+
+    async def worker(self, queue):
+        # One client (and requests session) per worker; sessions are not shared between threads
+        with IIIFClient(no_cache=True) as client:
+            while True:
+                kind, url = await queue.get()
+                self.pending.pop((kind, url), None)
+                self.in_flight.add((kind, url))
+                try:
+                    data = await asyncio.to_thread(client.fetch_json, url)
+                    if data is None:
+                        raise ValueError("empty or unparseable response")
+                    self.visit(client, queue, kind, url, data)
+                    if self.writer:
+                        await self.flush_part()
+                except Exception as e:
+                    logger.warning(f"Skipping {kind} due to fetch error: {url} ({e})")
+                    self.failed.append(url)
+                # Not in a finally: work interrupted by cancellation stays in flight for the checkpoint
+                self.in_flight.discard((kind, url))
+                self.processed += 1
+                queue.task_done()
+
+    async def flush_part(self):
+        part = self.writer.take_part()
+        if part is None:
+            return
+        part_number, body, uris = part
+        try:
+            uploaded = await asyncio.to_thread(self.writer.upload_part, part_number, body)
+        except Exception as e:
+            # Keep the rows for the next part; the skipped part number is never listed
+            logger.warning(
+                f"Failed to upload part {part_number} of {self.writer.key}, retrying with the next part: {e}"
+            )
+            for uri in uris:
+                self.writer.write(uri, self.manifests[uri])
+            return
+        # Recorded together so a checkpoint never lists a part whose rows it also keeps
+        self.writer.parts.append(uploaded)
+        for uri in uris:
+            self.manifests[uri] = None
+        logger.info(f"Uploaded part {part_number} of {self.writer.key} ({len(self.manifests)} manifests found so far)")
+
+    async def checkpoint_periodically(self):
+        while True:
+            await asyncio.sleep(CHECKPOINT_INTERVAL)
+            state = self.snapshot()
+            await asyncio.to_thread(self.checkpoints.save, state)
+            logger.info(
+                f"Checkpoint: {self.processed} pages crawled, {len(state['frontier'])} queued, "
+                f"{len(self.manifests)} manifests found"
+            )
+
+    async def crawl(self, deadline=None):
+        """Crawl until the queue is empty, or until ``deadline`` (a ``time.monotonic()`` value).
+
+        A crawl that reaches its deadline is checkpointed and raises ``CrawlHandoff``.
+        """
+        queue = asyncio.Queue()
+        for entry in self.pending:
+            queue.put_nowait(entry)
+
+        tasks = [asyncio.create_task(self.worker(queue)) for _ in range(self.concurrency)]
+        if self.checkpoints and CHECKPOINT_INTERVAL > 0:
+            tasks.append(asyncio.create_task(self.checkpoint_periodically()))
+        finished = True
+        try:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            await asyncio.wait_for(queue.join(), timeout)
+        except asyncio.TimeoutError:
+            finished = False
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if not finished:
+            if self.checkpoints:
+                await asyncio.to_thread(self.checkpoints.save, self.snapshot())
+            raise CrawlHandoff(
+                f"Crawl stopped at its deadline with {len(self.pending) + len(self.in_flight)} pages still queued "
+                f"and {len(self.manifests)} manifests found"
+            )
+        if self.writer:
+            await asyncio.to_thread(self.writer.close, self.failed)
+        return list(self.manifests)
+
+
+def run_crawl(crawler, checkpoints=None, deadline=None):
+    """Run a crawl, resuming from its checkpoint if there is one; returns the manifest URLs."""
+    state = checkpoints.load() if checkpoints else None
+    if state:
+        crawler.restore(state)
+        logger.info(
+            f"Resuming crawl from checkpoint: {len(crawler.pending)} queued, {len(crawler.manifests)} manifests found"
+        )
+
+    started = time.perf_counter()
+    try:
+        manifests = asyncio.run(crawler.crawl(deadline))
+    except CrawlHandoff as e:
+        logger.info(f"Handing the crawl off: {e}")
+        raise
     except Exception as e:
         logger.error(f"An error occurred: {e}")
+        # The upload can't be resumed without the checkpoint that lists its parts, so both go
+        if crawler.writer:
+            crawler.writer.abort()
+        if checkpoints:
+            checkpoints.clear()
         raise
 
-    logger.info(f"Found {len(manifests)} manifests and {len(collections)} collections.")
+    logger.info(
+        f"Found {len(manifests)} manifests in {crawler.processed} collection pages "
+        f"({len(crawler.failed)} failed) in {time.perf_counter() - started:.1f}s "
+        f"with {crawler.concurrency} workers."
+    )
+    if crawler.failed:
+        logger.warning(
+            f"The manifest list is incomplete: {len(crawler.failed)} collections failed, "
+            "so manifests missing from it are kept rather than removed"
+        )
+    return manifests
+
+
+def fetch_collection(url, s3=None, bucket_name=None, key=None, deadline=None):
+    """Crawl a collection and return its manifest URLs.
+
+    With an S3 client and bucket, the crawl resumes from (and saves) checkpoints,
+    and with a ``key`` the manifest list is streamed to that object as it grows.
+    """
+    checkpoints = Checkpoints(s3, bucket_name, url) if s3 and bucket_name else None
+    writer = ManifestListWriter(s3, bucket_name, key) if checkpoints and key else None
+    crawler = CollectionCrawler(url, checkpoints=checkpoints, writer=writer)
+    return run_crawl(crawler, checkpoints, deadline)
+
+
+class CrawlShards:
+    """Files shared by the tasks of a sharded crawl, under ``SHARD_PREFIX``."""
+
+    def __init__(self, s3, bucket, root_url, list_key=MANIFEST_LIST_KEY):
+        self.s3 = s3
+        self.bucket = bucket
+        self.root_url = root_url
+        self.prefix = f"{SHARD_PREFIX}{hashlib.sha256(root_url.encode('utf-8')).hexdigest()[:16]}/"
+        self.extension = list_key.rpartition(".")[2]
+
+    @property
+    def plan_key(self):
+        return f"{self.prefix}shards.json"
+
+    def part_key(self, index):
+        return f"{self.prefix}part-{index:05d}.{self.extension}"
+
+    def save_plan(self, plan):
+        body = json.dumps({"root": self.root_url, **plan}).encode("utf-8")
+        self.s3.put_object(Bucket=self.bucket, Key=self.plan_key, Body=body, ContentType="application/json")
+
+    def load_plan(self):
+        plan = json.loads(self.s3.get_object(Bucket=self.bucket, Key=self.plan_key)["Body"].read())
+        if plan.get("root") != self.root_url:
+            raise ValueError(f"Shard plan {self.plan_key} is for {plan.get('root')}, not {self.root_url}")
+        return plan
+
+    def clear(self, count):
+        parts = [self.part_key(index) for index in range(count)]
+        keys = [self.plan_key, *parts, *(status_key(part) for part in parts)]
+        self.s3.delete_objects(Bucket=self.bucket, Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True})
+
+
+def plan_shards(url, shard_count):
+    """Expand the top of the collection tree until there are enough sub-collections to share out.
 
+    Returns the manifests listed above that level, the sub-collections split
+    round-robin into ``shard_count`` shares, and every URL already visited.
+    """
+    crawler = CollectionCrawler(url)
+    queue = asyncio.Queue()
+    collections = [url]
+    with IIIFClient(no_cache=True) as client:
+        # Expand a whole level at a time while it has fewer collections than there are shards
+        while collections and (len(collections) < shard_count or collections == [url]):
+            work = [(COLLECTION, collection) for collection in collections]
+            collections = []
+            while work:
+                kind, page_url = work.pop(0)
+                data = client.fetch_json(page_url)
+                crawler.processed += 1
+                if data is None:
+                    logger.warning(f"Skipping {kind} due to fetch error: {page_url}")
+                    crawler.failed.append(page_url)
+                    continue
+                crawler.visit(client, queue, kind, page_url, data)
+                while not queue.empty():
+                    found = queue.get_nowait()
+                    # Pages belong to the collection being listed; collections form the next level
+                    if found[0] == PAGE:
+                        work.append(found)
+                    else:
+                        collections.append(found[1])
+
+    shares = [collections[index::shard_count] for index in range(shard_count)]
+    logger.info(
+        f"Planned {shard_count} shards over {len(collections)} sub-collections "
+        f"({len(crawler.manifests)} manifests listed above them, {crawler.processed} pages read)"
+    )
+    return {
+        "count": shard_count,
+        "manifests": crawler.manifests,
+        "shards": shares,
+        "seen": sorted(crawler.seen),
+        "failed": crawler.failed,
+    }
+
+
+def crawl_shard(shards, index):
+    """Crawl one shard's sub-collections into its partial manifest list."""
+    plan = shards.load_plan()
+    checkpoints = Checkpoints(shards.s3, shards.bucket, f"{shards.root_url}#shard-{index}")
+    writer = ManifestListWriter(shards.s3, shards.bucket, shards.part_key(index))
+    crawler = CollectionCrawler(
+        shards.root_url, checkpoints=checkpoints, writer=writer, start=plan["shards"][index], seen=plan["seen"]
+    )
+    logger.info(f"Crawling shard {index} of {plan['count']}: {len(plan['shards'][index])} sub-collections")
+    manifests = run_crawl(crawler, checkpoints)
+    checkpoints.clear()
     return manifests
 
 
+def read_rows(body, jsonl):
+    """Yield ``(uri, info)`` from a streamed partial manifest list."""
+    for line in body.iter_lines():
+        if not line.strip():
+            continue
+        if jsonl:
+            row = json.loads(line)
+            yield row["uri"], {"label": row.get("label"), "navDate": row.get("navDate")}
+        else:
+            yield line.decode("utf-8").strip(), {"label": None, "navDate": None}
+
+
+def merge_shards(shards, key):
+    """Combine the planned manifests and every shard's partial list into the final list, dropping duplicates."""
+    plan = shards.load_plan()
+    writer = ManifestListWriter(shards.s3, shards.bucket, key)
+    seen = set()
+    failed = list(plan.get("failed", []))
+
+    def write(uri, info):
+        if uri in seen:
+            return
+        seen.add(uri)
+        writer.write(uri, info)
+        part = writer.take_part()
+        if part:
+            part_number, body, _uris = part
+            writer.parts.append(writer.upload_part(part_number, body))
+
+    try:
+        for uri, info in plan["manifests"].items():
+            write(uri, info or {"label": None, "navDate": None})
+        for index in range(plan["count"]):
+            body = shards.s3.get_object(Bucket=shards.bucket, Key=shards.part_key(index))["Body"]
+            for uri, info in read_rows(body, writer.jsonl):
+                write(uri, info)
+            status = shards.s3.get_object(Bucket=shards.bucket, Key=status_key(shards.part_key(index)))["Body"]
+            failed.extend(json.loads(status.read())["failed"])
+        writer.close(failed)
+    except Exception:
+        writer.abort()
+        raise
+    logger.info(f"Merged {plan['count']} shards into {len(seen)} manifests ({len(failed)} collections failed)")
+    shards.clear(plan["count"])
+    return len(seen)
+
+
 def main():
     url = os.environ.get("COLLECTION_URL")
     if not url:
@@ -32,25 +576,57 @@ def main():
         logger.error("No BUCKET_NAME environment variable set")
         return
 
-    manifests_urls = fetch_collection(url)
-    data = "\n".join(manifests_urls)
+    s3 = boto3.client("s3")
+    shards = CrawlShards(s3, bucket_name, url)
+    if CRAWL_MODE == "plan":
+        shards.save_plan(plan_shards(url, SHARD_COUNT))
+        logger.info(f"Saved shard plan to s3://{bucket_name}/{shards.plan_key}")
+        return
+    if CRAWL_MODE == "shard":
+        crawl_shard(shards, SHARD_INDEX)
+        logger.info(f"Uploaded shard list to s3://{bucket_name}/{shards.part_key(SHARD_INDEX)}")
+        return
 
     try:
-        s3 = boto3.client("s3")
-
-        respone = s3.put_object(
-            Body=bytes(data, encoding="utf-8"),
-            Bucket=bucket_name,
-            Key="manifests.csv",
-            ContentType="text/csv",
-        )
-        logger.info(f"Uploaded file to S3: {respone}")
+        if CRAWL_MODE == "merge":
+            merge_shards(shards, MANIFEST_LIST_KEY)
+        else:
+            fetch_collection(url, s3=s3, bucket_name=bucket_name, key=MANIFEST_LIST_KEY)
     except Exception as e:
-        logger.error(f"An error occurred uploading file to S3: {e}")
+        logger.error(f"An error occurred writing the manifest list to S3: {e}")
         raise
+    logger.info(f"Uploaded manifest list to s3://{bucket_name}/{MANIFEST_LIST_KEY}")
+
+    # The crawl finished and its output is stored, so the next run starts fresh
+    Checkpoints(s3, bucket_name, url).clear()
 
     logger.info("Task completed successfully")
 
 
+def handler(event, context):
+    """Lambda entry point: crawl ``collection_url`` into ``s3.Key`` in ``BUCKET_NAME``.
+
+    Stops ``HANDOFF_MARGIN`` seconds before the Lambda timeout and raises
+    ``CrawlHandoff``. With ``"handoff": "resume"`` the checkpoint is kept for the
+    Fargate task to carry on from; otherwise it and its list upload are discarded so
+    the next crawl starts over.
+    """
+    url = event["collection_url"]
+    key = event["s3"]["Key"]
+    bucket_name = os.environ["BUCKET_NAME"]
+    deadline = time.monotonic() + context.get_remaining_time_in_millis() / 1000 - HANDOFF_MARGIN
+
+    s3 = boto3.client("s3")
+    checkpoints = Checkpoints(s3, bucket_name, url)
+    try:
+        manifests = fetch_collection(url, s3=s3, bucket_name=bucket_name, key=key, deadline=deadline)
+    except CrawlHandoff:
+        if event.get("handoff") != "resume":
+            checkpoints.discard(key)
+        raise
+    checkpoints.clear()
+    return {"manifests": len(manifests), "key": key}
+
+
 if __name__ == "__main__":
     main()
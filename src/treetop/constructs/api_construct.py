@@ -21,6 +21,8 @@ from aws_cdk import (
 )
 from constructs import Construct
 
+from treetop.constructs.performance import function_profile
+
 
 class ApiConstruct(Construct):
     def __init__(
@@ -77,12 +79,10 @@ class ApiConstruct(Construct):
         chat_function = _lambda.Function(
             self,
             "ChatFunction",
-            runtime=_lambda.Runtime.PYTHON_3_11,
             handler="index.handler",
             code=_lambda.Code.from_asset("src/treetop/functions/chat"),
-            timeout=Duration.minutes(2),
-            memory_size=1024,
             environment={"KNOWLEDGE_BASE_ID": knowledge_base.attr_knowledge_base_id, "MODEL_ARN": model_arn},
+            **function_profile(self, "chat", memory_size=1024, timeout=Duration.minutes(2)),
         )
 
         chat_function.node.add_dependency(knowledge_base)
@@ -113,15 +113,13 @@ class ApiConstruct(Construct):
         status_function = _lambda.Function(
             self,
             "StatusFunction",
-            runtime=_lambda.Runtime.PYTHON_3_11,
             handler="index.handler",
             code=_lambda.Code.from_asset("src/treetop/functions/status"),
-            timeout=Duration.minutes(1),
-            memory_size=512,
             environment={
                 "KNOWLEDGE_BASE_ID": knowledge_base_id or knowledge_base.attr_knowledge_base_id,
                 "DATA_SOURCE_ID": data_source_id or "",
             },
+            **function_profile(self, "status", memory_size=512, timeout=Duration.minutes(1)),
         )
 
         status_function.node.add_dependency(knowledge_base)
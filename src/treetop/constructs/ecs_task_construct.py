@@ -15,7 +15,9 @@ from constructs import Construct
 
 
 class EcsConstruct(Construct):
-    def __init__(self, scope: Construct, id: str, *, data_bucket, ecr_image: str, **kwargs) -> None:
+    def __init__(
+        self, scope: Construct, id: str, *, data_bucket, ecr_image: str, cpu: int = 256, memory_mib: int = 512, **kwargs
+    ) -> None:
         super().__init__(scope, id)
 
         # Use the default VPC
@@ -32,6 +34,12 @@ class EcsConstruct(Construct):
         )
 
         data_bucket.grant_put(self.task_role)
+        # The crawler reads and clears its own checkpoints
+        data_bucket.grant_read(self.task_role, "crawl-checkpoints/*")
+        data_bucket.grant_delete(self.task_role, "crawl-checkpoints/*")
+        # Sharded crawls share a plan and partial lists that the merge task reads and removes
+        data_bucket.grant_read(self.task_role, "crawl-shards/*")
+        data_bucket.grant_delete(self.task_role, "crawl-shards/*")
 
         # Execution Role for ECS Task
         self.execution_role = iam.Role(
@@ -51,8 +59,8 @@ class EcsConstruct(Construct):
         self.task_definition = ecs.FargateTaskDefinition(
             self,
             "TreetopIiifFetcherTaskDef",
-            memory_limit_mib=512,
-            cpu=256,
+            memory_limit_mib=memory_mib,
+            cpu=cpu,
             task_role=self.task_role,
             execution_role=self.execution_role,
         )
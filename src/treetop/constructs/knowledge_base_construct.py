@@ -5,6 +5,18 @@ from aws_cdk import aws_iam as iam
 from constructs import Construct
 
 
+def data_prefix(source_type):
+    """The prefix of a source type's documents in the data bucket."""
+    return f"data/{source_type}/"
+
+
+def shard_prefixes(source_type, shards):
+    """The prefix of each of a source type's data sources; the writers pick the shard by hash."""
+    if shards <= 1:
+        return [data_prefix(source_type)]
+    return [f"{data_prefix(source_type)}shard-{shard:02d}/" for shard in range(shards)]
+
+
 class KnowledgeBaseConstruct(Construct):
     def __init__(
         self,
@@ -16,6 +28,7 @@ class KnowledgeBaseConstruct(Construct):
         db_credentials: str,
         embedding_model_arn: str,
         db_initialization: str,
+        data_config,
         db_config: dict = None,
         **kwargs,
     ) -> None:
@@ -104,29 +117,65 @@ class KnowledgeBaseConstruct(Construct):
             ),
         )
 
-        self.s3_data_source = bedrock.CfnDataSource(
-            self,
-            "MyCfnDataSource",
-            data_source_configuration=bedrock.CfnDataSource.DataSourceConfigurationProperty(
-                type="S3",
-                s3_configuration=bedrock.CfnDataSource.S3DataSourceConfigurationProperty(
-                    bucket_arn=data_bucket.bucket_arn, inclusion_prefixes=["data/"]
-                ),
-            ),
-            name="TreetopS3DataSource",
-            knowledge_base_id=self.knowledge_base.attr_knowledge_base_id,
-            description="Treetop S3 Data Source",
-            vector_ingestion_configuration=bedrock.CfnDataSource.VectorIngestionConfigurationProperty(
-                chunking_configuration=bedrock.CfnDataSource.ChunkingConfigurationProperty(
-                    chunking_strategy="FIXED_SIZE",
-                    fixed_size_chunking_configuration=bedrock.CfnDataSource.FixedSizeChunkingConfigurationProperty(
-                        max_tokens=300, overlap_percentage=20
+        # One data source per source type, so an ingestion job only scans the partition it covers. With
+        # [ingestion] shards, each type's documents are split over that many data sources, whose
+        # ingestion jobs run at the same time.
+        ingestion_config = self.node.try_get_context("ingestion") or {}
+        shards = int(ingestion_config.get("shards", 1))
+        if shards < 1:
+            raise ValueError(f"ingestion shards must be at least 1, got {shards}")
+        sources = data_config if isinstance(data_config, list) else [data_config or {}]
+        # Bedrock's data sources per knowledge base quota (5 unless raised for the account)
+        max_data_sources = int(ingestion_config.get("max_data_sources", 5))
+        if shards * len(sources) > max_data_sources:
+            raise ValueError(
+                f"{shards} ingestion shards for {len(sources)} source type(s) need {shards * len(sources)} data "
+                f"sources, more than the {max_data_sources} allowed per knowledge base (lower [ingestion] shards, "
+                "or raise max_data_sources after raising the quota)"
+            )
+        # The first data source keeps the ID and name of the single data/ data source it grew out of, so an
+        # upgrade narrows that one in place (keeping its embeddings) instead of replacing it and re-embedding
+        source_types = [source.get("type") for source in sources]
+        legacy_type = "iiif" if "iiif" in source_types else source_types[0]
+        self.data_sources = {}
+        for source in sources:
+            source_type = source.get("type")
+            name = source_type.capitalize()
+            # Chunking of each source's documents (see [data.chunking] in config.toml)
+            chunking = {"strategy": "FIXED_SIZE", "max_tokens": 300, "overlap_percentage": 20}
+            chunking.update(source.get("chunking") or {})
+            if chunking["strategy"] not in ("FIXED_SIZE", "NONE"):
+                raise ValueError(f"chunking strategy must be 'FIXED_SIZE' or 'NONE', got {chunking['strategy']!r}")
+            self.data_sources[source_type] = []
+            for shard, prefix in enumerate(shard_prefixes(source_type, shards)):
+                shard_name = f"Shard{shard:02d}" if shards > 1 else ""
+                legacy = source_type == legacy_type and shard == 0
+                data_source = bedrock.CfnDataSource(
+                    self,
+                    "MyCfnDataSource" if legacy else f"{name}{shard_name}DataSource",
+                    data_source_configuration=bedrock.CfnDataSource.DataSourceConfigurationProperty(
+                        type="S3",
+                        s3_configuration=bedrock.CfnDataSource.S3DataSourceConfigurationProperty(
+                            bucket_arn=data_bucket.bucket_arn, inclusion_prefixes=[prefix]
+                        ),
+                    ),
+                    name="TreetopS3DataSource" if legacy else f"Treetop{name}{shard_name}S3DataSource",
+                    knowledge_base_id=self.knowledge_base.attr_knowledge_base_id,
+                    description=f"Treetop S3 Data Source for {source_type.upper()} documents under {prefix}",
+                    vector_ingestion_configuration=bedrock.CfnDataSource.VectorIngestionConfigurationProperty(
+                        chunking_configuration=bedrock.CfnDataSource.ChunkingConfigurationProperty(
+                            chunking_strategy=chunking["strategy"],
+                            fixed_size_chunking_configuration=bedrock.CfnDataSource.FixedSizeChunkingConfigurationProperty(
+                                max_tokens=chunking["max_tokens"], overlap_percentage=chunking["overlap_percentage"]
+                            )
+                            if chunking["strategy"] == "FIXED_SIZE"
+                            else None,
+                        )
                     ),
                 )
-            ),
-        )
+                data_source.node.add_dependency(self.knowledge_base)
+                self.data_sources[source_type].append(data_source)
 
-        self.s3_data_source.node.add_dependency(self.knowledge_base)
         self.knowledge_base.node.add_dependency(kb_role)
         self.knowledge_base.node.add_dependency(db_cluster)
         self.knowledge_base.node.add_dependency(db_credentials)
@@ -134,7 +183,11 @@ class KnowledgeBaseConstruct(Construct):
 
         # Add these properties to expose IDs
         self.knowledge_base_id = self.knowledge_base.attr_knowledge_base_id
-        self.data_source_id = self.s3_data_source.attr_data_source_id
+        self.data_source_ids = [
+            data_source.attr_data_source_id
+            for data_sources in self.data_sources.values()
+            for data_source in data_sources
+        ]
 
         CfnOutput(self, "KnowledgeBaseId", value=self.knowledge_base.attr_knowledge_base_id)
         CfnOutput(self, "KnowledgeBaseRoleArn", value=kb_role.role_arn)
@@ -0,0 +1,105 @@
+"""Per-function Lambda settings from the [performance] context (see config.toml).
+
+Every function keeps its built-in settings unless [performance] overrides them.
+The top-level ``architecture`` and ``runtime`` apply to all the Python
+functions. A ``[performance.<function>]`` table sets one function's
+``memory``, ``timeout_seconds``, ``ephemeral_storage`` (MB),
+``reserved_concurrency``, ``architecture`` or ``runtime``.
+
+``python -m treetop.tools.power_tuning`` replays a recorded workload at several
+memory sizes and prints the table to paste in.
+"""
+
+from aws_cdk import BundlingFileAccess, Duration, Size
+from aws_cdk import aws_lambda as _lambda
+
+# The functions that can be tuned, by their [performance.<function>] name
+FUNCTIONS = (
+    "crawl_collection",
+    "fetch_iiif_manifest",
+    "process_ead",
+    "reconcile_documents",
+    "plan_manifests",
+    "record_failures",
+    "run_report",
+    "detect_changes",
+    "split_waves",
+    "tune_concurrency",
+    "trigger",
+    "ead_events",
+    "ead_sync",
+    "chat",
+    "status",
+)
+FUNCTION_SETTINGS = (
+    "memory",
+    "timeout_seconds",
+    "ephemeral_storage",
+    "reserved_concurrency",
+    "architecture",
+    "runtime",
+)
+GLOBAL_SETTINGS = ("architecture", "runtime")
+
+ARCHITECTURES = {"x86_64": _lambda.Architecture.X86_64, "arm64": _lambda.Architecture.ARM_64}
+RUNTIMES = {
+    runtime.name: runtime
+    for runtime in (
+        _lambda.Runtime.PYTHON_3_10,
+        _lambda.Runtime.PYTHON_3_11,
+        _lambda.Runtime.PYTHON_3_12,
+        _lambda.Runtime.PYTHON_3_13,
+    )
+}
+
+
+def performance_config(scope):
+    """Return the [performance] context, checking its function names and settings."""
+    performance = scope.node.try_get_context("performance") or {}
+    for key, value in performance.items():
+        if isinstance(value, dict):
+            if key not in FUNCTIONS:
+                raise ValueError(f"Unknown function [performance.{key}]; expected one of {', '.join(FUNCTIONS)}")
+            unknown = sorted(set(value) - set(FUNCTION_SETTINGS))
+            if unknown:
+                raise ValueError(f"Unknown [performance.{key}] settings: {', '.join(unknown)}")
+        elif key not in GLOBAL_SETTINGS:
+            raise ValueError(f"Unknown [performance] setting {key!r}")
+    return performance
+
+
+def function_profile(scope, name, *, runtime=_lambda.Runtime.PYTHON_3_11, memory_size=128, timeout=None):
+    """Return the runtime, architecture, memory, timeout, ephemeral storage and reserved concurrency of ``name``.
+
+    The keyword arguments are the function's built-in settings. The result is passed on to
+    ``_lambda.Function``.
+    """
+    performance = performance_config(scope)
+    settings = {key: performance[key] for key in GLOBAL_SETTINGS if key in performance}
+    settings.update(performance.get(name) or {})
+
+    architecture = settings.get("architecture", "x86_64")
+    if architecture not in ARCHITECTURES:
+        raise ValueError(f"[performance] architecture must be 'x86_64' or 'arm64', got {architecture!r}")
+    if "runtime" in settings and settings["runtime"] not in RUNTIMES:
+        raise ValueError(f"[performance] runtime must be one of {', '.join(RUNTIMES)}, got {settings['runtime']!r}")
+    ephemeral_storage = settings.get("ephemeral_storage")
+
+    return {
+        "runtime": RUNTIMES[settings["runtime"]] if "runtime" in settings else runtime,
+        "architecture": ARCHITECTURES[architecture],
+        "memory_size": settings.get("memory", memory_size),
+        "timeout": Duration.seconds(settings["timeout_seconds"]) if "timeout_seconds" in settings else timeout,
+        "ephemeral_storage_size": Size.mebibytes(ephemeral_storage) if ephemeral_storage else None,
+        "reserved_concurrent_executions": settings.get("reserved_concurrency"),
+    }
+
+
+def python_bundling(profile, command):
+    """Bundling that installs requirements for the profile's runtime and architecture."""
+    return {
+        "image": profile["runtime"].bundling_image,
+        "platform": profile["architecture"].docker_platform,
+        "bundling_file_access": BundlingFileAccess.VOLUME_COPY,
+        "command": ["bash", "-c", command],
+    }
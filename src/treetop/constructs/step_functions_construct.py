@@ -1,17 +1,32 @@
 # step_functions_construct.py
-from aws_cdk import BundlingFileAccess, Duration, Stack, triggers
+from aws_cdk import BundlingFileAccess, Duration, RemovalPolicy, Stack, triggers
+from aws_cdk import (
+    aws_dynamodb as dynamodb,
+)
 from aws_cdk import (
     aws_ec2 as ec2,
 )
 from aws_cdk import (
     aws_ecs as ecs,
 )
+from aws_cdk import (
+    aws_events as events,
+)
+from aws_cdk import (
+    aws_events_targets as events_targets,
+)
 from aws_cdk import (
     aws_iam as iam,
 )
 from aws_cdk import (
     aws_lambda as _lambda,
 )
+from aws_cdk import (
+    aws_lambda_event_sources as lambda_event_sources,
+)
+from aws_cdk import (
+    aws_sqs as sqs,
+)
 from aws_cdk import (
     aws_stepfunctions as sfn,
 )
@@ -20,6 +35,9 @@ from aws_cdk import (
 )
 from constructs import Construct
 
+from treetop.constructs.knowledge_base_construct import shard_prefixes
+from treetop.constructs.performance import RUNTIMES, function_profile, python_bundling
+
 
 class StepFunctionsConstruct(Construct):
     def __init__(
@@ -31,92 +49,545 @@ class StepFunctionsConstruct(Construct):
         data_bucket,
         data_config,
         knowledge_base=None,
-        data_source=None,
+        data_sources=None,
         knowledge_base_id=None,
-        data_source_id=None,
         **kwargs,
     ) -> None:
         super().__init__(scope, id)
 
-        # Create the ECS Run Task state (only if ECS construct is provided)
-        run_task = None
+        # A single [data] table, or several [[data]] tables (at most one per type) whose pipelines run in parallel
+        sources = data_config if isinstance(data_config, list) else [data_config]
+        sources_by_type = {source.get("type"): source for source in sources}
+        parallel_sources = len(sources) > 1
+
+        # Collection crawl settings for the manifest fetcher task (see [crawler] in config.toml)
+        crawler_config = {
+            "concurrency": 8,
+            "checkpoint_interval": 60,
+            "shards": 1,
+            "mode": "auto",
+            "lambda_memory": 1024,
+            "lambda_timeout_minutes": 15,
+        }
+        crawler_config.update(self.node.try_get_context("crawler") or {})
+        if crawler_config["mode"] not in ("auto", "lambda", "fargate"):
+            raise ValueError(f"crawler mode must be 'auto', 'lambda' or 'fargate', got {crawler_config['mode']!r}")
+
+        # The crawler streams the manifest list to S3 as CSV (URIs only) or JSONL (URI, label, navDate, id hash)
+        manifest_list_format = self.node.try_get_context("manifest_list_format") or "csv"
+        if manifest_list_format not in ("csv", "jsonl"):
+            raise ValueError(f"manifest_list_format must be 'csv' or 'jsonl', got {manifest_list_format!r}")
+        manifest_list_key = f"manifests.{manifest_list_format}"
+
+        # Create the ECS Run Task states (only if ECS construct is provided)
+        crawl = None
         if ecs_construct:
-            run_task = sfn_tasks.EcsRunTask(
-                self,
-                "TreetopRunFargateManifestFetcherTask",
-                integration_pattern=sfn.IntegrationPattern.RUN_JOB,  # Wait for task completion
-                cluster=ecs_construct.cluster,
-                task_definition=ecs_construct.task_definition,
-                container_overrides=[
-                    sfn_tasks.ContainerOverride(
-                        container_definition=ecs_construct.container,
-                        environment=[
-                            {
-                                "name": "COLLECTION_URL",
-                                "value": sfn.JsonPath.string_at("$.collection_url"),
-                            },
-                            {"name": "BUCKET_NAME", "value": data_bucket.bucket_name},
+
+            def crawler_task(step_id, environment, result_path="$.task_result"):
+                task = sfn_tasks.EcsRunTask(
+                    self,
+                    step_id,
+                    integration_pattern=sfn.IntegrationPattern.RUN_JOB,  # Wait for task completion
+                    cluster=ecs_construct.cluster,
+                    task_definition=ecs_construct.task_definition,
+                    container_overrides=[
+                        sfn_tasks.ContainerOverride(
+                            container_definition=ecs_construct.container,
+                            environment=[
+                                {
+                                    "name": "COLLECTION_URL",
+                                    "value": sfn.JsonPath.string_at("$.collection_url"),
+                                },
+                                {"name": "BUCKET_NAME", "value": data_bucket.bucket_name},
+                                {"name": "MANIFEST_LIST_KEY", "value": sfn.JsonPath.string_at("$.s3.Key")},
+                                {"name": "CRAWL_CONCURRENCY", "value": str(crawler_config["concurrency"])},
+                                {"name": "CHECKPOINT_INTERVAL", "value": str(crawler_config["checkpoint_interval"])},
+                                *environment,
+                            ],
+                        )
+                    ],
+                    assign_public_ip=True,
+                    subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC),
+                    launch_target=sfn_tasks.EcsFargateLaunchTarget(platform_version=ecs.FargatePlatformVersion.LATEST),
+                    propagated_tag_source=ecs.PropagatedTagSource.TASK_DEFINITION,
+                    result_path=result_path,
+                )
+                # A restarted task resumes the crawl from its last S3 checkpoint
+                task.add_retry(
+                    errors=["States.TaskFailed"],
+                    interval=Duration.seconds(30),
+                    max_attempts=2,
+                    backoff_rate=2,
+                )
+                return task
+
+            shard_count = int(crawler_config["shards"])
+            if shard_count > 1:
+                # Sharded crawl: list the top-level sub-collections, crawl each share in its own task,
+                # then merge the partial lists into the manifest list
+                shard_environment = [{"name": "SHARD_COUNT", "value": str(shard_count)}]
+                crawl_shard_map = sfn.Map(
+                    self,
+                    "CrawlShards",
+                    items_path="$.crawl.shards",
+                    max_concurrency=shard_count,
+                    item_selector={
+                        "shard.$": "$$.Map.Item.Value",
+                        "collection_url.$": "$.collection_url",
+                        "s3.$": "$.s3",
+                    },
+                    result_path=sfn.JsonPath.DISCARD,
+                )
+                crawl_shard_map.item_processor(
+                    crawler_task(
+                        "CrawlShard",
+                        [
+                            {"name": "CRAWL_MODE", "value": "shard"},
+                            {"name": "SHARD_INDEX", "value": sfn.JsonPath.string_at("$.shard")},
+                            *shard_environment,
                         ],
+                        result_path=sfn.JsonPath.DISCARD,
                     )
-                ],
-                assign_public_ip=True,
-                subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC),
-                launch_target=sfn_tasks.EcsFargateLaunchTarget(platform_version=ecs.FargatePlatformVersion.LATEST),
-                propagated_tag_source=ecs.PropagatedTagSource.TASK_DEFINITION,
-                result_path="$.task_result",  # I think this can be removed
+                )
+                crawl = (
+                    sfn.Chain.start(
+                        crawler_task("PlanCrawlShards", [{"name": "CRAWL_MODE", "value": "plan"}, *shard_environment])
+                    )
+                    .next(
+                        sfn.Pass(
+                            self,
+                            "ListCrawlShards",
+                            result=sfn.Result.from_object({"shards": [str(index) for index in range(shard_count)]}),
+                            result_path="$.crawl",
+                        )
+                    )
+                    .next(crawl_shard_map)
+                    .next(
+                        crawler_task("MergeCrawlShards", [{"name": "CRAWL_MODE", "value": "merge"}, *shard_environment])
+                    )
+                )
+            else:
+                crawl = crawler_task("TreetopRunFargateManifestFetcherTask", [])
+
+        # Lambda crawl, which skips Fargate provisioning and the image pull for small collections
+        if "iiif" in sources_by_type and crawler_config["mode"] != "fargate":
+            crawl_profile = function_profile(
+                self,
+                "crawl_collection",
+                memory_size=crawler_config["lambda_memory"],
+                timeout=Duration.minutes(crawler_config["lambda_timeout_minutes"]),
+            )
+            crawl_function = _lambda.Function(
+                self,
+                "crawl_collection_function",
+                handler="manifest_fetcher.handler",
+                code=_lambda.Code.from_asset(
+                    "iiif",
+                    bundling=python_bundling(
+                        crawl_profile,
+                        "pip install -r requirements.txt -t /asset-output && cp manifest_fetcher.py /asset-output",
+                    ),
+                ),
+                environment={
+                    "BUCKET_NAME": data_bucket.bucket_name,
+                    "CRAWL_CONCURRENCY": str(crawler_config["concurrency"]),
+                    "CHECKPOINT_INTERVAL": str(crawler_config["checkpoint_interval"]),
+                },
+                **crawl_profile,
             )
+            data_bucket.grant_put(crawl_function)
+            data_bucket.grant_read(crawl_function, "crawl-checkpoints/*")
+            data_bucket.grant_delete(crawl_function, "crawl-checkpoints/*")
 
-        # Lambda function for fetching manifests from url list
-        fetch_iiif_manifest_function = _lambda.Function(
+            lambda_crawl = sfn_tasks.LambdaInvoke(
+                self,
+                "CrawlCollectionInLambda",
+                lambda_function=crawl_function,
+                payload=sfn.TaskInput.from_object(
+                    {
+                        "collection_url.$": "$.collection_url",
+                        "s3.$": "$.s3",
+                        # A single Fargate task carries on from the Lambda's checkpoint; a sharded crawl starts over
+                        "handoff": "resume" if int(crawler_config["shards"]) <= 1 else "restart",
+                    }
+                ),
+                payload_response_only=True,
+                result_path="$.task_result",
+            )
+            if crawl:
+                # Collections too large to crawl within the Lambda timeout are handed to Fargate.
+                # Starting an execution with "crawler": "fargate" goes straight to Fargate.
+                lambda_crawl.add_catch(
+                    crawl, errors=["CrawlHandoff", "Sandbox.Timedout"], result_path="$.crawl_handoff"
+                )
+                crawl = (
+                    sfn.Choice(self, "CrawlerChoice")
+                    .when(
+                        sfn.Condition.and_(
+                            sfn.Condition.is_present("$.crawler"), sfn.Condition.string_equals("$.crawler", "fargate")
+                        ),
+                        crawl,
+                    )
+                    .otherwise(lambda_crawl)
+                    .afterwards()
+                )
+            else:
+                crawl = lambda_crawl
+
+        # Layer with the helper modules shared by the ingestion functions (imported as `shared`)
+        shared_layer = _lambda.LayerVersion(
             self,
-            "fetch_iiif_manifest_function",
-            runtime=_lambda.Runtime.PYTHON_3_11,
-            handler="index.handler",
+            "SharedFunctionsLayer",
             code=_lambda.Code.from_asset(
-                "src/treetop/functions/get_iiif_manifest",
+                "src/treetop/functions/shared",
+                exclude=["__pycache__"],
                 bundling={
                     "image": _lambda.Runtime.PYTHON_3_11.bundling_image,
                     "bundling_file_access": BundlingFileAccess.VOLUME_COPY,
                     "command": [
                         "bash",
                         "-c",
-                        "pip install -r requirements.txt -t /asset-output && cp -r . /asset-output",
+                        "mkdir -p /asset-output/python/shared && cp -r . /asset-output/python/shared",
                     ],
                 },
             ),
-            timeout=Duration.minutes(2),
-            environment={"DEST_BUCKET": data_bucket.bucket_name, "DEST_PREFIX": "data/iiif/"},
+            # Plain Python modules, so any tuned runtime or architecture can use them
+            compatible_runtimes=list(RUNTIMES.values()),
+            compatible_architectures=[_lambda.Architecture.X86_64, _lambda.Architecture.ARM_64],
+            description="Helper modules shared by the Treetop ingestion functions",
+        )
+
+        # Token budgets used to size records before upload (see [chunking] in config.toml)
+        chunking_config = {"target_tokens": 200, "max_tokens": 300, "min_tokens": 40}
+        chunking_config.update(self.node.try_get_context("chunking") or {})
+        chunking_env = {
+            "CHUNK_TARGET_TOKENS": str(chunking_config["target_tokens"]),
+            "CHUNK_MAX_TOKENS": str(chunking_config["max_tokens"]),
+            "CHUNK_MIN_TOKENS": str(chunking_config["min_tokens"]),
+        }
+
+        # Data sources each type's documents are spread over by hash (see [ingestion] in config.toml)
+        shards = int((self.node.try_get_context("ingestion") or {}).get("shards", 1))
+        shards_env = {"SHARDS": str(shards)}
+
+        # Child workflow type for the Distributed Map item processors (see map_execution_type in config.toml).
+        # Each child is a single Lambda invoke, which Express workflows run faster and more cheaply,
+        # but an Express execution may not run longer than 5 minutes.
+        map_execution_type = (self.node.try_get_context("map_execution_type") or "EXPRESS").upper()
+        if map_execution_type not in ("EXPRESS", "STANDARD"):
+            raise ValueError(f"map_execution_type must be 'EXPRESS' or 'STANDARD', got {map_execution_type!r}")
+        express_children = map_execution_type == "EXPRESS"
+
+        def item_timeout_seconds(function_timeout):
+            """Timeout for an item processor's Lambda task: the function timeout plus a margin."""
+            if not express_children:
+                return 43200  # 12 hours
+            return min(int(function_timeout.to_seconds()) + 20, 300)
+
+        # Manifests per batch invocation, and how many of them are fetched concurrently
+        manifest_batch_size = self.node.try_get_context("manifest_batch_size") or 20
+        manifest_batch_concurrency = self.node.try_get_context("manifest_batch_concurrency") or 10
+        # Manifests above this size are parsed incrementally, so memory no longer grows with canvas count
+        manifest_fetch_memory = self.node.try_get_context("manifest_fetch_memory") or 128
+        manifest_stream_threshold_mb = self.node.try_get_context("manifest_stream_threshold_mb")
+        if manifest_stream_threshold_mb is None:
+            manifest_stream_threshold_mb = 5
+
+        # Fetch batches stay inside the Express limit, with room for the invoke itself
+        fetch_profile = function_profile(
+            self,
+            "fetch_iiif_manifest",
+            memory_size=manifest_fetch_memory,
+            timeout=Duration.seconds(270) if express_children else Duration.minutes(5),
+        )
+        ead_profile = function_profile(self, "process_ead", memory_size=512, timeout=Duration.minutes(3))
+        for name, profile in (("fetch_iiif_manifest", fetch_profile), ("process_ead", ead_profile)):
+            if express_children and profile["timeout"].to_seconds() > 280:
+                raise ValueError(
+                    f"[performance.{name}] timeout_seconds must be at most 280 with Express map children "
+                    '(set map_execution_type = "STANDARD" for longer timeouts)'
+                )
+        fetch_function_timeout = fetch_profile["timeout"]
+        ead_function_timeout = ead_profile["timeout"]
+
+        # Retries for transient item failures, and the share of items that may fail before a map fails
+        # (see [retries] in config.toml)
+        retry_config = {"max_attempts": 3, "tolerated_failure_percentage": 5}
+        retry_config.update(self.node.try_get_context("retries") or {})
+
+        def item_retry():
+            """Retry policy for an item processor's Lambda task: typed retryable errors and Lambda throttling.
+
+            Under Express children the retries share the 5 minute execution limit, so a slow batch that
+            fails late counts as a failed item instead (and, for IIIF, is retried by the next run).
+            """
+            return [
+                {
+                    "ErrorEquals": [
+                        "RetryableError",
+                        "Lambda.TooManyRequestsException",
+                        "Lambda.ServiceException",
+                        "Lambda.AWSLambdaException",
+                        "Lambda.SdkClientException",
+                    ],
+                    "IntervalSeconds": 2,
+                    "MaxAttempts": retry_config["max_attempts"],
+                    "BackoffRate": 2,
+                    "MaxDelaySeconds": 60,
+                    "JitterStrategy": "FULL",
+                }
+            ]
+
+        # Optional full-text harvesting from canvas annotations (see [annotations] in config.toml)
+        annotations_config = {"mode": "", "concurrency": 4}
+        annotations_config.update(self.node.try_get_context("annotations") or {})
+        annotations_env = {
+            "HARVEST_ANNOTATIONS": annotations_config["mode"],
+            "ANNOTATION_CONCURRENCY": str(annotations_config["concurrency"]),
+            # Harvested text is cached outside the knowledge base's "data/" prefix
+            "ANNOTATION_CACHE_PREFIX": "cache/iiif-annotations/",
+        }
+
+        # Per-host politeness for manifest fetches (see [rate_limit] in config.toml)
+        rate_limit_config = {"requests_per_second": 0, "burst": 0, "max_attempts": 5, "max_retry_after_seconds": 60}
+        rate_limit_config.update(self.node.try_get_context("rate_limit") or {})
+        if rate_limit_config["max_retry_after_seconds"] >= fetch_function_timeout.to_seconds():
+            raise ValueError(
+                "rate_limit max_retry_after_seconds must be shorter than the manifest fetch function's timeout "
+                f"({int(fetch_function_timeout.to_seconds())} seconds)"
+            )
+        rate_limit_env = {
+            "HOST_RATE_LIMIT": str(rate_limit_config["requests_per_second"]),
+            "HOST_BURST": str(rate_limit_config["burst"]),
+            "MAX_ATTEMPTS": str(rate_limit_config["max_attempts"]),
+            "MAX_RETRY_AFTER": str(rate_limit_config["max_retry_after_seconds"]),
+        }
+
+        # A shared request budget needs a table so concurrent invocations draw from the same bucket
+        rate_limit_table = None
+        if rate_limit_config["requests_per_second"]:
+            rate_limit_table = dynamodb.Table(
+                self,
+                "HostRateLimitTable",
+                partition_key=dynamodb.Attribute(name="host", type=dynamodb.AttributeType.STRING),
+                billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+                removal_policy=RemovalPolicy.DESTROY,
+            )
+            rate_limit_env["RATE_LIMIT_TABLE"] = rate_limit_table.table_name
+
+        # Lambda function for fetching manifests from url list
+        fetch_iiif_manifest_function = _lambda.Function(
+            self,
+            "fetch_iiif_manifest_function",
+            handler="index.handler",
+            code=_lambda.Code.from_asset(
+                "src/treetop/functions/get_iiif_manifest",
+                bundling=python_bundling(
+                    fetch_profile, "pip install -r requirements.txt -t /asset-output && cp -r . /asset-output"
+                ),
+            ),
+            environment={
+                "DEST_BUCKET": data_bucket.bucket_name,
+                "DEST_PREFIX": "data/iiif/",
+                "VALIDATORS_PREFIX": "state/iiif-validators/",
+                "BATCH_CONCURRENCY": str(manifest_batch_concurrency),
+                "STREAM_THRESHOLD_BYTES": str(max(-1, int(manifest_stream_threshold_mb * 1_000_000))),
+                **rate_limit_env,
+                **annotations_env,
+                **chunking_env,
+                **shards_env,
+            },
+            layers=[shared_layer],
+            # Each invocation fetches a whole batch of manifests
+            **fetch_profile,
         )
 
         # Lambda function for processing EAD XML files
         process_ead_function = _lambda.Function(
             self,
             "process_ead_function",
-            runtime=_lambda.Runtime.PYTHON_3_11,
             handler="index.handler",
             code=_lambda.Code.from_asset(
                 "src/treetop/functions/ead",
-                bundling={
-                    "image": _lambda.Runtime.PYTHON_3_11.bundling_image,
-                    "bundling_file_access": BundlingFileAccess.VOLUME_COPY,
-                    "command": [
-                        "bash",
-                        "-c",
-                        "pip install -r requirements.txt -t /asset-output && cp -r . /asset-output",
-                    ],
-                },
+                bundling=python_bundling(
+                    ead_profile, "pip install -r requirements.txt -t /asset-output && cp -r . /asset-output"
+                ),
             ),
-            timeout=Duration.minutes(3),
             environment={
                 "DEST_BUCKET": data_bucket.bucket_name,
                 "DEST_PREFIX": "data/ead/",
+                # Parsed EAD intermediates, kept outside the knowledge base's "data/" prefix
+                "CACHE_PREFIX": "cache/ead/",
+                # Number of chunks to print per file for debugging (0 disables)
+                "DEBUG_SAMPLE_CHUNKS": str(self.node.try_get_context("ead_debug_sample_chunks") or 0),
+                **chunking_env,
+                **shards_env,
             },
-            memory_size=512,
+            layers=[shared_layer],
+            **ead_profile,
         )
 
+        # Lambda function that deletes documents whose source has gone (see [reconcile] in config.toml)
+        reconcile_config = {"max_delete_fraction": 0.5, "dry_run": False}
+        reconcile_config.update(self.node.try_get_context("reconcile") or {})
+        reconcile_function = _lambda.Function(
+            self,
+            "reconcile_documents_function",
+            handler="index.handler",
+            code=_lambda.Code.from_asset("src/treetop/functions/reconcile"),
+            environment={
+                "DEST_BUCKET": data_bucket.bucket_name,
+                "IIIF_PREFIX": "data/iiif/",
+                "EAD_PREFIX": "data/ead/",
+                "EAD_CACHE_PREFIX": "cache/ead/",
+                "MAX_DELETE_FRACTION": str(reconcile_config["max_delete_fraction"]),
+                "DRY_RUN": str(reconcile_config["dry_run"]).lower(),
+                **shards_env,
+            },
+            layers=[shared_layer],
+            **function_profile(self, "reconcile_documents", memory_size=512, timeout=Duration.minutes(5)),
+        )
+        data_bucket.grant_read(reconcile_function)
+        data_bucket.grant_delete(reconcile_function)
+        # Removals the deletion limit refused go back into the pending manifest state
+        data_bucket.grant_put(reconcile_function, "state/iiif-manifests/*")
+
+        # Lambda function that narrows the crawled manifest list to what changed (see [delta] in config.toml)
+        delta_config = {"revalidate_days": 7}
+        delta_config.update(self.node.try_get_context("delta") or {})
+        plan_manifests_function = _lambda.Function(
+            self,
+            "plan_manifests_function",
+            handler="index.handler",
+            code=_lambda.Code.from_asset("src/treetop/functions/plan_manifests"),
+            environment={
+                "DEST_BUCKET": data_bucket.bucket_name,
+                "IIIF_PREFIX": "data/iiif/",
+                "STATE_PREFIX": "state/iiif-manifests/",
+                "REVALIDATE_DAYS": str(delta_config["revalidate_days"]),
+                **shards_env,
+            },
+            layers=[shared_layer],
+            **function_profile(self, "plan_manifests", memory_size=1024, timeout=Duration.minutes(5)),
+        )
+        data_bucket.grant_read_write(plan_manifests_function)
+
+        # Lambda function that lists the manifests of failed map batches so the next run retries them
+        record_failures_function = _lambda.Function(
+            self,
+            "record_failures_function",
+            handler="index.failures_handler",
+            code=_lambda.Code.from_asset("src/treetop/functions/plan_manifests"),
+            environment={
+                "DEST_BUCKET": data_bucket.bucket_name,
+                "STATE_PREFIX": "state/iiif-manifests/",
+            },
+            layers=[shared_layer],
+            **function_profile(self, "record_failures", memory_size=1024, timeout=Duration.minutes(5)),
+        )
+        data_bucket.grant_read_write(record_failures_function)
+
+        # Lambda function that writes the end-to-end run report once ingestion has finished
+        run_report_function = _lambda.Function(
+            self,
+            "run_report_function",
+            handler="index.handler",
+            code=_lambda.Code.from_asset("src/treetop/functions/run_report"),
+            environment={
+                "DEST_BUCKET": data_bucket.bucket_name,
+                "DATA_PREFIX": "data/",
+                "REPORT_PREFIX": "reports/",
+            },
+            layers=[shared_layer],
+            **function_profile(self, "run_report", memory_size=512, timeout=Duration.minutes(5)),
+        )
+        data_bucket.grant_read(run_report_function)
+        data_bucket.grant_put(run_report_function, "reports/*")
+        # Wildcards, as the state machine's ARN depends on this function
+        report_stack = Stack.of(self)
+        run_report_function.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["states:GetExecutionHistory", "states:DescribeMapRun"],
+                resources=[
+                    f"arn:aws:states:{report_stack.region}:{report_stack.account}:execution:*",
+                    f"arn:aws:states:{report_stack.region}:{report_stack.account}:mapRun:*",
+                ],
+            )
+        )
+
+        # Lambda function that picks the data sources whose documents a run changed, to ingest only those
+        detect_changes_function = _lambda.Function(
+            self,
+            "detect_changes_function",
+            handler="index.changes_handler",
+            code=_lambda.Code.from_asset("src/treetop/functions/run_report"),
+            environment={"DEST_BUCKET": data_bucket.bucket_name, "DATA_PREFIX": "data/"},
+            layers=[shared_layer],
+            **function_profile(self, "detect_changes", memory_size=512, timeout=Duration.minutes(5)),
+        )
+        data_bucket.grant_read(detect_changes_function)
+
+        # Map concurrency tuned between waves of items instead of fixed (see [adaptive_concurrency] in config.toml)
+        adaptive_config = {
+            "enabled": False,
+            "min": 2,
+            "max": 40,
+            "wave_size": 2000,
+            "max_throttle_rate": 0.02,
+            # Half the map's tolerated failure percentage unless set
+            "max_error_rate": None,
+            "latency_factor": 1.5,
+        }
+        adaptive_config.update(self.node.try_get_context("adaptive_concurrency") or {})
+        adaptive_concurrency = bool(adaptive_config["enabled"])
+        # Back off before the failures that fail the map: a wave at the tolerance would end the run instead
+        tolerated_failure_rate = retry_config["tolerated_failure_percentage"] / 100
+        if adaptive_config["max_error_rate"] is None:
+            adaptive_config["max_error_rate"] = tolerated_failure_rate / 2
+        elif tolerated_failure_rate and adaptive_config["max_error_rate"] >= tolerated_failure_rate:
+            raise ValueError(
+                f"[adaptive_concurrency] max_error_rate ({adaptive_config['max_error_rate']}) must be below "
+                f"[retries] tolerated_failure_percentage / 100 ({tolerated_failure_rate})"
+            )
+        if adaptive_concurrency:
+            adaptive_environment = {
+                "DEST_BUCKET": data_bucket.bucket_name,
+                "WAVES_PREFIX": "waves/",
+                "WAVE_SIZE": str(adaptive_config["wave_size"]),
+                "MIN_CONCURRENCY": str(adaptive_config["min"]),
+                "MAX_CONCURRENCY": str(adaptive_config["max"]),
+                "MAX_THROTTLE_RATE": str(adaptive_config["max_throttle_rate"]),
+                "MAX_ERROR_RATE": str(adaptive_config["max_error_rate"]),
+                "LATENCY_FACTOR": str(adaptive_config["latency_factor"]),
+            }
+            split_waves_function = _lambda.Function(
+                self,
+                "split_waves_function",
+                handler="index.waves_handler",
+                code=_lambda.Code.from_asset("src/treetop/functions/adaptive_concurrency"),
+                environment=adaptive_environment,
+                layers=[shared_layer],
+                **function_profile(self, "split_waves", memory_size=1024, timeout=Duration.minutes(5)),
+            )
+            tune_concurrency_function = _lambda.Function(
+                self,
+                "tune_concurrency_function",
+                handler="index.handler",
+                code=_lambda.Code.from_asset("src/treetop/functions/adaptive_concurrency"),
+                environment=adaptive_environment,
+                layers=[shared_layer],
+                **function_profile(self, "tune_concurrency", memory_size=512, timeout=Duration.minutes(5)),
+            )
+            data_bucket.grant_read_write(split_waves_function)
+            data_bucket.grant_read(tune_concurrency_function)
+
         # Grant the Lambda function read/write access to S3
         data_bucket.grant_read(fetch_iiif_manifest_function)
         data_bucket.grant_put(fetch_iiif_manifest_function)
+        # Canvas documents a manifest no longer has are removed when it is fetched again
+        data_bucket.grant_delete(fetch_iiif_manifest_function, "data/iiif/*")
+        if rate_limit_table:
+            rate_limit_table.grant_read_write_data(fetch_iiif_manifest_function)
 
         # Grant EAD Lambda read/write access to S3
         data_bucket.grant_read(process_ead_function)
@@ -147,7 +618,9 @@ class StepFunctionsConstruct(Construct):
         )
 
         # Permission for Bedrock data sync
-        step_functions_role.add_to_policy(iam.PolicyStatement(actions=["bedrock:StartIngestionJob"], resources=["*"]))
+        step_functions_role.add_to_policy(
+            iam.PolicyStatement(actions=["bedrock:StartIngestionJob", "bedrock:GetIngestionJob"], resources=["*"])
+        )
 
         # Permission to write results to S3
         step_functions_role.add_to_policy(
@@ -155,6 +628,9 @@ class StepFunctionsConstruct(Construct):
                 actions=["s3:PutObject"], resources=[data_bucket.arn_for_objects("step-function-results/*")]
             )
         )
+        step_functions_role.add_to_policy(
+            iam.PolicyStatement(actions=["s3:PutObject"], resources=[data_bucket.arn_for_objects("state/*")])
+        )
 
         # Lambda permission to allow invocation from Step Functions
         fetch_iiif_manifest_function.add_permission(
@@ -171,20 +647,39 @@ class StepFunctionsConstruct(Construct):
         manifest_fetch_concurrency = self.node.try_get_context("manifest_fetch_concurrency") or 2
         ead_process_concurrency = self.node.try_get_context("ead_process_concurrency") or 10
 
+        def concurrency_fields(static_concurrency):
+            """A map's concurrency: fixed, or the controller's value for the current wave in adaptive mode."""
+            if adaptive_concurrency:
+                return {"MaxConcurrencyPath": "$.waves.concurrency"}
+            return {"MaxConcurrency": static_concurrency}
+
+        # In adaptive mode the maps read the current wave's list instead of the whole source
+        wave_parameters = {"Bucket.$": "$.waves.Bucket", "Key.$": "$.waves.Key"}
+        ead_item_reader = (
+            {
+                "Resource": "arn:aws:states:::s3:getObject",
+                "ReaderConfig": {"InputType": "JSONL"},
+                "Parameters": wave_parameters,
+            }
+            if adaptive_concurrency
+            else {
+                "Resource": "arn:aws:states:::s3:listObjectsV2",
+                "Parameters": {"Bucket.$": "$.s3.Bucket", "Prefix.$": "$.s3.Prefix"},
+            }
+        )
+
         # Define EAD processing workflow using Distributed Map
         ead_distributed_map_state = sfn.CustomState(
             self,
             "EadDistributedMapWithItemReader",
             state_json={
                 "Type": "Map",
-                "ItemReader": {
-                    "Resource": "arn:aws:states:::s3:listObjectsV2",
-                    "Parameters": {"Bucket.$": "$.s3.Bucket", "Prefix.$": "$.s3.Prefix"},
-                },
-                "Parameters": {"sourceBucket.$": "$.s3.Bucket", "item.$": "$$.Map.Item.Value"},
-                "MaxConcurrency": ead_process_concurrency,
+                "ItemReader": ead_item_reader,
+                "Parameters": {"sourceBucket.$": "$.s3.Bucket", "mode.$": "$.mode", "item.$": "$$.Map.Item.Value"},
+                **concurrency_fields(ead_process_concurrency),
+                "ToleratedFailurePercentage": retry_config["tolerated_failure_percentage"],
                 "ItemProcessor": {
-                    "ProcessorConfig": {"Mode": "DISTRIBUTED", "ExecutionType": "STANDARD"},
+                    "ProcessorConfig": {"Mode": "DISTRIBUTED", "ExecutionType": map_execution_type},
                     "StartAt": "ProcessEadFile",
                     "States": {
                         "ProcessEadFile": {
@@ -192,9 +687,15 @@ class StepFunctionsConstruct(Construct):
                             "Resource": "arn:aws:states:::lambda:invoke",
                             "Parameters": {
                                 "FunctionName": process_ead_function.function_arn,
-                                "Payload": {"bucket.$": "$.sourceBucket", "key.$": "$.item.Key"},
+                                "Payload": {
+                                    "bucket.$": "$.sourceBucket",
+                                    "key.$": "$.item.Key",
+                                    "etag.$": "$.item.ETag",
+                                    "mode.$": "$.mode",
+                                },
                             },
-                            "TimeoutSeconds": 43200,  # 12 hours
+                            "TimeoutSeconds": item_timeout_seconds(ead_function_timeout),
+                            "Retry": item_retry(),
                             "End": True,
                         }
                     },
@@ -206,6 +707,7 @@ class StepFunctionsConstruct(Construct):
                         "Prefix": "step-function-results/ead-processing/",
                     },
                 },
+                "ResultPath": "$.processing",
             },
         )
 
@@ -217,12 +719,23 @@ class StepFunctionsConstruct(Construct):
                 "Type": "Map",
                 "ItemReader": {
                     "Resource": "arn:aws:states:::s3:getObject",
-                    "ReaderConfig": {"InputType": "CSV", "CSVHeaderLocation": "GIVEN", "CSVHeaders": ["uri"]},
-                    "Parameters": {"Bucket.$": "$.s3.Bucket", "Key.$": "$.s3.Key"},
+                    "ReaderConfig": (
+                        {"InputType": "JSONL"}
+                        if manifest_list_format == "jsonl"
+                        else {"InputType": "CSV", "CSVHeaderLocation": "GIVEN", "CSVHeaders": ["uri"]}
+                    ),
+                    # The delta list written by the planning step, or the current wave of it
+                    "Parameters": (
+                        wave_parameters
+                        if adaptive_concurrency
+                        else {"Bucket.$": "$.plan.Bucket", "Key.$": "$.plan.Key"}
+                    ),
                 },
-                "MaxConcurrency": manifest_fetch_concurrency,
+                "ItemBatcher": {"MaxItemsPerBatch": manifest_batch_size},
+                **concurrency_fields(manifest_fetch_concurrency),
+                "ToleratedFailurePercentage": retry_config["tolerated_failure_percentage"],
                 "ItemProcessor": {
-                    "ProcessorConfig": {"Mode": "DISTRIBUTED", "ExecutionType": "STANDARD"},
+                    "ProcessorConfig": {"Mode": "DISTRIBUTED", "ExecutionType": map_execution_type},
                     "StartAt": "InvokeFetchManifest",
                     "States": {
                         "InvokeFetchManifest": {
@@ -231,10 +744,11 @@ class StepFunctionsConstruct(Construct):
                             "Parameters": {
                                 "FunctionName": fetch_iiif_manifest_function.function_arn,
                                 "Payload": {
-                                    "row.$": "$",
+                                    "rows.$": "$.Items",
                                 },
                             },
-                            "TimeoutSeconds": 43200,  # 12 hours
+                            "TimeoutSeconds": item_timeout_seconds(fetch_function_timeout),
+                            "Retry": item_retry(),
                             "End": True,
                         }
                     },
@@ -246,44 +760,342 @@ class StepFunctionsConstruct(Construct):
                         "Prefix": "step-function-results/iiif-processing",
                     },
                 },
+                # Keep the plan in the state for committing its fingerprints afterwards
+                "ResultPath": "$.processing",
             },
         )
 
-        # Add bedrock knowledge base ingestion task - shared between both workflows
+        # Remove documents (and so their vectors on the next sync) whose manifest or EAD file is gone.
+        # Runs before each map, while the execution input still holds the source location.
+        def reconcile_step(step_id, **extra):
+            return sfn_tasks.LambdaInvoke(
+                self,
+                step_id,
+                lambda_function=reconcile_function,
+                payload=sfn.TaskInput.from_object(
+                    {"workflowType.$": "$.workflowType", "s3.$": "$.s3", "force.$": "$.force", **extra}
+                ),
+                payload_response_only=True,
+                result_path="$.reconciliation",
+            )
+
+        # IIIF reconciliation deletes the documents of the manifests the plan lists as removed
+        reconcile_iiif = reconcile_step("ReconcileIiifDocuments", **{"plan.$": "$.plan"})
+        reconcile_ead = reconcile_step("ReconcileEadDocuments")
+
+        # Only new, changed, missing or due manifests go to the map; "full": true in the input fetches everything
+        plan_iiif = sfn_tasks.LambdaInvoke(
+            self,
+            "PlanIiifManifests",
+            lambda_function=plan_manifests_function,
+            payload=sfn.TaskInput.from_json_path_at("$"),
+            payload_response_only=True,
+            result_path="$.plan",
+        )
+        # Failed batches (below the tolerated percentage) are listed and made due for the next run
+        record_failed_manifests = sfn_tasks.LambdaInvoke(
+            self,
+            "RecordFailedManifests",
+            lambda_function=record_failures_function,
+            payload=sfn.TaskInput.from_object(
+                {
+                    "s3.$": "$.s3",
+                    "plan.$": "$.plan",
+                    "resultWriter.$": "$.processing.ResultWriterDetails",
+                    **({"wave.$": "$.waves.index"} if adaptive_concurrency else {}),
+                }
+            ),
+            payload_response_only=True,
+            result_path="$.failures",
+        )
+
+        def in_waves(name, workflow, source_path, initial_concurrency, *wave_states):
+            """Run a map (and the states after it) once per wave, tuning its concurrency in between."""
+            split = sfn_tasks.LambdaInvoke(
+                self,
+                f"Split{name}Waves",
+                lambda_function=split_waves_function,
+                payload=sfn.TaskInput.from_object(
+                    {"workflow": workflow, "source.$": source_path, "concurrency": initial_concurrency}
+                ),
+                payload_response_only=True,
+                result_path="$.waves",
+            )
+            tune = sfn_tasks.LambdaInvoke(
+                self,
+                f"Tune{name}Concurrency",
+                lambda_function=tune_concurrency_function,
+                payload=sfn.TaskInput.from_object(
+                    {"waves.$": "$.waves", "resultWriter.$": "$.processing.ResultWriterDetails"}
+                ),
+                payload_response_only=True,
+                result_path="$.waves",
+            )
+            more_waves = sfn.Choice(self, f"More{name}Waves")
+            waves_done = sfn.Pass(self, f"{name}WavesDone")
+            wave = sfn.Chain.start(wave_states[0])
+            for state in wave_states[1:] + (tune,):
+                wave = wave.next(state)
+            tune.next(more_waves)
+            more_waves.when(sfn.Condition.boolean_equals("$.waves.done", False), wave)
+            more_waves.otherwise(waves_done)
+            split.next(more_waves)
+            return sfn.Chain.custom(split, [waves_done], waves_done)
+
+        if adaptive_concurrency:
+            iiif_processing = in_waves(
+                "Iiif", "iiif", "$.plan", manifest_fetch_concurrency, distributed_map_state, record_failed_manifests
+            )
+            ead_processing = in_waves("Ead", "ead", "$.s3", ead_process_concurrency, ead_distributed_map_state)
+        else:
+            iiif_processing = distributed_map_state.next(record_failed_manifests)
+            ead_processing = ead_distributed_map_state
+
+        has_manifest_changes = sfn.Choice(self, "HasManifestChanges")
+        has_manifest_changes.when(sfn.Condition.number_greater_than("$.plan.count", 0), iiif_processing)
+        has_manifest_changes.otherwise(sfn.Pass(self, "NoManifestChanges"))
+
+        # The next run is planned against this one's fingerprints once its manifests have been processed
+        commit_manifest_state = sfn.CustomState(
+            self,
+            "CommitManifestState",
+            state_json={
+                "Type": "Task",
+                "Resource": "arn:aws:states:::aws-sdk:s3:copyObject",
+                "Parameters": {
+                    "Bucket.$": "$.plan.Bucket",
+                    "CopySource.$": "States.Format('{}/{}', $.plan.Bucket, $.plan.PendingStateKey)",
+                    "Key.$": "$.plan.StateKey",
+                },
+                "ResultPath": None,
+            },
+        )
+
+        # Add bedrock knowledge base ingestion task - shared between both workflows. Each source type has
+        # its own data source, and ingestion runs on those whose documents changed.
         start_ingestion = sfn.CustomState(
             self,
             "StartBedrockIngestion",
             state_json={
                 "Type": "Task",
                 "Parameters": {
-                    "DataSourceId": data_source_id,
+                    "DataSourceId.$": "$.dataSource.dataSourceId",
                     "KnowledgeBaseId": knowledge_base_id,
                 },
                 "Resource": "arn:aws:states:::aws-sdk:bedrockagent:startIngestionJob",
+                "ResultPath": "$.ingestion",
+                # Only one job runs per data source at a time, e.g. one started by an EAD change
+                "Retry": [
+                    {
+                        "ErrorEquals": ["BedrockAgent.ConflictException"],
+                        "IntervalSeconds": 60,
+                        "MaxAttempts": 20,
+                        "BackoffRate": 1.5,
+                        "MaxDelaySeconds": 600,
+                        "JitterStrategy": "FULL",
+                    }
+                ],
             },
         )
 
+        # Where the source pipelines leave their results: the state itself, or the parallel pipelines' combined
+        # results, which list the reconciliation report of each source
+        pipeline_results = "$.pipelines" if parallel_sources else "$"
+
+        # Poll the ingestion job with a doubling interval until it finishes (see [ingestion] in config.toml)
+        ingestion_config = {"poll_seconds": 15, "max_poll_seconds": 300}
+        ingestion_config.update(self.node.try_get_context("ingestion") or {})
+        start_polling = sfn.Pass(
+            self,
+            "StartIngestionPolling",
+            result=sfn.Result.from_object({"seconds": ingestion_config["poll_seconds"]}),
+            result_path="$.poll",
+        )
+        wait_for_ingestion = sfn.Wait(self, "WaitForIngestion", time=sfn.WaitTime.seconds_path("$.poll.seconds"))
+        get_ingestion_job = sfn.CustomState(
+            self,
+            "GetIngestionJob",
+            state_json={
+                "Type": "Task",
+                "Resource": "arn:aws:states:::aws-sdk:bedrockagent:getIngestionJob",
+                "Parameters": {
+                    "DataSourceId.$": "$.dataSource.dataSourceId",
+                    "KnowledgeBaseId": knowledge_base_id,
+                    "IngestionJobId.$": "$.ingestion.IngestionJob.IngestionJobId",
+                },
+                "ResultPath": "$.ingestion",
+                "Retry": [
+                    {
+                        "ErrorEquals": ["BedrockAgent.ThrottlingException", "BedrockAgent.InternalServerException"],
+                        "IntervalSeconds": 5,
+                        "MaxAttempts": 5,
+                        "BackoffRate": 2,
+                        "JitterStrategy": "FULL",
+                    }
+                ],
+            },
+        )
+        double_poll_interval = sfn.Pass(
+            self,
+            "DoublePollInterval",
+            parameters={"seconds.$": "States.MathAdd($.poll.seconds, $.poll.seconds)"},
+            result_path="$.poll",
+        )
+        back_off = sfn.Choice(self, "BackOffIngestionPolling")
+        back_off.when(
+            sfn.Condition.number_less_than_equals("$.poll.seconds", ingestion_config["max_poll_seconds"] // 2),
+            double_poll_interval.next(wait_for_ingestion),
+        )
+        back_off.otherwise(wait_for_ingestion)
+
+        ingestion_status = "$.ingestion.IngestionJob.Status"
+        ingestion_finished = sfn.Choice(self, "IngestionFinished")
+        ingestion_finished.when(
+            sfn.Condition.or_(
+                sfn.Condition.string_equals(ingestion_status, "COMPLETE"),
+                sfn.Condition.string_equals(ingestion_status, "FAILED"),
+                sfn.Condition.string_equals(ingestion_status, "STOPPED"),
+            ),
+            sfn.Pass(
+                self,
+                "IngestionJobFinished",
+                parameters={"type.$": "$.dataSource.type", "IngestionJob.$": "$.ingestion.IngestionJob"},
+            ),
+        )
+        ingestion_finished.otherwise(back_off)
+        start_ingestion.next(start_polling).next(wait_for_ingestion).next(get_ingestion_job).next(ingestion_finished)
+
+        # The changed data sources are ingested at the same time
+        ingest_data_sources = sfn.Map(
+            self,
+            "IngestDataSources",
+            items_path="$.changes.dataSources",
+            item_selector={"dataSource.$": "$$.Map.Item.Value"},
+            result_path="$.ingestion",
+        )
+        ingest_data_sources.item_processor(start_ingestion)
+
+        write_run_report = sfn_tasks.LambdaInvoke(
+            self,
+            "WriteRunReport",
+            lambda_function=run_report_function,
+            payload=sfn.TaskInput.from_object(
+                {
+                    "executionArn.$": "$$.Execution.Id",
+                    "startTime.$": "$$.Execution.StartTime",
+                    "workflowType.$": "$.workflowType",
+                    "ingestion.$": "$.ingestion",
+                }
+            ),
+            payload_response_only=True,
+            result_path="$.report",
+        )
+
+        # The run fails when ingestion does, after its report is written
+        ingestion_succeeded = sfn.Choice(self, "IngestionSucceeded")
+        ingestion_complete = sfn.Pass(self, "IngestionComplete")
+        ingestion_succeeded.when(sfn.Condition.string_equals("$.report.status", "COMPLETE"), ingestion_complete)
+        ingestion_succeeded.otherwise(
+            sfn.Fail(self, "IngestionFailed", error="IngestionFailed", cause="The knowledge base ingestion job failed")
+        )
+        ingest_data_sources.next(write_run_report).next(ingestion_succeeded)
+
+        # Ingestion covers the data sources of the sources this run processed; incremental runs only
+        # those whose documents were written or deleted
+        detect_changes = sfn_tasks.LambdaInvoke(
+            self,
+            "DetectDocumentChanges",
+            lambda_function=detect_changes_function,
+            payload=sfn.TaskInput.from_object(
+                {
+                    "startTime.$": "$$.Execution.StartTime",
+                    "mode.$": "$.mode",
+                    "workflowType.$": "$.workflowType",
+                    "reconciliation.$": f"{pipeline_results}.reconciliation",
+                    "dataSources": [
+                        {"type": source_type, "prefix": prefix, "dataSourceId": data_source.attr_data_source_id}
+                        for source_type, type_data_sources in data_sources.items()
+                        for prefix, data_source in zip(
+                            shard_prefixes(source_type, shards), type_data_sources, strict=True
+                        )
+                    ],
+                }
+            ),
+            payload_response_only=True,
+            result_path="$.changes",
+        )
+        nothing_to_ingest = sfn.Pass(self, "NothingToIngest")
+        has_document_changes = sfn.Choice(self, "HasDocumentChanges")
+        has_document_changes.when(sfn.Condition.is_present("$.changes.dataSources[0]"), ingest_data_sources)
+        has_document_changes.otherwise(nothing_to_ingest)
+        detect_changes.next(has_document_changes)
+        ingestion = sfn.Chain.custom(detect_changes, [ingestion_complete, nothing_to_ingest], ingestion_complete)
+
         # Define the success and failure states
         success = sfn.Succeed(self, "TaskCompleted")
         failure = sfn.Fail(self, "TaskFailed", error="TaskFailedError", cause="Task execution failed")
 
-        # Add a Choice state to determine the workflow
-        choice_state = sfn.Choice(self, "DataTypeChoice")
+        # Each source's pipeline, up to ingestion. The IIIF one needs a crawler.
+        pipelines = {}
+        if crawl:
+            pipelines["iiif"] = (
+                crawl.next(plan_iiif)
+                .next(reconcile_iiif)
+                .next(has_manifest_changes.afterwards().next(commit_manifest_state))
+            )
+        pipelines["ead"] = reconcile_ead.next(ead_processing)
 
-        # Only add IIIF workflow if ECS construct is available
-        if run_task:
-            choice_state.when(
-                sfn.Condition.string_equals("$.workflowType", "iiif"),
-                run_task.next(distributed_map_state).next(start_ingestion),
+        if parallel_sources:
+            # Every source's pipeline runs at once, then one ingestion job covers them all
+            run_sources = sfn.Parallel(
+                self,
+                "RunSourcePipelines",
+                result_selector={"workflowType": "all", "reconciliation.$": "$[*].reconciliation"},
+                result_path="$.pipelines",
             )
+            for source_type in sources_by_type:
+                name = source_type.capitalize()
+                # The branch sees the execution input with its own source's fields on top
+                select_source = sfn.Pass(
+                    self,
+                    f"Select{name}Source",
+                    parameters={"source.$": f"States.JsonMerge($, $.sources.{source_type}, false)"},
+                    output_path="$.source",
+                )
+                run_sources.branch(
+                    sfn.Choice(self, f"Has{name}Source")
+                    .when(
+                        sfn.Condition.is_present(f"$.sources.{source_type}"),
+                        select_source.next(pipelines[source_type]),
+                    )
+                    .otherwise(sfn.Pass(self, f"Skip{name}Source"))
+                )
+            source_pipelines = run_sources.next(ingestion)
+        else:
+            # Add a Choice state to determine the workflow
+            choice_state = sfn.Choice(self, "DataTypeChoice")
+            for source_type, pipeline in pipelines.items():
+                choice_state.when(sfn.Condition.string_equals("$.workflowType", source_type), pipeline.next(ingestion))
+            choice_state.otherwise(failure)
+            source_pipelines = choice_state.afterwards()
+
+        # Executions started without a mode (e.g. from the console) are full runs
+        has_mode = sfn.Choice(self, "HasRunMode")
+        has_mode.when(
+            sfn.Condition.not_(sfn.Condition.is_present("$.mode")),
+            sfn.Pass(self, "DefaultRunMode", result=sfn.Result.from_string("full"), result_path="$.mode"),
+        )
+        has_mode.otherwise(sfn.Pass(self, "RunModeGiven"))
 
-        choice_state.when(
-            sfn.Condition.string_equals("$.workflowType", "ead"),
-            ead_distributed_map_state.next(start_ingestion),
+        # "force": true lets reconciliation delete more than max_delete_fraction of the documents
+        has_force = sfn.Choice(self, "HasForce")
+        has_force.when(
+            sfn.Condition.not_(sfn.Condition.is_present("$.force")),
+            sfn.Pass(self, "DefaultForce", result=sfn.Result.from_boolean(False), result_path="$.force"),
         )
-        choice_state.otherwise(failure)
+        has_force.otherwise(sfn.Pass(self, "ForceGiven"))
 
-        definition = choice_state.afterwards().next(success)
+        definition = has_mode.afterwards().next(has_force.afterwards()).next(source_pipelines).next(success)
 
         self.state_machine = sfn.StateMachine(
             self, "TreetopStackSpinup", definition=definition, timeout=Duration.hours(12), role=step_functions_role
@@ -299,22 +1111,20 @@ class StepFunctionsConstruct(Construct):
             )
         )
 
-        # Get workflow type and source info from data_config
-        workflow_type = data_config.get("type")
-
         # Configure environment variables for the trigger based on data_config
         env_vars = {
             "STATE_MACHINE_ARN": self.state_machine.state_machine_arn,
             "BUCKET": data_bucket.bucket_name,
-            "WORKFLOW_TYPE": workflow_type,
+            # Comma separated when the stack has several sources
+            "WORKFLOW_TYPE": ",".join(sources_by_type),
         }
 
         # Add type-specific environment variables
-        if workflow_type == "iiif":
-            env_vars["SOURCE_COLLECTION"] = data_config.get("collection_url", "")
-            env_vars["COLLECTION_FILENAME"] = "manifests.csv"
-        elif workflow_type == "ead":
-            s3_config = data_config.get("s3", {})
+        if "iiif" in sources_by_type:
+            env_vars["SOURCE_COLLECTION"] = sources_by_type["iiif"].get("collection_url", "")
+            env_vars["COLLECTION_FILENAME"] = manifest_list_key
+        if "ead" in sources_by_type:
+            s3_config = sources_by_type["ead"].get("s3", {})
             env_vars["SOURCE_PREFIX"] = s3_config.get("prefix", "")
             env_vars["SOURCE_BUCKET"] = s3_config.get("bucket", "")
             # For EAD workflow, source bucket is external, we need to grant permissions
@@ -337,23 +1147,53 @@ class StepFunctionsConstruct(Construct):
                         ],
                     )
                 )
+                # Reconciliation lists the source prefix to find EAD files that were removed
+                reconcile_function.role.add_to_policy(
+                    iam.PolicyStatement(
+                        actions=["s3:ListBucket"],
+                        resources=[f"arn:aws:s3:::{s3_config['bucket']}"],
+                    )
+                )
+                # As does splitting the files into waves in adaptive concurrency mode
+                if adaptive_concurrency:
+                    split_waves_function.role.add_to_policy(
+                        iam.PolicyStatement(
+                            actions=["s3:ListBucket"],
+                            resources=[f"arn:aws:s3:::{s3_config['bucket']}"],
+                        )
+                    )
+
+                # Process EAD files as they change and sync once changes settle (see [ead_events] in config.toml)
+                ead_events_config = {"enabled": False, "quiet_seconds": 300, "concurrency": 5}
+                ead_events_config.update(self.node.try_get_context("ead_events") or {})
+                if ead_events_config["enabled"]:
+                    self.add_ead_events(
+                        s3_config,
+                        ead_events_config,
+                        data_bucket=data_bucket,
+                        process_ead_function=process_ead_function,
+                        shared_layer=shared_layer,
+                        knowledge_base_id=knowledge_base_id,
+                        data_source_id=",".join(data_source.attr_data_source_id for data_source in data_sources["ead"]),
+                        shards=shards,
+                        process_timeout=ead_function_timeout,
+                    )
 
         # Add a Lambda trigger for Step Functions execution
         self.step_function_trigger = triggers.TriggerFunction(
             self,
             "TriggerStepFunction",
-            runtime=_lambda.Runtime.PYTHON_3_10,
             handler="index.handler",
             environment=env_vars,
             code=_lambda.Code.from_asset("src/treetop/functions/step_function_trigger"),
-            timeout=Duration.minutes(3),
             initial_policy=[
                 iam.PolicyStatement(
-                    actions=["states:StartExecution"],
+                    actions=["states:StartExecution", "states:ListExecutions"],
                     resources=[self.state_machine.state_machine_arn],
                 )
             ],
             execute_on_handler_change=False,
+            **function_profile(self, "trigger", timeout=Duration.minutes(3)),
         )
 
         # Ensure the trigger function executes only after these resources are provisioned
@@ -361,5 +1201,123 @@ class StepFunctionsConstruct(Construct):
         self.step_function_trigger.execute_after(data_bucket)
         self.step_function_trigger.execute_after(fetch_iiif_manifest_function)
         self.step_function_trigger.execute_after(knowledge_base)
-        self.step_function_trigger.execute_after(data_source)
+        for type_data_sources in data_sources.values():
+            self.step_function_trigger.execute_after(*type_data_sources)
         self.step_function_trigger.execute_after(process_ead_function)
+        self.step_function_trigger.execute_after(reconcile_function)
+        self.step_function_trigger.execute_after(plan_manifests_function)
+
+        # Scheduled incremental runs between deploys (see [schedule] in config.toml)
+        schedule_config = self.node.try_get_context("schedule") or {}
+        if schedule_config.get("expression"):
+            events.Rule(
+                self,
+                "IncrementalSyncSchedule",
+                schedule=events.Schedule.expression(schedule_config["expression"]),
+                targets=[
+                    events_targets.LambdaFunction(
+                        self.step_function_trigger,
+                        event=events.RuleTargetInput.from_object({"mode": "incremental"}),
+                    )
+                ],
+            )
+
+    def add_ead_events(
+        self,
+        s3_config,
+        ead_events_config,
+        *,
+        data_bucket,
+        process_ead_function,
+        shared_layer,
+        knowledge_base_id,
+        data_source_id,
+        process_timeout,
+        shards,
+    ):
+        """Queue S3 events for the EAD source prefix, process each changed file and debounce the sync.
+
+        The source bucket must send its events to EventBridge, which its owner enables once.
+        """
+        if not 0 <= ead_events_config["quiet_seconds"] <= 900:
+            raise ValueError("ead_events quiet_seconds must be between 0 and 900 (the SQS delay limit)")
+
+        events_profile = function_profile(
+            self, "ead_events", memory_size=256, timeout=process_timeout.plus(Duration.minutes(1))
+        )
+        function_timeout = events_profile["timeout"]
+        changes_dead_letter_queue = sqs.Queue(self, "EadChangesDeadLetterQueue", retention_period=Duration.days(14))
+        changes_queue = sqs.Queue(
+            self,
+            "EadChangesQueue",
+            # Six times the function timeout, as recommended for Lambda event sources
+            visibility_timeout=Duration.seconds(6 * function_timeout.to_seconds()),
+            dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=5, queue=changes_dead_letter_queue),
+        )
+        sync_queue = sqs.Queue(self, "EadSyncQueue", visibility_timeout=Duration.minutes(6))
+
+        events.Rule(
+            self,
+            "EadSourceChangesRule",
+            event_pattern=events.EventPattern(
+                source=["aws.s3"],
+                detail_type=["Object Created", "Object Deleted"],
+                detail={
+                    "bucket": {"name": [s3_config["bucket"]]},
+                    "object": {"key": [{"prefix": s3_config.get("prefix", "")}]},
+                },
+            ),
+            targets=[events_targets.SqsQueue(changes_queue)],
+        )
+
+        environment = {
+            "DEST_BUCKET": data_bucket.bucket_name,
+            "DEST_PREFIX": "data/ead/",
+            "STATE_PREFIX": "state/ead-events/",
+            "PROCESS_FUNCTION": process_ead_function.function_name,
+            "SYNC_QUEUE_URL": sync_queue.queue_url,
+            "QUIET_SECONDS": str(ead_events_config["quiet_seconds"]),
+            "KNOWLEDGE_BASE_ID": knowledge_base_id,
+            "DATA_SOURCE_ID": data_source_id,
+            "SHARDS": str(shards),
+        }
+        ead_events_function = _lambda.Function(
+            self,
+            "ead_events_function",
+            handler="index.handler",
+            code=_lambda.Code.from_asset("src/treetop/functions/ead_events"),
+            environment=environment,
+            layers=[shared_layer],
+            **events_profile,
+        )
+        ead_events_function.add_event_source(
+            lambda_event_sources.SqsEventSource(
+                changes_queue,
+                batch_size=1,
+                max_concurrency=ead_events_config["concurrency"],
+                report_batch_item_failures=True,
+            )
+        )
+        process_ead_function.grant_invoke(ead_events_function)
+        data_bucket.grant_delete(ead_events_function, "data/ead/*")
+        data_bucket.grant_put(ead_events_function, "state/ead-events/*")
+        sync_queue.grant_send_messages(ead_events_function)
+
+        ead_sync_function = _lambda.Function(
+            self,
+            "ead_sync_function",
+            handler="index.sync_handler",
+            code=_lambda.Code.from_asset("src/treetop/functions/ead_events"),
+            environment=environment,
+            layers=[shared_layer],
+            **function_profile(self, "ead_sync", memory_size=128, timeout=Duration.minutes(1)),
+        )
+        # Checks that arrive together are one check
+        ead_sync_function.add_event_source(
+            lambda_event_sources.SqsEventSource(sync_queue, batch_size=10, max_batching_window=Duration.seconds(5))
+        )
+        data_bucket.grant_read_write(ead_sync_function, "state/ead-events/*")
+        sync_queue.grant_send_messages(ead_sync_function)
+        ead_sync_function.add_to_role_policy(
+            iam.PolicyStatement(actions=["bedrock:StartIngestionJob"], resources=["*"])
+        )
@@ -0,0 +1,182 @@
+"""Adapt a Distributed Map's MaxConcurrency between waves of items.
+
+In adaptive mode the map's items are split into waves. ``waves_handler`` writes
+each wave to its own list, and the map processes one wave at a time, reading its
+MaxConcurrency from the controller state. After each wave ``handler`` reads the
+map's results and picks the concurrency for the next one:
+
+* throttling or errors above their limits halve it
+* per-item latency more than ``LATENCY_FACTOR`` times the first healthy wave's
+  trims it by a quarter, as the source is slowing down under the load
+* otherwise it grows by half, up to ``MAX_CONCURRENCY``
+
+The concurrency of the healthy wave with the best throughput is reported as the
+one to pin in ``config.toml``.
+"""
+
+import json
+import math
+import os
+import statistics
+from datetime import datetime
+
+import boto3
+from shared import manifest_list, telemetry
+
+DEST_BUCKET = os.environ["DEST_BUCKET"]
+WAVES_PREFIX = os.environ.get("WAVES_PREFIX", "waves/")
+WAVE_SIZE = int(os.environ.get("WAVE_SIZE", "2000"))
+MIN_CONCURRENCY = int(os.environ.get("MIN_CONCURRENCY", "2"))
+MAX_CONCURRENCY = int(os.environ.get("MAX_CONCURRENCY", "40"))
+# Share of a wave's items that may be throttled or fail before concurrency is halved
+MAX_THROTTLE_RATE = float(os.environ.get("MAX_THROTTLE_RATE", "0.02"))
+# Set by the stack below the map's tolerated failure percentage, so errors slow the map before they fail it
+MAX_ERROR_RATE = float(os.environ.get("MAX_ERROR_RATE", "0.025"))
+LATENCY_FACTOR = float(os.environ.get("LATENCY_FACTOR", "1.5"))
+
+# Item processor errors that mean Lambda or the source is refusing the load
+THROTTLE_ERRORS = {"Lambda.TooManyRequestsException", "States.Timeout", "RetryableError"}
+# Waves kept in the controller state, which travels in the execution's 256 KB payload
+HISTORY_LIMIT = 20
+
+s3 = boto3.client("s3")
+
+
+def wave_key(waves, index):
+    return f"{waves['Prefix']}wave-{index + 1:05d}.{waves['Extension']}"
+
+
+def write_wave(waves, index, lines):
+    body = "".join(f"{line}\n" for line in lines).encode("utf-8")
+    s3.put_object(Bucket=DEST_BUCKET, Key=wave_key(waves, index), Body=body)
+
+
+def source_lines(source):
+    """Return ``(extension, lines)`` for a manifest list or, for EAD, a listing of the source prefix."""
+    if "Key" in source:
+        body = s3.get_object(Bucket=source["Bucket"], Key=source["Key"])["Body"].read().decode("utf-8")
+        extension = "jsonl" if manifest_list.is_jsonl(source["Key"]) else "csv"
+        return extension, [line for line in body.splitlines() if line.strip()]
+
+    lines = []
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=source["Bucket"], Prefix=source.get("Prefix", "")):
+        for item in page.get("Contents", []):
+            lines.append(json.dumps({"Key": item["Key"], "ETag": item["ETag"]}))
+    return "jsonl", lines
+
+
+def waves_handler(event, _context):
+    """Split the map's items into waves and return the initial controller state."""
+    workflow = event["workflow"]
+    extension, lines = source_lines(event["source"])
+    count = math.ceil(len(lines) / WAVE_SIZE)
+    concurrency = min(max(int(event["concurrency"]), MIN_CONCURRENCY), MAX_CONCURRENCY)
+    waves = {
+        "workflow": workflow,
+        "Bucket": DEST_BUCKET,
+        "Prefix": f"{WAVES_PREFIX}{workflow}/",
+        "Extension": extension,
+        "count": count,
+        "index": 0,
+        "done": count == 0,
+        "concurrency": concurrency,
+        "settled": concurrency,
+        "best": None,
+        "baseline_seconds": None,
+        "history": [],
+    }
+    waves["Key"] = wave_key(waves, 0)
+    for index in range(count):
+        write_wave(waves, index, lines[index * WAVE_SIZE : (index + 1) * WAVE_SIZE])
+    print(f"Split {len(lines)} {workflow} items into {count} waves of up to {WAVE_SIZE}")
+    return waves
+
+
+def read_json(bucket, key):
+    return json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+
+
+def parse_date(value):
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+
+
+def executions(result_writer):
+    """Yield the item processor executions recorded by a map's ResultWriter."""
+    manifest = read_json(result_writer["Bucket"], result_writer["Key"])
+    for result_files in manifest.get("ResultFiles", {}).values():
+        for result_file in result_files:
+            yield from read_json(manifest["DestinationBucket"], result_file["Key"])
+
+
+def throttled(execution):
+    if execution.get("Status") != "SUCCEEDED":
+        return execution.get("Error") in THROTTLE_ERRORS
+    output = json.loads(execution.get("Output") or "{}")
+    payload = output.get("Payload", output)
+    return isinstance(payload, dict) and bool(payload.get("throttles"))
+
+
+def wave_stats(records):
+    """Summarise a wave's executions: item count, throttle and error rates, latency and throughput."""
+    records = list(records)
+    if not records:
+        return {"items": 0, "throttle_rate": 0.0, "error_rate": 0.0, "p50_seconds": 0.0, "throughput": 0.0}
+    timed = [(parse_date(r["StartDate"]), parse_date(r["StopDate"])) for r in records if r.get("StopDate")]
+    durations = sorted(stop - start for start, stop in timed)
+    elapsed = max(stop for _, stop in timed) - min(start for start, _ in timed) if timed else 0
+    return {
+        "items": len(records),
+        "throttle_rate": sum(1 for r in records if throttled(r)) / len(records),
+        "error_rate": sum(1 for r in records if r.get("Status") != "SUCCEEDED") / len(records),
+        "p50_seconds": round(statistics.median(durations), 3) if durations else 0.0,
+        "throughput": round(len(records) / elapsed, 3) if elapsed > 0 else 0.0,
+    }
+
+
+def next_concurrency(concurrency, stats, baseline_seconds):
+    """Return ``(concurrency, healthy)`` for the wave after one run at ``concurrency``."""
+    if stats["throttle_rate"] > MAX_THROTTLE_RATE or stats["error_rate"] > MAX_ERROR_RATE:
+        return max(MIN_CONCURRENCY, concurrency // 2), False
+    if baseline_seconds and stats["p50_seconds"] > baseline_seconds * LATENCY_FACTOR:
+        return max(MIN_CONCURRENCY, math.floor(concurrency * 0.75)), True
+    return min(MAX_CONCURRENCY, math.ceil(concurrency * 1.5)), True
+
+
+def handler(event, _context):
+    """Measure the wave that just ran and set the concurrency for the next."""
+    waves = event["waves"]
+    stats = wave_stats(executions(event["resultWriter"]))
+    concurrency = waves["concurrency"]
+    next_value, healthy = next_concurrency(concurrency, stats, waves["baseline_seconds"])
+
+    if healthy and stats["items"]:
+        if waves["baseline_seconds"] is None:
+            waves["baseline_seconds"] = stats["p50_seconds"]
+        if waves["best"] is None or stats["throughput"] > waves["best"]["throughput"]:
+            waves["best"] = {"concurrency": concurrency, "throughput": stats["throughput"]}
+    waves["settled"] = waves["best"]["concurrency"] if waves["best"] else next_value
+
+    waves["history"] = (waves["history"] + [{"wave": waves["index"] + 1, "concurrency": concurrency, **stats}])[
+        -HISTORY_LIMIT:
+    ]
+    waves["index"] += 1
+    waves["done"] = waves["index"] >= waves["count"]
+    waves["concurrency"] = next_value
+    waves["Key"] = wave_key(waves, waves["index"])
+
+    telemetry.emit_metrics(
+        {
+            "MapConcurrency": concurrency,
+            "WaveThrottleRate": stats["throttle_rate"],
+            "WaveErrorRate": stats["error_rate"],
+            "WaveItemLatency": (stats["p50_seconds"], "Seconds"),
+            "WaveThroughput": (stats["throughput"], "Count/Second"),
+        },
+        dimensions={"Function": "AdaptiveConcurrency", "Workflow": waves["workflow"]},
+        properties={"Wave": waves["index"], "NextConcurrency": next_value, "SettledConcurrency": waves["settled"]},
+    )
+    print(f"Wave {waves['index']}/{waves['count']} at concurrency {concurrency}: {stats}; next {next_value}")
+    if waves["done"]:
+        print(f"Settled on a {waves['workflow']} map concurrency of {waves['settled']}; pin it in config.toml")
+    return waves
@@ -0,0 +1,226 @@
+"""Bulk EAD processing outside of Step Functions.
+
+Runs the same parse/cache/chunk steps as the Lambda handler in ``index.py`` over
+every XML file in a local directory or S3 prefix, using a process pool. Outputs
+and parsed-EAD cache sidecars are written with the same key layout as the Lambda
+(``data/ead/`` and ``cache/ead/``) to either a local directory or a bucket.
+Documents written to a bucket carry the Lambda's object metadata, so incremental
+runs skip the files the backfill already processed.
+
+Example (from the repository root)::
+
+    PYTHONPATH=src/treetop/functions python src/treetop/functions/ead/backfill.py ./ead-files ./out --workers 8
+    PYTHONPATH=src/treetop/functions python src/treetop/functions/ead/backfill.py s3://src/ead/ s3://dest --rechunk
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import boto3
+import index
+from shared import document_keys, ead_cache
+
+_s3 = None
+
+
+def s3_client():
+    # Clients are created per worker process; boto3 clients should not cross a fork
+    global _s3
+    if _s3 is None:
+        _s3 = boto3.client("s3")
+    return _s3
+
+
+def split_s3_url(url):
+    bucket, _, prefix = url[len("s3://") :].partition("/")
+    return bucket, prefix
+
+
+def list_sources(source):
+    """Return (location, size) pairs for every EAD XML file under a directory or S3 prefix."""
+    if source.startswith("s3://"):
+        bucket, prefix = split_s3_url(source)
+        paginator = s3_client().get_paginator("list_objects_v2")
+        return [
+            (f"s3://{bucket}/{item['Key']}", item["Size"])
+            for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+            for item in page.get("Contents", [])
+            if item["Key"].endswith(".xml")
+        ]
+
+    sources = []
+    for root, _dirs, files in os.walk(source):
+        for name in sorted(files):
+            if name.endswith(".xml"):
+                path = os.path.join(root, name)
+                sources.append((path, os.path.getsize(path)))
+    return sources
+
+
+def read_source(location):
+    """Return (bytes, etag) for a local file or S3 object."""
+    if location.startswith("s3://"):
+        bucket, key = split_s3_url(location)
+        response = s3_client().get_object(Bucket=bucket, Key=key)
+        return response["Body"].read(), response["ETag"]
+
+    with open(location, "rb") as f:
+        data = f.read()
+    # Matches the ETag S3 assigns to single-part uploads, so local and Lambda caches are interchangeable
+    return data, hashlib.md5(data).hexdigest()
+
+
+def source_etag(location):
+    if location.startswith("s3://"):
+        bucket, key = split_s3_url(location)
+        return s3_client().head_object(Bucket=bucket, Key=key)["ETag"]
+    with open(location, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def read_output(dest, key):
+    """Return the bytes stored at dest/key, or None if missing."""
+    if dest.startswith("s3://"):
+        bucket, prefix = split_s3_url(dest)
+        try:
+            return s3_client().get_object(Bucket=bucket, Key=f"{prefix}{key}")["Body"].read()
+        except s3_client().exceptions.NoSuchKey:
+            return None
+
+    path = os.path.join(dest, key)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def write_output(dest, key, body, content_type, **object_args):
+    """Write to dest/key; ``object_args`` (e.g. ``Metadata``) only apply to S3 outputs."""
+    if dest.startswith("s3://"):
+        bucket, prefix = split_s3_url(dest)
+        s3_client().put_object(Bucket=bucket, Key=f"{prefix}{key}", Body=body, ContentType=content_type, **object_args)
+        return
+
+    path = os.path.join(dest, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(body)
+
+
+def process_source(location, dest, dest_prefix, cache_prefix, rechunk, shards=1):
+    """Process one EAD file and return a summary dict (runs in a worker process)."""
+    start = time.perf_counter()
+    parsed = None
+    bytes_read = 0
+
+    if rechunk:
+        # Only the ETag is needed to find the cached parse; the XML itself is not read
+        etag = source_etag(location)
+        cache_key = ead_cache.cache_key(cache_prefix, etag)
+        cached = read_output(dest, cache_key)
+        if cached is not None:
+            parsed = ead_cache.loads(cached)
+
+    from_cache = parsed is not None
+    if parsed is None:
+        data, etag = read_source(location)
+        bytes_read = len(data)
+        cache_key = ead_cache.cache_key(cache_prefix, etag)
+        local_file_name = f"/tmp/{os.getpid()}-{hashlib.sha1(location.encode()).hexdigest()}.xml"
+        with open(local_file_name, "wb") as f:
+            f.write(data)
+        try:
+            parsed = index.parse_ead(local_file_name)
+        finally:
+            os.remove(local_file_name)
+        write_output(
+            dest,
+            cache_key,
+            ead_cache.dumps(parsed),
+            "application/jsonl",
+            ContentEncoding="gzip",
+            Metadata={"source": location},
+        )
+
+    chunks = index.chunk_records(parsed)
+    body = json.dumps(chunks, indent=2).encode("utf-8")
+    name = document_keys.ead_document_name(location)
+    write_output(
+        dest,
+        f"{dest_prefix}{document_keys.ead_shard(name, shards)}{name}",
+        body,
+        "application/json",
+        Metadata=index.document_metadata(etag),
+    )
+
+    return {
+        "source": location,
+        "chunks": len(chunks),
+        "bytes_read": bytes_read,
+        "bytes_written": len(body),
+        "cached": from_cache,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process a directory or S3 prefix of EAD XML files in bulk.")
+    parser.add_argument("source", help="Local directory or s3://bucket/prefix containing EAD XML files")
+    parser.add_argument("dest", help="Local directory or s3://bucket[/prefix] to write outputs to")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: CPU count)")
+    parser.add_argument("--dest-prefix", default="data/ead/", help="Key prefix for chunk documents")
+    parser.add_argument("--cache-prefix", default="cache/ead/", help="Key prefix for parsed-EAD sidecars")
+    parser.add_argument(
+        "--shards", type=int, default=1, help="Ingestion shards to spread documents over, as in [ingestion] shards"
+    )
+    parser.add_argument(
+        "--rechunk", action="store_true", help="Re-chunk from cached parses where available instead of the XML"
+    )
+    args = parser.parse_args(argv)
+
+    sources = list_sources(args.source)
+    if not sources:
+        print(f"No EAD XML files found under {args.source}")
+        return 1
+
+    total_bytes = sum(size for _location, size in sources)
+    print(f"Processing {len(sources)} files ({total_bytes / 1_000_000:.1f} MB) with {args.workers} workers")
+
+    failures = 0
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(
+                process_source, location, args.dest, args.dest_prefix, args.cache_prefix, args.rechunk, args.shards
+            ): location
+            for location, _size in sources
+        }
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                failures += 1
+                print(f"Error processing {futures[future]}: {e}", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+
+    processed_bytes = sum(r["bytes_read"] for r in results)
+    print(
+        f"Processed {len(results)} files ({sum(r['cached'] for r in results)} from cache, {failures} failed) "
+        f"into {sum(r['chunks'] for r in results)} chunks in {elapsed:.2f}s"
+    )
+    print(
+        f"Throughput: {len(results) / elapsed:.2f} files/sec, "
+        f"{processed_bytes / 1_000_000 / elapsed:.2f} MB/sec read, "
+        f"{sum(r['bytes_written'] for r in results) / 1_000_000 / elapsed:.2f} MB/sec written"
+    )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
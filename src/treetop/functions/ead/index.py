@@ -1,13 +1,84 @@
 import json
 import os
+import time
 import uuid
 
 import boto3
 from eadpy import Ead
+from shared import chunking, document_keys, ead_cache, errors, telemetry
 
 s3 = boto3.client("s3")
 
 
+def parse_ead(local_file_name):
+    """Parse an EAD XML file into eadpy's nested collection dictionary."""
+    return Ead(local_file_name).data
+
+
+class ParsedEad(Ead):
+    """An ``Ead`` built from an already parsed collection (e.g. from the cache) instead of an XML file.
+
+    eadpy's constructor sets up the object and then calls ``parse``, so overriding ``parse`` skips the
+    XML without depending on the attributes the constructor sets.
+    """
+
+    def __init__(self, parsed):
+        self._parsed = parsed
+        super().__init__(None)
+
+    def parse(self):
+        return self._parsed
+
+
+def create_chunks(parsed):
+    """Create item chunks from an already parsed collection."""
+    return ParsedEad(parsed).create_item_chunks()
+
+
+def chunk_records(parsed):
+    """Create item chunks and balance them against the configured token budgets."""
+    return chunking.balance_records(
+        create_chunks(parsed),
+        **chunking.budgets_from_env(os.environ),
+        # Only merge items that share a parent component
+        group_key=lambda record: tuple(record["metadata"].get("ancestors", [])),
+        # Repeat the "Path:" and "Title:" lines on every part of a split item
+        header_lines=2,
+    )
+
+
+def chunking_signature():
+    """The token budgets a document was chunked with, so changing them reprocesses every file."""
+    budgets = chunking.budgets_from_env(os.environ)
+    return "-".join(str(budgets[name]) for name in ("target_tokens", "max_tokens", "min_tokens"))
+
+
+def document_metadata(etag):
+    """Object metadata for a document written from a source with this ETag, as ``is_unchanged`` reads it."""
+    return {"source-etag": ead_cache.normalize_etag(etag), "chunking": chunking_signature()}
+
+
+def is_unchanged(bucket, dest_key, etag):
+    """True if the document was already written from this version of the source with these budgets."""
+    try:
+        metadata = s3.head_object(Bucket=bucket, Key=dest_key)["Metadata"]
+    except s3.exceptions.ClientError:
+        return False
+    return (
+        metadata.get("source-etag") == ead_cache.normalize_etag(etag)
+        and metadata.get("chunking") == chunking_signature()
+    )
+
+
+def load_cached_parse(bucket, cache_key):
+    """Return the cached parsed collection, or None if it has not been cached yet."""
+    try:
+        response = s3.get_object(Bucket=bucket, Key=cache_key)
+    except s3.exceptions.NoSuchKey:
+        return None
+    return ead_cache.loads(response["Body"].read())
+
+
 def handler(event, context):
     print(f"Processing Ead: {event}")
 
@@ -16,32 +87,99 @@ def handler(event, context):
 
     if not source_bucket or not key:
         print("Missing required parameters: bucket or key")
-        return {"statusCode": 400, "body": json.dumps("Missing required parameters: bucket or key")}
+        raise errors.PermanentError("Missing required parameters: bucket or key")
 
     dest_prefix = os.environ.get("DEST_PREFIX", "data/ead/")
     dest_bucket = os.environ["DEST_BUCKET"]
+    cache_prefix = os.environ.get("CACHE_PREFIX", "cache/ead/")
 
     try:
-        # Download the Ead XML file from S3 to a temporary location
-        local_file_name = f"/tmp/{uuid.uuid4().hex}.xml"
-        s3.download_file(source_bucket, key, local_file_name)
-        print(f"Downloaded file to: {local_file_name}")
-
-        # Parse the Ead XML using eadpy with the exact same path
-        ead = Ead(local_file_name)
-
-        parsed_ead = ead.create_item_chunks()
-        for record in parsed_ead:
-            text = record["text"]
-            print("Embedding Text:")
-            for line in text.split("\n"):
-                print(f"  {line}")
-            print("-" * 20)
+        # The Distributed Map passes the ETag from ListObjectsV2; fall back to a HEAD for direct invocations
+        etag = event.get("etag") or s3.head_object(Bucket=source_bucket, Key=key)["ETag"]
+        cache_key = ead_cache.cache_key(cache_prefix, etag)
+        document_name = document_keys.ead_document_name(key)
+        shard = document_keys.ead_shard(document_name, int(os.environ.get("SHARDS", "1")))
+        dest_key = f"{dest_prefix}{shard}{document_name}"
+
+        # Incremental runs leave documents of unchanged files alone, so ingestion has nothing to re-embed
+        if event.get("mode") == "incremental" and is_unchanged(dest_bucket, dest_key, etag):
+            print(f"Skipping unchanged Ead file s3://{source_bucket}/{key}")
+            return {
+                "statusCode": 200,
+                "body": json.dumps({"message": "Ead file unchanged", "source": f"s3://{source_bucket}/{key}"}),
+            }
+
+        parsed = None if event.get("refresh_cache") else load_cached_parse(dest_bucket, cache_key)
+        cache_status = "hit" if parsed is not None else "miss"
+
+        if parsed is None:
+            # Download the Ead XML file from S3 to a temporary location
+            local_file_name = f"/tmp/{uuid.uuid4().hex}.xml"
+            s3.download_file(source_bucket, key, local_file_name)
+            print(f"Downloaded file to: {local_file_name}")
+
+            parse_started = time.perf_counter()
+            try:
+                parsed = parse_ead(local_file_name)
+            finally:
+                parse_ms = (time.perf_counter() - parse_started) * 1000
+                os.remove(local_file_name)
+
+            s3.put_object(
+                Bucket=dest_bucket,
+                Key=cache_key,
+                Body=ead_cache.dumps(parsed),
+                ContentType="application/jsonl",
+                ContentEncoding="gzip",
+                Metadata={"source": f"s3://{source_bucket}/{key}"},
+            )
+            print(f"Cached parsed Ead at s3://{dest_bucket}/{cache_key}")
+        else:
+            print(f"Using cached parse from s3://{dest_bucket}/{cache_key}")
+            parse_ms = 0.0
+
+        chunk_started = time.perf_counter()
+        parsed_ead = chunk_records(parsed)
+        chunk_ms = (time.perf_counter() - chunk_started) * 1000
+
+        # Opt-in sample of chunk text for debugging; logging every chunk floods CloudWatch
+        for record in parsed_ead[: int(os.environ.get("DEBUG_SAMPLE_CHUNKS", "0"))]:
+            print(f"Sample chunk {record['metadata'].get('id')}:\n{record['text']}")
 
         # Save the processed data to S3 data source location
-        dest_key = f"{dest_prefix}{os.path.basename(key).replace('.xml', '.json')}"
+        body = json.dumps(parsed_ead, indent=2).encode("utf-8")
+        upload_started = time.perf_counter()
         s3.put_object(
-            Bucket=dest_bucket, Key=dest_key, Body=json.dumps(parsed_ead, indent=2), ContentType="application/json"
+            Bucket=dest_bucket,
+            Key=dest_key,
+            Body=body,
+            ContentType="application/json",
+            Metadata=document_metadata(etag),
+        )
+        upload_ms = (time.perf_counter() - upload_started) * 1000
+
+        chunk_sizes = [len(record["text"]) for record in parsed_ead]
+        chunk_tokens = [chunking.estimate_tokens(record["text"]) for record in parsed_ead]
+        telemetry.emit_metrics(
+            {
+                "ComponentCount": sum(1 for _ in ead_cache.iter_components(parsed)),
+                "ChunkCount": len(parsed_ead),
+                "TotalCharacters": sum(chunk_sizes),
+                "MaxChunkCharacters": max(chunk_sizes, default=0),
+                "MaxChunkTokens": max(chunk_tokens, default=0),
+                "SplitChunks": sum(1 for record in parsed_ead if "part" in record["metadata"]),
+                "MergedChunks": sum(1 for record in parsed_ead if "merged_ids" in record["metadata"]),
+                "ParseTime": (parse_ms, "Milliseconds"),
+                "ChunkTime": (chunk_ms, "Milliseconds"),
+                "UploadTime": (upload_ms, "Milliseconds"),
+                "BytesWritten": (len(body), "Bytes"),
+            },
+            dimensions={"Function": "ProcessEad"},
+            properties={
+                "Source": f"s3://{source_bucket}/{key}",
+                "Cache": cache_status,
+                "TokenHistogram": chunking.size_histogram(chunk_tokens),
+            },
         )
 
         print(f"Successfully processed Ead file. Output saved to s3://{dest_bucket}/{dest_key}")
@@ -53,10 +191,12 @@ def handler(event, context):
                     "message": "Ead file processed successfully",
                     "source": f"s3://{source_bucket}/{key}",
                     "destination": f"s3://{dest_bucket}/{dest_key}",
+                    "cache": cache_status,
                 }
             ),
         }
 
     except Exception as e:
+        # Raised rather than returned so the map retries transient errors and counts the rest as failures
         print(f"Error processing Ead file: {str(e)}")
-        return {"statusCode": 500, "body": json.dumps(f"Error processing Ead file: {str(e)}")}
+        raise errors.classify(e, f"Error processing Ead file s3://{source_bucket}/{key}") from e
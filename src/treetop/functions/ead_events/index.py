@@ -0,0 +1,140 @@
+"""Keep the knowledge base current as EAD files change in the source bucket.
+
+S3 sends Object Created and Object Deleted events for the source prefix to
+EventBridge, which queues them for ``handler``. It processes just the changed
+file (or deletes the document of a removed one), records when the change
+happened, and queues a sync check delayed by ``QUIET_SECONDS``.
+
+``sync_handler`` debounces those checks. Bedrock runs one ingestion job per data
+source at a time, so it starts a single job on each EAD data source (one per
+shard) once no change has arrived for ``QUIET_SECONDS``. If a job is already
+running on one of them it checks again later.
+"""
+
+import json
+import os
+import time
+
+import boto3
+from botocore.exceptions import ClientError
+from shared import document_keys, telemetry
+
+DEST_BUCKET = os.environ["DEST_BUCKET"]
+DEST_PREFIX = os.environ.get("DEST_PREFIX", "data/ead/")
+SHARDS = int(os.environ.get("SHARDS", "1"))
+STATE_PREFIX = os.environ.get("STATE_PREFIX", "state/ead-events/")
+PROCESS_FUNCTION = os.environ.get("PROCESS_FUNCTION", "")
+SYNC_QUEUE_URL = os.environ.get("SYNC_QUEUE_URL", "")
+QUIET_SECONDS = int(os.environ.get("QUIET_SECONDS", "300"))
+KNOWLEDGE_BASE_ID = os.environ.get("KNOWLEDGE_BASE_ID", "")
+# Comma separated when the EAD documents are sharded over several data sources
+DATA_SOURCE_ID = os.environ.get("DATA_SOURCE_ID", "")
+
+LAST_CHANGE_KEY = f"{STATE_PREFIX}last-change"
+SYNCED_KEY = f"{STATE_PREFIX}synced"
+# SQS caps message delays at 15 minutes
+MAX_DELAY_SECONDS = 900
+
+s3 = boto3.client("s3")
+sqs = boto3.client("sqs")
+lambda_client = boto3.client("lambda")
+bedrock_agent = boto3.client("bedrock-agent")
+
+
+def read_timestamp(key):
+    try:
+        return float(s3.get_object(Bucket=DEST_BUCKET, Key=key)["Body"].read())
+    except s3.exceptions.NoSuchKey:
+        return None
+
+
+def write_timestamp(key, value):
+    s3.put_object(Bucket=DEST_BUCKET, Key=key, Body=str(value).encode("utf-8"), ContentType="text/plain")
+
+
+def queue_sync_check(delay_seconds):
+    sqs.send_message(
+        QueueUrl=SYNC_QUEUE_URL,
+        MessageBody=json.dumps({"check": "sync"}),
+        DelaySeconds=min(int(delay_seconds), MAX_DELAY_SECONDS),
+    )
+
+
+def process_change(change):
+    """Apply one S3 event to the data source; returns False for objects that aren't EAD files."""
+    detail = change["detail"]
+    bucket, key = detail["bucket"]["name"], detail["object"]["key"]
+    if not key.endswith(".xml"):
+        return False
+
+    if change["detail-type"] == "Object Deleted":
+        name = document_keys.ead_document_name(key)
+        dest_key = f"{DEST_PREFIX}{document_keys.ead_shard(name, SHARDS)}{name}"
+        s3.delete_object(Bucket=DEST_BUCKET, Key=dest_key)
+        print(f"Deleted s3://{DEST_BUCKET}/{dest_key} after s3://{bucket}/{key} was removed")
+        return True
+
+    payload = {"bucket": bucket, "key": key, "etag": detail["object"].get("etag")}
+    response = lambda_client.invoke(FunctionName=PROCESS_FUNCTION, Payload=json.dumps(payload).encode("utf-8"))
+    if response.get("FunctionError"):
+        raise RuntimeError(f"Processing s3://{bucket}/{key} failed: {response['Payload'].read().decode('utf-8')}")
+    print(f"Processed s3://{bucket}/{key}")
+    return True
+
+
+def handler(event, _context):
+    """Process queued S3 events, reporting the ones that failed so only they are redelivered."""
+    failures = []
+    changed = 0
+    for record in event["Records"]:
+        try:
+            changed += process_change(json.loads(record["body"]))
+        except Exception as e:
+            print(f"Error processing message {record['messageId']}: {e}")
+            failures.append({"itemIdentifier": record["messageId"]})
+
+    if changed:
+        write_timestamp(LAST_CHANGE_KEY, time.time())
+        queue_sync_check(QUIET_SECONDS)
+    telemetry.emit_metrics(
+        {"EadChanges": changed, "EadChangeFailures": len(failures)}, dimensions={"Function": "EadEvents"}
+    )
+    return {"batchItemFailures": failures}
+
+
+def sync_handler(event, _context):
+    """Start an ingestion job if changes have settled and aren't synced yet."""
+    last_change = read_timestamp(LAST_CHANGE_KEY)
+    synced = read_timestamp(SYNCED_KEY)
+    if last_change is None or (synced is not None and synced >= last_change):
+        return {"started": False, "reason": "up to date"}
+    remaining = last_change + QUIET_SECONDS - time.time()
+    if remaining > 0:
+        # One check per batch, so a burst of changes converges on a single job
+        queue_sync_check(max(remaining, 1))
+        return {"started": False, "reason": "changes still arriving"}
+
+    job_ids, running = [], []
+    for data_source_id in DATA_SOURCE_ID.split(","):
+        try:
+            response = bedrock_agent.start_ingestion_job(
+                knowledgeBaseId=KNOWLEDGE_BASE_ID,
+                dataSourceId=data_source_id,
+                description="Sync after EAD source changes",
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConflictException":
+                raise
+            running.append(data_source_id)
+            continue
+        job_ids.append(response["ingestionJob"]["ingestionJobId"])
+
+    if running:
+        # The changes aren't synced until every data source has ingested them
+        print(f"An ingestion job is already running on {', '.join(running)}; checking again later")
+        queue_sync_check(QUIET_SECONDS)
+        return {"started": bool(job_ids), "ingestionJobIds": job_ids, "reason": "ingestion running"}
+
+    write_timestamp(SYNCED_KEY, last_change)
+    print(f"Started ingestion jobs {', '.join(job_ids)} for changes up to {last_change}")
+    return {"started": True, "ingestionJobIds": job_ids}
@@ -0,0 +1,132 @@
+"""Full text (OCR, transcriptions) referenced from IIIF canvases.
+
+Canvases point to their text in a few ways:
+
+* Presentation 3 ``annotations``: AnnotationPages, embedded or by reference
+* Presentation 2 ``otherContent``: AnnotationLists
+* ``seeAlso`` and ``rendering`` entries in a text format: plain text, ALTO or hOCR
+
+The functions here find those references and turn fetched resources into plain
+text. Fetching and caching are done by the handler in ``index.py``.
+"""
+
+import html
+import json
+import re
+import xml.etree.ElementTree as ET
+
+_TAG_PATTERN = re.compile(r"<[^>]+>")
+_TEXT_FORMATS = ("text/plain", "alto", "hocr")
+
+
+def canvases(manifest):
+    """Return the canvases of a Presentation 3 or 2 manifest."""
+    if isinstance(manifest.get("items"), list):
+        return [canvas for canvas in manifest["items"] if isinstance(canvas, dict)]
+    return [
+        canvas
+        for sequence in manifest.get("sequences") or []
+        if isinstance(sequence, dict)
+        for canvas in sequence.get("canvases") or []
+        if isinstance(canvas, dict)
+    ]
+
+
+def resource_id(resource):
+    if isinstance(resource, str):
+        return resource
+    return resource.get("id") or resource.get("@id")
+
+
+def _format_hints(resource):
+    return " ".join(str(resource.get(key, "")) for key in ("format", "profile", "type", "@type")).lower()
+
+
+def is_text_resource(resource):
+    """True for seeAlso/rendering entries that point at OCR or plain text."""
+    if not isinstance(resource, dict):
+        return False
+    hints = _format_hints(resource)
+    return any(text_format in hints for text_format in _TEXT_FORMATS)
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def text_resources(canvas):
+    """Return the annotation pages/lists and text documents referenced by a canvas."""
+    resources = _as_list(canvas.get("annotations")) + _as_list(canvas.get("otherContent"))
+    resources += [
+        resource
+        for resource in _as_list(canvas.get("seeAlso")) + _as_list(canvas.get("rendering"))
+        if is_text_resource(resource)
+    ]
+    return [resource for resource in resources if isinstance(resource, dict) and resource_id(resource)]
+
+
+def canvas_label(canvas, position):
+    """A short human-readable label for a canvas, falling back to its position."""
+    label = canvas.get("label")
+    if isinstance(label, dict):
+        label = "; ".join(str(value) for values in label.values() for value in _as_list(values))
+    elif isinstance(label, list):
+        label = "; ".join(str(value) for value in label)
+    return str(label) if label else f"Canvas {position}"
+
+
+def strip_tags(text):
+    return html.unescape(_TAG_PATTERN.sub(" ", text)).strip()
+
+
+def _body_text(body):
+    """Text of one annotation body (P3 TextualBody or P2 ContentAsText/chars)."""
+    for item in _as_list(body):
+        if isinstance(item, str):
+            continue
+        if item.get("type") == "TextualBody" and item.get("value"):
+            yield strip_tags(str(item["value"]))
+        elif item.get("chars"):
+            yield strip_tags(str(item["chars"]))
+
+
+def is_embedded_page(resource):
+    """True if an AnnotationPage/List already contains its annotations."""
+    return isinstance(resource.get("items"), list) or isinstance(resource.get("resources"), list)
+
+
+def annotation_text(page):
+    """Text of the textual annotations in an AnnotationPage (P3) or AnnotationList (P2)."""
+    annotations = page.get("items") if isinstance(page.get("items"), list) else page.get("resources") or []
+    lines = []
+    for annotation in annotations:
+        if isinstance(annotation, dict):
+            lines.extend(_body_text(annotation.get("body") or annotation.get("resource")))
+    return "\n".join(line for line in lines if line)
+
+
+def alto_text(document):
+    """Text of an ALTO XML document, one line per TextLine."""
+    lines = []
+    for element in ET.fromstring(document).iter():
+        if element.tag.rsplit("}", 1)[-1] == "TextLine":
+            words = [child.get("CONTENT", "") for child in element.iter() if child.tag.rsplit("}", 1)[-1] == "String"]
+            lines.append(" ".join(word for word in words if word))
+    return "\n".join(line for line in lines if line)
+
+
+def resource_text(body, content_type="", resource=None):
+    """Turn a fetched text resource (bytes) into plain text, based on its content type and declared format."""
+    hints = f"{content_type} {_format_hints(resource or {})}".lower()
+    start = body[:500].lstrip()
+    if "json" in hints or start.startswith(b"{"):
+        return annotation_text(json.loads(body))
+    if "alto" in hints or b"<alto" in start:
+        # Parsed from bytes so the document's own encoding declaration is honoured
+        return alto_text(body)
+    text = body.decode("utf-8", errors="replace")
+    if "html" in hints or start.startswith(b"<"):
+        return strip_tags(text)
+    return text.strip()
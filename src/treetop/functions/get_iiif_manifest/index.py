@@ -1,62 +1,653 @@
+import asyncio
 import hashlib
 import json
 import logging
 import os
+import time
+from urllib.parse import urlsplit
 
+import aiohttp
+import annotations
 import boto3
-from loam_iiif.iiif import IIIFClient
+import ijson
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from loam_iiif.iiif import IIIFClient, TrailingCommaJSONDecoder
+from manifest_stream import read_descriptive_fields
+from shared import chunking, document_keys, errors, ratelimit, telemetry
 
 DEST_BUCKET = os.environ["DEST_BUCKET"]
 DEST_PREFIX = os.environ.get("DEST_PREFIX")
+# Data sources the documents are spread over (see [ingestion] shards in config.toml)
+SHARDS = int(os.environ.get("SHARDS", "1"))
+# Manifests fetched at the same time within one batch invocation
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "10"))
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "30"))
+# Requests per second allowed to one host across all invocations (0 disables the shared budget)
+HOST_RATE_LIMIT = float(os.environ.get("HOST_RATE_LIMIT", "0"))
+HOST_BURST = float(os.environ.get("HOST_BURST", "0")) or max(1.0, HOST_RATE_LIMIT)
+MAX_ATTEMPTS = int(os.environ.get("MAX_ATTEMPTS", "5"))
+# Longest Retry-After (or host block) worth waiting for within one invocation; longer ones fail the row as retryable
+MAX_RETRY_AFTER = float(os.environ.get("MAX_RETRY_AFTER", "60"))
+RATE_LIMIT_TABLE = os.environ.get("RATE_LIMIT_TABLE")
+# Manifests larger than this (or of unknown length) are parsed incrementally; -1 disables streaming
+STREAM_THRESHOLD_BYTES = int(os.environ.get("STREAM_THRESHOLD_BYTES", "5000000"))
+# Full-text harvesting from canvas annotations: "" (off), "manifest" (append) or "canvas" (one document each)
+HARVEST_ANNOTATIONS = os.environ.get("HARVEST_ANNOTATIONS", "")
+# Annotation resources fetched at the same time for one manifest
+ANNOTATION_CONCURRENCY = int(os.environ.get("ANNOTATION_CONCURRENCY", "4"))
+ANNOTATION_CACHE_PREFIX = os.environ.get("ANNOTATION_CACHE_PREFIX", "cache/iiif-annotations/")
+# Validators that changed while a manifest's text didn't; kept apart so the document isn't rewritten
+VALIDATORS_PREFIX = os.environ.get("VALIDATORS_PREFIX", "state/iiif-validators/")
+
+# 429 and 503 mean the server is overloaded, so they also shrink the per-host concurrency
+THROTTLE_STATUSES = {429, 503}
+RETRYABLE_STATUSES = THROTTLE_STATUSES | {500, 502, 504}
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+# Created once per execution environment so warm invocations reuse its connection pool
+s3 = boto3.client("s3", config=Config(max_pool_connections=BATCH_CONCURRENCY))
 
-def key_from_uri(uri):
-    # Compute a SHA256 hash of the URI
-    hash_digest = hashlib.sha256(uri.encode("utf-8")).hexdigest()
-    return f"{hash_digest}.txt"
+# Per-host request budgets and Retry-After blocks; shared through DynamoDB when a table is configured
+token_store = (
+    ratelimit.DynamoTokenStore(boto3.client("dynamodb"), RATE_LIMIT_TABLE)
+    if RATE_LIMIT_TABLE
+    else ratelimit.LocalTokenStore()
+)
 
 
-def handler(event, _context):
-    # Extract the CSV row from the event payload
-    row = event.get("row")
-    if not row:
-        return {"statusCode": 400, "body": json.dumps({"message": "No 'row' provided in event."})}
+class ManifestError(Exception):
+    """A manifest could not be fetched, parsed or stored; carries the status code reported for its row."""
 
-    # Now extract the URI from the row
-    uri = row.get("uri")
-    if not uri:
-        return {"statusCode": 400, "body": json.dumps({"message": "No 'uri' provided in row."})}
+    def __init__(self, status_code, message, error=None, retryable=False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+        self.error = error
+        self.retryable = retryable
 
-    # Parse the IIIF manifest using loam-iiif
-    client = IIIFClient()
-    try:
+
+class RetryableFetchError(Exception):
+    """The server answered with a status worth retrying (throttling or a transient 5xx)."""
+
+    def __init__(self, status, retry_after=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def throttled(self):
+        return self.status in THROTTLE_STATUSES
+
+
+class HostGate:
+    """Caps in-flight requests to one host at its AIMD controller's current limit."""
+
+    def __init__(self):
+        self.controller = ratelimit.AimdController(initial=BATCH_CONCURRENCY, maximum=BATCH_CONCURRENCY)
+        self.active = 0
+        self.condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.active < self.controller.limit)
+            self.active += 1
+
+    async def __aexit__(self, *exc_info):
+        async with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+
+class PoliteFetcher:
+    """Fetches manifests with per-host adaptive concurrency, a shared request budget and jittered retries."""
+
+    def __init__(self, session):
+        self.session = session
+        self.gates = {}
+        self.retries = 0
+        self.throttles = 0
+
+    async def wait_for_token(self, host):
+        while True:
+            wait = await asyncio.to_thread(token_store.acquire, host, HOST_RATE_LIMIT, HOST_BURST)
+            if not wait:
+                return
+            if wait > MAX_RETRY_AFTER:
+                # Another invocation was told to leave the host alone for longer than this one can wait
+                raise RetryableFetchError(429, retry_after=wait)
+            await asyncio.sleep(wait)
+
+    async def fetch(self, uri, validators, request=None):
+        """Run ``request(session, uri, validators)`` (``fetch_manifest`` by default) politely."""
+        request = request or fetch_manifest
+        host = urlsplit(uri).netloc
+        gate = self.gates.setdefault(host, HostGate())
+        for attempt in range(MAX_ATTEMPTS):
+            await self.wait_for_token(host)
+            try:
+                async with gate:
+                    result = await request(self.session, uri, validators)
+            except (RetryableFetchError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                retry_after = getattr(e, "retry_after", None)
+                if getattr(e, "throttled", False):
+                    # Only 429/503 responses shrink the host's concurrency; timeouts, connection
+                    # errors and other 5xx are retried as-is
+                    self.throttles += 1
+                    gate.controller.on_throttle()
+                if retry_after is not None:
+                    # Tell every other invocation to leave this host alone for as long as it asked
+                    await asyncio.to_thread(token_store.block, host, time.time() + retry_after)
+                delay = ratelimit.retry_delay(attempt, retry_after=retry_after, max_retry_after=MAX_RETRY_AFTER)
+                if attempt + 1 == MAX_ATTEMPTS or delay is None:
+                    raise
+                self.retries += 1
+                logger.warning(f"Retrying {uri} in {delay:.1f}s after {type(e).__name__}: {e}")
+                await asyncio.sleep(delay)
+                continue
+            gate.controller.on_success()
+            return result
+
+    def report(self):
+        if not self.gates:
+            return
+        telemetry.emit_metrics(
+            {
+                "FetchRetries": self.retries,
+                "FetchThrottles": self.throttles,
+                "HostConcurrency": min(gate.controller.limit for gate in self.gates.values()),
+            },
+            dimensions={"Function": "FetchIiifManifest"},
+            properties={"HostLimits": {host: gate.controller.limit for host, gate in self.gates.items()}},
+        )
+
+
+class PrefetchedIIIFClient(IIIFClient):
+    """IIIFClient that parses manifests already downloaded by this module instead of fetching them again."""
+
+    def __init__(self, documents):
+        super().__init__(no_cache=True)
+        self.documents = documents
+
+    def fetch_json(self, url):
+        if url in self.documents:
+            return self.documents[url]
+        # Anything else loam-iiif needs (e.g. parent collection labels) is fetched as usual
+        return super().fetch_json(url)
+
+
+def extract_text(uri, manifest_json):
+    """Parse a downloaded manifest with loam-iiif and return its text."""
+    with PrefetchedIIIFClient({uri: manifest_json}) as client:
         manifest_data = client.parse_manifest(uri, strip_tags=True)
-        if not manifest_data:
-            return {"statusCode": 400, "body": json.dumps({"message": "Failed to parse IIIF manifest."})}
+    if not manifest_data:
+        raise ManifestError(400, "Failed to parse IIIF manifest.")
+
+    text = manifest_data.get("text", "")
+    if not text:
+        raise ManifestError(400, "No text content found in manifest.")
+    return text
+
+
+def report_document(uri, text):
+    # The whole manifest is one document, so report its size against the configured budgets
+    budgets = chunking.budgets_from_env(os.environ)
+    tokens = chunking.estimate_tokens(text)
+    if tokens < budgets["min_tokens"]:
+        logger.warning(f"Manifest text is only ~{tokens} tokens: {uri}")
+    telemetry.emit_metrics(
+        {
+            "DocumentTokens": tokens,
+            "DocumentCharacters": len(text),
+            "OversizedDocuments": int(tokens > budgets["max_tokens"]),
+            "TinyDocuments": int(tokens < budgets["min_tokens"]),
+        },
+        dimensions={"Function": "FetchIiifManifest"},
+        properties={"Uri": uri, "TokenHistogram": chunking.size_histogram([tokens])},
+    )
+
+
+def is_missing(error):
+    return error.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound")
+
+
+def stored_validators(s3_key):
+    """Return the HTTP validators and text hash saved as metadata on a manifest's previous upload."""
+    try:
+        return s3.head_object(Bucket=DEST_BUCKET, Key=s3_key).get("Metadata", {})
+    except ClientError as e:
+        if is_missing(e):
+            return {}
+        raise
+
+
+def validators_key(s3_key):
+    return f"{VALIDATORS_PREFIX}{os.path.basename(s3_key)}.json"
+
+
+def manifest_validators(s3_key):
+    """Return the validators to send for a stored manifest: its document's, or newer ones from its sidecar.
+
+    The sidecar only counts while its text hash matches the document's, so a
+    rewritten or deleted document is never mistaken for unchanged.
+    """
+    stored = stored_validators(s3_key)
+    if not stored:
+        return {}
+    try:
+        sidecar = json.loads(s3.get_object(Bucket=DEST_BUCKET, Key=validators_key(s3_key))["Body"].read())
+    except ClientError as e:
+        if is_missing(e):
+            return stored
+        raise
+    return sidecar if sidecar.get("text-sha256") == stored.get("text-sha256") else stored
+
+
+def save_validators(s3_key, metadata):
+    """Keep new validators for a manifest whose text is unchanged (best effort).
+
+    Rewriting the document would bump its LastModified, which reads as a change
+    and has the knowledge base ingest it again.
+    """
+    try:
+        s3.put_object(
+            Bucket=DEST_BUCKET,
+            Key=validators_key(s3_key),
+            Body=json.dumps(metadata).encode("utf-8"),
+            ContentType="application/json",
+        )
+    except ClientError as e:
+        logger.warning(f"Could not save the validators of s3://{DEST_BUCKET}/{s3_key}: {e}")
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def conditional_headers(validators, accept):
+    headers = {"Accept": accept}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last-modified"):
+        headers["If-Modified-Since"] = validators["last-modified"]
+    return headers
+
+
+def check_response(response):
+    """Raise for error statuses and return the response's validators (ETag / Last-Modified)."""
+    if response.status in RETRYABLE_STATUSES:
+        raise RetryableFetchError(response.status, ratelimit.parse_retry_after(response.headers.get("Retry-After")))
+    response.raise_for_status()
+    # S3 user metadata only accepts ASCII values
+    return {
+        name: value
+        for name, value in (
+            ("etag", response.headers.get("ETag")),
+            ("last-modified", response.headers.get("Last-Modified")),
+        )
+        if value and value.isascii()
+    }
+
+
+def should_stream(response):
+    if STREAM_THRESHOLD_BYTES < 0:
+        return False
+    return response.content_length is None or response.content_length > STREAM_THRESHOLD_BYTES
+
+
+async def fetch_manifest(session, uri, validators, streaming=True):
+    """Fetch a manifest conditionally.
+
+    Returns ``(manifest_json, response_validators)``, or ``(None, validators)`` when the
+    server answers 304 Not Modified. Large manifests are parsed from the response stream
+    without their canvases (see ``manifest_stream``).
+    """
+    headers = conditional_headers(validators, "application/json, application/ld+json")
+    async with session.get(uri, headers=headers) as response:
+        if response.status == 304:
+            return None, validators
+        response_validators = check_response(response)
 
-        text = manifest_data.get("text", "")
-        if not text:
-            return {"statusCode": 400, "body": json.dumps({"message": "No text content found in manifest."})}
+        if not (streaming and should_stream(response)):
+            body = await response.text()
+            return json.loads(body, cls=TrailingCommaJSONDecoder), response_validators
 
+        try:
+            # Canvases are only kept (without their images) when their annotations will be harvested
+            manifest_json = await read_descriptive_fields(response.content, keep_canvases=bool(HARVEST_ANNOTATIONS))
+            logger.info(f"Streamed manifest ({response.content_length or 'unknown'} bytes): {uri}")
+            return manifest_json, response_validators
+        except ijson.JSONError as e:
+            logger.warning(f"Streaming parse failed for {uri} ({e}); refetching for a lenient parse")
+
+    # ijson is strict, so fall back to the buffered parser, which tolerates trailing commas
+    return await fetch_manifest(session, uri, validators, streaming=False)
+
+
+async def fetch_text_resource(session, uri, validators):
+    """Fetch an annotation page or OCR document conditionally.
+
+    Returns ``((body_bytes, content_type), response_validators)``, or ``(None, validators)``
+    when the server answers 304 Not Modified.
+    """
+    headers = conditional_headers(validators, "application/json, application/ld+json, text/*, application/xml")
+    async with session.get(uri, headers=headers) as response:
+        if response.status == 304:
+            return None, validators
+        response_validators = check_response(response)
+        return (await response.read(), response.content_type), response_validators
+
+
+def read_cached_text(key):
+    return s3.get_object(Bucket=DEST_BUCKET, Key=key)["Body"].read().decode("utf-8")
+
+
+async def harvest_resource(fetcher, resource, force=False):
+    """Return the plain text of one annotation page or text document (best effort; "" on failure).
+
+    Fetched text is cached under ANNOTATION_CACHE_PREFIX with the server's validators,
+    so re-runs only make conditional requests and reuse the cache on 304.
+    """
+    if annotations.is_embedded_page(resource):
+        return annotations.annotation_text(resource)
+
+    url = annotations.resource_id(resource)
+    cache_key = f"{ANNOTATION_CACHE_PREFIX}{document_keys.iiif_document_name(url)}"
+    try:
+        validators = {} if force else await asyncio.to_thread(stored_validators, cache_key)
+        fetched, response_validators = await fetcher.fetch(url, validators, request=fetch_text_resource)
+        if fetched is None:
+            return await asyncio.to_thread(read_cached_text, cache_key)
+
+        body, content_type = fetched
+        text = annotations.resource_text(body, content_type, resource)
+        await asyncio.to_thread(
+            s3.put_object,
+            Bucket=DEST_BUCKET,
+            Key=cache_key,
+            Body=text.encode("utf-8"),
+            ContentType="text/plain",
+            Metadata=response_validators,
+        )
+        return text
     except Exception as e:
-        logger.error(f"Error parsing IIIF manifest: {e}")
-        return {"statusCode": 500, "body": json.dumps({"message": "Error parsing IIIF manifest", "error": str(e)})}
+        logger.warning(f"Skipping annotation resource {url}: {type(e).__name__}: {e}")
+        return ""
+
+
+async def harvest_canvases(fetcher, manifest_json, force=False):
+    """Yield ``(position, label, text)`` for every canvas with harvested text, in canvas order.
+
+    Canvases are harvested a window at a time, so in-flight work stays bounded
+    however many canvases the manifest has.
+    """
+    semaphore = asyncio.Semaphore(ANNOTATION_CONCURRENCY)
+
+    async def bounded(resource):
+        async with semaphore:
+            return await harvest_resource(fetcher, resource, force)
+
+    async def canvas_text(canvas):
+        texts = await asyncio.gather(*(bounded(resource) for resource in annotations.text_resources(canvas)))
+        return "\n".join(text for text in texts if text)
+
+    canvases = annotations.canvases(manifest_json)
+    window = ANNOTATION_CONCURRENCY * 4
+    for start in range(0, len(canvases), window):
+        batch = canvases[start : start + window]
+        texts = await asyncio.gather(*(canvas_text(canvas) for canvas in batch))
+        for position, (canvas, text) in enumerate(zip(batch, texts, strict=True), start=start + 1):
+            if text:
+                yield position, annotations.canvas_label(canvas, position), text
+
+
+def write_canvas_document(key, body, force=False):
+    """Store a canvas document unless it already holds this text; returns whether it was written.
+
+    Rewriting identical text would bump its LastModified, so incremental runs would ingest it again.
+    """
+    digest = text_hash(body)
+    if not force and stored_validators(key).get("text-sha256") == digest:
+        return False
+    s3.put_object(Bucket=DEST_BUCKET, Key=key, Body=body, ContentType="text/plain", Metadata={"text-sha256": digest})
+    return True
+
+
+def remove_stale_canvas_documents(uri, keep):
+    """Delete the manifest's canvas documents that are not in ``keep``; returns the number deleted.
+
+    A manifest that lost canvases, or whose canvases no longer have text, would otherwise
+    leave their documents in the knowledge base, since reconciliation only removes the
+    documents of manifests missing from the list.
+    """
+    prefix = f"{document_prefix(uri)}{document_keys.iiif_uri_hash(uri)}-canvas-"
+    paginator = s3.get_paginator("list_objects_v2")
+    stale = [
+        item["Key"]
+        for page in paginator.paginate(Bucket=DEST_BUCKET, Prefix=prefix)
+        for item in page.get("Contents", [])
+        if item["Key"] not in keep
+    ]
+    for start in range(0, len(stale), 1000):
+        batch = stale[start : start + 1000]
+        response = s3.delete_objects(
+            Bucket=DEST_BUCKET, Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True}
+        )
+        if response.get("Errors"):
+            error = response["Errors"][0]
+            message = f"Failed to delete {error.get('Key')}: {error.get('Message')}"
+            if error.get("Code") in errors.RETRYABLE_AWS_CODES:
+                raise errors.RetryableError(message)
+            raise RuntimeError(message)
+    return len(stale)
+
+
+async def harvest_full_text(fetcher, uri, manifest_json, text, force=False):
+    """Harvest canvas text into the manifest text, or into one document per canvas.
+
+    Returns ``(text, canvas_count)``.
+    """
+    # Per-canvas documents repeat the manifest's ID and title lines for retrieval context
+    header = [line for line in text.split("\n")[:2] if line.startswith(("Manifest ID:", "Title:"))]
+    sections = []
+    written = set()
+    count = 0
+    async for position, label, canvas_text in harvest_canvases(fetcher, manifest_json, force):
+        count += 1
+        if HARVEST_ANNOTATIONS == "canvas":
+            key = f"{document_prefix(uri)}{document_keys.iiif_canvas_document_name(uri, position)}"
+            body = "\n".join([*header, f"Canvas: {label}", canvas_text])
+            await asyncio.to_thread(write_canvas_document, key, body, force)
+            written.add(key)
+        else:
+            sections.append(f"Canvas: {label}\n{canvas_text}")
+    if HARVEST_ANNOTATIONS == "canvas":
+        try:
+            removed = await asyncio.to_thread(remove_stale_canvas_documents, uri, written)
+        except Exception as e:
+            # The manifest document is not written yet, so a retry harvests and cleans up again
+            logger.error(f"Error removing stale canvas documents: {e}")
+            raise ManifestError(
+                500, "Error removing stale canvas documents", str(e), retryable=errors.is_retryable(e)
+            ) from e
+        if removed:
+            logger.info(f"Removed {removed} stale canvas documents: {uri}")
+    return "\n\n".join([text, *sections]), count
+
+
+def document_prefix(uri):
+    """The prefix of a manifest's documents, including its shard directory."""
+    return f"{DEST_PREFIX}{document_keys.iiif_shard(document_keys.iiif_uri_hash(uri), SHARDS)}"
+
 
-    # Write to S3
-    s3_key = f"{DEST_PREFIX}{key_from_uri(uri)}"
+def unchanged_result(uri, s3_key, reason):
+    return {
+        "uri": uri,
+        "statusCode": 200,
+        "message": f"Manifest unchanged ({reason})",
+        "s3_key": s3_key,
+        "changed": False,
+    }
 
-    s3 = boto3.client("s3")
+
+async def process_row(fetcher, semaphore, row, force=False):
+    """Fetch, parse and store one manifest row; returns the per-row result."""
+    uri = row.get("uri") if isinstance(row, dict) else None
+    if not uri:
+        return {"uri": None, "statusCode": 400, "message": "No 'uri' provided in row."}
+
+    s3_key = f"{document_prefix(uri)}{document_keys.iiif_document_name(uri)}"
     try:
-        s3.put_object(Bucket=DEST_BUCKET, Key=s3_key, Body=text, ContentType="text/plain")
+        async with semaphore:
+            validators = {} if force else await asyncio.to_thread(manifest_validators, s3_key)
+            try:
+                manifest_json, response_validators = await fetcher.fetch(uri, validators)
+            except RetryableFetchError as e:
+                too_long = e.retry_after is not None and e.retry_after > MAX_RETRY_AFTER
+                reason = f"asked to wait {e.retry_after:.0f}s" if too_long else f"after {MAX_ATTEMPTS} attempts"
+                logger.error(f"Giving up on {uri} ({reason}): {e}")
+                raise ManifestError(e.status, "Error fetching IIIF manifest", str(e), retryable=True) from e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"Error fetching IIIF manifest: {e}")
+                status = getattr(e, "status", None) or 502
+                raise ManifestError(
+                    status,
+                    "Error fetching IIIF manifest",
+                    str(e) or type(e).__name__,
+                    retryable=errors.is_retryable_status(status),
+                ) from e
+            except Exception as e:
+                logger.error(f"Error parsing IIIF manifest: {e}")
+                raise ManifestError(500, "Error parsing IIIF manifest", str(e)) from e
+            if manifest_json is None:
+                return unchanged_result(uri, s3_key, "not modified")
+
+            try:
+                # loam-iiif is synchronous (and may fetch parent collections), so keep it off the event loop
+                text = await asyncio.to_thread(extract_text, uri, manifest_json)
+            except ManifestError:
+                raise
+            except Exception as e:
+                logger.error(f"Error parsing IIIF manifest: {e}")
+                raise ManifestError(500, "Error parsing IIIF manifest", str(e)) from e
+
+            harvested = 0
+            if HARVEST_ANNOTATIONS:
+                text, harvested = await harvest_full_text(fetcher, uri, manifest_json, text, force)
+                logger.info(f"Harvested text from {harvested} canvases: {uri}")
+
+            report_document(uri, text)
+
+            # Skip the write when the extracted text is identical, so the knowledge base has nothing to re-embed
+            digest = text_hash(text)
+            metadata = {**response_validators, "text-sha256": digest}
+            if validators.get("text-sha256") == digest:
+                if metadata != validators:
+                    # Keep the new validators, or every later run downloads the manifest again
+                    await asyncio.to_thread(save_validators, s3_key, metadata)
+                return unchanged_result(uri, s3_key, "identical text")
+
+            # Write to S3
+            try:
+                await asyncio.to_thread(
+                    s3.put_object,
+                    Bucket=DEST_BUCKET,
+                    Key=s3_key,
+                    Body=text,
+                    ContentType="text/plain",
+                    Metadata=metadata,
+                )
+            except Exception as e:
+                logger.error(f"Error writing manifest to S3: {e}")
+                raise ManifestError(500, "Error writing to S3", str(e), retryable=errors.is_retryable(e)) from e
+
+    except ManifestError as e:
+        result = {"uri": uri, "statusCode": e.status_code, "message": e.message, "retryable": e.retryable}
+        if e.error:
+            result["error"] = e.error
+        return result
+
+    return {
+        "uri": uri,
+        "statusCode": 200,
+        "message": "Manifest fetched and stored successfully",
+        "s3_key": s3_key,
+        "changed": True,
+        "harvested_canvases": harvested,
+    }
+
+
+async def process_rows(rows, force=False):
+    """Return the rows' results and how many requests the source servers throttled."""
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    connector = aiohttp.TCPConnector(limit=BATCH_CONCURRENCY)
+    timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        fetcher = PoliteFetcher(session)
+        results = await asyncio.gather(*(process_row(fetcher, semaphore, row, force) for row in rows))
+    fetcher.report()
+    return results, fetcher.throttles
+
+
+def raise_for_failures(results, limit=50):
+    """Fail the batch if any row failed transiently, so the map retries it or counts it towards its failure threshold.
+
+    Rows that succeeded are cheap to repeat: their manifests answer 304 or yield identical text. Permanent
+    failures (404/410, manifests without text) would fail again, so they're returned with the batch's results.
+    """
+    failed = [result for result in results if result["statusCode"] != 200]
+    if not any(result.get("retryable") for result in failed):
+        return
+    details = [{"uri": result["uri"], "statusCode": result["statusCode"]} for result in failed[:limit]]
+    raise errors.RetryableError(json.dumps({"failed": len(failed), "of": len(results), "rows": details}))
 
+
+def report_failures(results):
+    failed = [result for result in results if result["statusCode"] != 200]
+    if not failed:
+        return
+    retryable = sum(1 for result in failed if result.get("retryable"))
+    telemetry.emit_metrics(
+        {"RetryableFailures": retryable, "PermanentFailures": len(failed) - retryable},
+        dimensions={"Function": "FetchIiifManifest"},
+        properties={"FailedUris": [result["uri"] for result in failed[:50]]},
+    )
+
+
+def handler(event, _context):
+    # A batch of CSV rows from the Distributed Map's ItemBatcher
+    rows = event.get("rows")
+    if rows is not None:
+        try:
+            results, throttles = asyncio.run(process_rows(rows, force=event.get("force", False)))
+        except Exception as e:
+            raise errors.classify(e, "Error processing manifest batch") from e
+        succeeded = sum(1 for result in results if result["statusCode"] == 200)
+        changed = sum(1 for result in results if result.get("changed"))
+        logger.info(f"Processed batch of {len(results)} manifests: {succeeded} succeeded, {changed} changed")
+        report_failures(results)
+        raise_for_failures(results)
         return {
-            "statusCode": 200,
-            "body": json.dumps({"message": "Manifest fetched and stored successfully", "s3_key": s3_key}),
+            "results": results,
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "changed": changed,
+            # Read by the adaptive concurrency controller
+            "throttles": throttles,
         }
 
-    except Exception as e:
-        logger.error(f"Error writing manifest to S3: {e}")
-        return {"statusCode": 500, "body": json.dumps({"message": "Error writing to S3", "error": str(e)})}
+    # Extract the CSV row from the event payload
+    row = event.get("row")
+    if not row:
+        return {"statusCode": 400, "body": json.dumps({"message": "No 'row' provided in event."})}
+
+    # Now extract the URI from the row
+    uri = row.get("uri")
+    if not uri:
+        return {"statusCode": 400, "body": json.dumps({"message": "No 'uri' provided in row."})}
+
+    result = asyncio.run(process_rows([row], force=event.get("force", False)))[0][0]
+    body = {key: value for key, value in result.items() if key not in ("uri", "statusCode")}
+    return {"statusCode": result["statusCode"], "body": json.dumps(body)}
@@ -0,0 +1,73 @@
+"""Incremental parsing of large IIIF manifests.
+
+A manifest's size is dominated by its canvases (``items`` in Presentation 3,
+``sequences`` in Presentation 2), its ranges and its annotations. None of these
+are used for the indexed text. ``read_descriptive_fields`` parses the response
+stream with ijson and builds only the remaining top-level fields. The skipped
+subtrees are read and discarded as they arrive, so memory use depends on the
+descriptive fields and not on the number of canvases.
+"""
+
+import ijson
+
+# Top-level keys that loam-iiif does not read when building manifest text
+SKIPPED_KEYS = frozenset({"items", "sequences", "structures", "annotations"})
+
+# Where canvases sit in Presentation 3 and 2 manifests, and the canvas fields needed to harvest their text
+CANVAS_PREFIXES = frozenset({"items.item", "sequences.item.canvases.item"})
+CANVAS_KEYS = frozenset({"id", "@id", "label", "annotations", "otherContent", "seeAlso", "rendering"})
+
+
+async def read_descriptive_fields(stream, skipped_keys=SKIPPED_KEYS, keep_canvases=False):
+    """Parse a manifest from an async byte stream, keeping only top-level fields not in ``skipped_keys``.
+
+    ``stream`` is anything with an ``async read(size)`` method, such as an aiohttp
+    response's ``content``. With ``keep_canvases``, a reduced copy of each canvas
+    (its ``CANVAS_KEYS`` only, without painting annotations) is returned under
+    ``items``, for annotation harvesting. Raises ``ijson.JSONError`` on malformed JSON.
+    """
+    manifest = {}
+    key = None
+    builder = None
+    canvases = []
+    canvas = None
+    canvas_prefix = None
+    field = None
+    field_builder = None
+
+    async for prefix, event, value in ijson.parse_async(stream, use_float=True):
+        if prefix:
+            if builder is not None:
+                builder.event(event, value)
+            elif not keep_canvases:
+                continue
+            elif canvas is None:
+                if event == "start_map" and prefix in CANVAS_PREFIXES:
+                    canvas, canvas_prefix = {}, prefix
+            elif prefix != canvas_prefix:
+                if field_builder is not None:
+                    field_builder.event(event, value)
+            elif event in ("map_key", "end_map"):
+                if field_builder is not None:
+                    canvas[field] = field_builder.value
+                field = value
+                field_builder = ijson.ObjectBuilder() if event == "map_key" and field in CANVAS_KEYS else None
+                if event == "end_map":
+                    canvases.append(canvas)
+                    canvas = None
+            continue
+
+        # Events on the root object itself
+        if event == "start_map":
+            continue
+        if event in ("map_key", "end_map"):
+            if builder is not None:
+                manifest[key] = builder.value
+            key = value
+            builder = None if event == "end_map" or key in skipped_keys else ijson.ObjectBuilder()
+            continue
+        raise ijson.JSONError("Manifest is not a JSON object")
+
+    if keep_canvases:
+        manifest["items"] = canvases
+    return manifest
@@ -0,0 +1,232 @@
+"""Plan an incremental IIIF run from the crawled manifest list.
+
+Compares the crawl against the fingerprints saved by the last run and writes
+only the manifests worth fetching to the delta list:
+
+* new: not in the previous run
+* changed: the collection lists a different label or navDate (JSONL lists only)
+* missing: no document in the knowledge base yet, e.g. after a failed fetch
+* due: not fetched for ``REVALIDATE_DAYS``, to pick up changes the collection
+  listing can't show. New manifests are given a staggered due date so the
+  revalidation load is spread across runs instead of arriving all at once.
+
+URIs that dropped out of the collection go to a removals list for the
+reconciliation step, unless the crawl was incomplete: then nothing is removed
+and the manifests it didn't list keep their previous state. State is kept per collection URL. The new state is written
+to a pending key and only copied over the current one once the map has run, so
+an interrupted run is planned again from the old state. ``failures_handler``
+runs after the map and marks the manifests of failed batches as due, so the
+next run retries just those.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import time
+
+import boto3
+from shared import document_keys, manifest_list, telemetry
+
+DEST_BUCKET = os.environ["DEST_BUCKET"]
+IIIF_PREFIX = os.environ.get("IIIF_PREFIX", "data/iiif/")
+STATE_PREFIX = os.environ.get("STATE_PREFIX", "state/iiif-manifests/")
+# 0 processes every manifest on every run
+REVALIDATE_DAYS = float(os.environ.get("REVALIDATE_DAYS", "7"))
+SHARDS = int(os.environ.get("SHARDS", "1"))
+
+DAY = 86400
+
+s3 = boto3.client("s3")
+
+
+def state_keys(collection_url):
+    """Return the (current, pending) state keys for a collection."""
+    name = hashlib.sha256(collection_url.encode("utf-8")).hexdigest()[:16]
+    return f"{STATE_PREFIX}{name}.json.gz", f"{STATE_PREFIX}{name}.pending.json.gz"
+
+
+def load_state(key):
+    """Return ``{uri: [fingerprint, fetched_at]}`` from the last completed run."""
+    try:
+        body = s3.get_object(Bucket=DEST_BUCKET, Key=key)["Body"].read()
+    except s3.exceptions.NoSuchKey:
+        return {}
+    return json.loads(gzip.decompress(body))["manifests"]
+
+
+def save_state(key, manifests):
+    body = gzip.compress(json.dumps({"manifests": manifests}, separators=(",", ":")).encode("utf-8"))
+    s3.put_object(Bucket=DEST_BUCKET, Key=key, Body=body, ContentType="application/gzip")
+
+
+def existing_document_hashes():
+    """Hashes of the manifests that have documents under the IIIF prefix, in their shard's directory.
+
+    A document left elsewhere (e.g. after the shard count changed) isn't in any data source, so its
+    manifest counts as missing.
+    """
+    paginator = s3.get_paginator("list_objects_v2")
+    hashes = set()
+    for page in paginator.paginate(Bucket=DEST_BUCKET, Prefix=IIIF_PREFIX):
+        for item in page.get("Contents", []):
+            source_hash = document_keys.iiif_source_hash(item["Key"])
+            shard = document_keys.iiif_shard(source_hash, SHARDS) if source_hash else None
+            if source_hash and os.path.dirname(item["Key"]) + "/" == f"{IIIF_PREFIX}{shard}":
+                hashes.add(source_hash)
+    return hashes
+
+
+def stagger(uri):
+    """A stable fraction in [0, 1) for spreading first revalidations of new manifests."""
+    return int(document_keys.iiif_uri_hash(uri)[:8], 16) / 0x100000000
+
+
+def crawl_status(bucket, key):
+    """The crawler's status for a manifest list; lists written without one count as complete."""
+    try:
+        body = s3.get_object(Bucket=bucket, Key=manifest_list.status_key(key))["Body"].read()
+    except s3.exceptions.NoSuchKey:
+        return {"complete": True, "failed": []}
+    return json.loads(body)
+
+
+def plan(rows, previous, existing, now, full=False, partial=False):
+    """Return ``(delta lines, removed URIs, new state, counts)`` for the crawled ``rows``.
+
+    With ``partial``, manifests missing from ``rows`` may sit under a collection that
+    failed to load, so they keep their previous state instead of being removed.
+    """
+    interval = REVALIDATE_DAYS * DAY
+    state = {}
+    lines = []
+    counts = {"new": 0, "changed": 0, "missing": 0, "due": 0}
+
+    for uri, line, fingerprint in rows:
+        if uri in state:
+            continue
+        known = previous.get(uri)
+        if known is None:
+            reason = "new"
+        elif fingerprint is not None and fingerprint != known[0]:
+            reason = "changed"
+        elif document_keys.iiif_uri_hash(uri) not in existing:
+            reason = "missing"
+        elif full or interval <= 0 or now - known[1] >= interval:
+            reason = "due"
+        else:
+            state[uri] = known
+            continue
+
+        counts[reason] += 1
+        lines.append(line)
+        fetched_at = now - stagger(uri) * interval if reason == "new" else now
+        state[uri] = [fingerprint if fingerprint is not None else (known or [None])[0], fetched_at]
+
+    if partial:
+        for uri, known in previous.items():
+            state.setdefault(uri, known)
+    removed = [uri for uri in previous if uri not in state]
+    return lines, removed, state, counts
+
+
+def write_list(key, lines, content_type):
+    body = "".join(f"{line}\n" for line in lines)
+    s3.put_object(Bucket=DEST_BUCKET, Key=key, Body=body.encode("utf-8"), ContentType=content_type)
+
+
+def handler(event, _context):
+    source = event["s3"]
+    # Scheduled incremental runs never refetch everything
+    full = event.get("mode") != "incremental" and (bool(event.get("full")) or REVALIDATE_DAYS <= 0)
+    jsonl = manifest_list.is_jsonl(source["Key"])
+    print(f"Planning manifests from s3://{source['Bucket']}/{source['Key']} (full={full})")
+
+    body = s3.get_object(Bucket=source["Bucket"], Key=source["Key"])["Body"].read().decode("utf-8")
+    status = crawl_status(source["Bucket"], source["Key"])
+    partial = not status["complete"]
+    if partial:
+        print(f"The crawl was incomplete ({len(status['failed'])} collections failed); no manifests are removed")
+    state_key, pending_state_key = state_keys(event.get("collection_url", ""))
+    previous = load_state(state_key)
+    existing = existing_document_hashes()
+    lines, removed, state, counts = plan(
+        manifest_list.parse_rows(body, jsonl), previous, existing, time.time(), full=full, partial=partial
+    )
+
+    delta_key = manifest_list.delta_key(source["Key"])
+    removals_key = manifest_list.removals_key(source["Key"])
+    write_list(delta_key, lines, "application/jsonl" if jsonl else "text/csv")
+    write_list(removals_key, removed, "text/csv")
+    save_state(pending_state_key, state)
+
+    report = {
+        "Bucket": DEST_BUCKET,
+        "Key": delta_key,
+        "RemovalsKey": removals_key,
+        "StateKey": state_key,
+        "PendingStateKey": pending_state_key,
+        "full": full,
+        "partial": partial,
+        "failedCollections": len(status["failed"]),
+        "total": len(state),
+        "previous": len(previous),
+        "count": len(lines),
+        "removed": len(removed),
+        **counts,
+    }
+    telemetry.emit_metrics(
+        {
+            "CrawledManifests": len(state),
+            "PlannedManifests": len(lines),
+            "NewManifests": counts["new"],
+            "ChangedManifests": counts["changed"],
+            "MissingManifests": counts["missing"],
+            "RevalidatedManifests": counts["due"],
+            "RemovedManifests": len(removed),
+            "FailedCollections": len(status["failed"]),
+        },
+        dimensions={"Function": "PlanManifests"},
+    )
+    print(f"Planned {len(lines)} of {len(state)} manifests: {report}")
+    return report
+
+
+def read_json(bucket, key):
+    return json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+
+
+def failed_manifest_uris(result_writer):
+    """Return the manifest URIs in the map's failed batches, from its ResultWriter manifest."""
+    manifest = read_json(result_writer["Bucket"], result_writer["Key"])
+    uris = []
+    for result_file in manifest.get("ResultFiles", {}).get("FAILED", []):
+        for execution in read_json(manifest["DestinationBucket"], result_file["Key"]):
+            batch = json.loads(execution.get("Input") or "{}")
+            uris.extend(row["uri"] for row in batch.get("Items", []) if isinstance(row, dict) and row.get("uri"))
+    return uris
+
+
+def failures_handler(event, _context):
+    """List the manifests of failed map batches and make them due on the next run.
+
+    In adaptive concurrency mode this runs after each wave; waves after the
+    first append to the list, so it covers the whole run.
+    """
+    plan_report = event["plan"]
+    uris = failed_manifest_uris(event["resultWriter"])
+    if uris:
+        state = load_state(plan_report["PendingStateKey"])
+        for uri in uris:
+            if uri in state:
+                state[uri][1] = 0
+        save_state(plan_report["PendingStateKey"], state)
+
+    failed_key = manifest_list.failures_key(event["s3"]["Key"])
+    if event.get("wave", 0) > 0:
+        previous = s3.get_object(Bucket=DEST_BUCKET, Key=failed_key)["Body"].read().decode("utf-8")
+        uris = previous.splitlines() + uris
+    write_list(failed_key, uris, "text/csv")
+    telemetry.emit_metrics({"FailedManifests": len(uris)}, dimensions={"Function": "PlanManifests"})
+    print(f"Recorded {len(uris)} failed manifests in s3://{DEST_BUCKET}/{failed_key}")
+    return {"FailedKey": failed_key, "failed": len(uris)}
@@ -0,0 +1,201 @@
+import gzip
+import json
+import os
+
+import boto3
+from shared import document_keys, ead_cache, manifest_list, telemetry
+
+DEST_BUCKET = os.environ["DEST_BUCKET"]
+IIIF_PREFIX = os.environ.get("IIIF_PREFIX", "data/iiif/")
+EAD_PREFIX = os.environ.get("EAD_PREFIX", "data/ead/")
+EAD_CACHE_PREFIX = os.environ.get("EAD_CACHE_PREFIX", "cache/ead/")
+# Refuse to delete more than this share of the existing documents unless the event sets "force"
+MAX_DELETE_FRACTION = float(os.environ.get("MAX_DELETE_FRACTION", "0.5"))
+DRY_RUN = os.environ.get("DRY_RUN", "false").lower() == "true"
+# Data sources each type's documents are spread over; documents outside their shard are orphans
+SHARDS = int(os.environ.get("SHARDS", "1"))
+
+s3 = boto3.client("s3")
+
+
+def list_objects(bucket, prefix):
+    """Yield every object under a prefix."""
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        yield from page.get("Contents", [])
+
+
+def read_manifest_uris(bucket, key):
+    """Return the manifest URIs in the crawler's list.
+
+    The list is either manifests.csv (one URI per line, no header) or manifests.jsonl
+    (one ``{"uri": ...}`` object per line).
+    """
+    body = s3.get_object(Bucket=bucket, Key=key)["Body"].read().decode("utf-8")
+    return {uri for uri, _line, _fingerprint in manifest_list.parse_rows(body, manifest_list.is_jsonl(key))}
+
+
+def misplaced(key, prefix, shard):
+    """Whether a document is outside its shard's directory, so no data source includes it."""
+    return os.path.dirname(key) + "/" != f"{prefix}{shard}"
+
+
+def iiif_orphans(document_keys_found, uris, partial=False):
+    """Return IIIF document keys (including per-canvas documents) whose manifest is no longer listed.
+
+    A ``partial`` list (some collections failed to load) can't show what was removed, so only
+    documents of listed manifests that sit outside their shard are returned.
+    """
+    expected = {document_keys.iiif_uri_hash(uri) for uri in uris}
+    orphans = []
+    for key in document_keys_found:
+        source_hash = document_keys.iiif_source_hash(key)
+        # Keys that don't look like ours are left alone
+        if source_hash is None:
+            continue
+        if source_hash not in expected:
+            if not partial:
+                orphans.append(key)
+        elif misplaced(key, IIIF_PREFIX, document_keys.iiif_shard(source_hash, SHARDS)):
+            orphans.append(key)
+    return orphans
+
+
+def removed_iiif_documents(uris):
+    """Return the document keys (including per-canvas documents) of removed manifests."""
+    orphans = []
+    for uri in sorted(uris):
+        uri_hash = document_keys.iiif_uri_hash(uri)
+        prefix = f"{IIIF_PREFIX}{document_keys.iiif_shard(uri_hash, SHARDS)}{uri_hash}"
+        orphans.extend(item["Key"] for item in list_objects(DEST_BUCKET, prefix))
+    return orphans
+
+
+def ead_orphans(document_keys_found, source_keys):
+    """Return EAD document keys whose source XML file no longer exists."""
+    expected = {document_keys.ead_document_name(key) for key in source_keys}
+    return [
+        key
+        for key in document_keys_found
+        if key.endswith(".json")
+        and (
+            os.path.basename(key) not in expected
+            or misplaced(key, EAD_PREFIX, document_keys.ead_shard(os.path.basename(key), SHARDS))
+        )
+    ]
+
+
+def ead_cache_orphans(cache_keys_found, source_etags):
+    """Return parsed-EAD cache entries that no current source (or cache version) refers to."""
+    expected = {ead_cache.cache_key(EAD_CACHE_PREFIX, etag) for etag in source_etags}
+    return [key for key in cache_keys_found if key not in expected]
+
+
+def keep_removed_manifests(plan, removed):
+    """Put manifests whose removal was refused back into the plan's pending state.
+
+    The pending state replaces the current one after the run, so without them the
+    next run would no longer see these manifests as removed and their documents
+    would never be deleted.
+    """
+
+    def read_state(key):
+        try:
+            body = s3.get_object(Bucket=plan["Bucket"], Key=key)["Body"].read()
+        except s3.exceptions.NoSuchKey:
+            return {}
+        return json.loads(gzip.decompress(body))["manifests"]
+
+    current, pending = read_state(plan["StateKey"]), read_state(plan["PendingStateKey"])
+    for uri in removed:
+        if uri in current:
+            pending.setdefault(uri, current[uri])
+    body = gzip.compress(json.dumps({"manifests": pending}, separators=(",", ":")).encode("utf-8"))
+    s3.put_object(Bucket=plan["Bucket"], Key=plan["PendingStateKey"], Body=body, ContentType="application/gzip")
+
+
+def delete_keys(keys):
+    """Delete keys from the destination bucket in batches; returns the number deleted."""
+    deleted = 0
+    for start in range(0, len(keys), 1000):
+        batch = keys[start : start + 1000]
+        response = s3.delete_objects(
+            Bucket=DEST_BUCKET, Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True}
+        )
+        errors = response.get("Errors", [])
+        for error in errors:
+            print(f"Failed to delete {error.get('Key')}: {error.get('Message')}")
+        deleted += len(batch) - len(errors)
+    return deleted
+
+
+def handler(event, _context):
+    print(f"Reconciling documents: {event}")
+
+    workflow_type = event.get("workflowType")
+    source = event.get("s3") or {}
+    plan = event.get("plan") or {}
+    cache_orphans = []
+
+    if workflow_type == "iiif" and plan.get("RemovalsKey") and not plan.get("full"):
+        # Incremental run: only the manifests the planning step saw disappear are looked up,
+        # and the deletion limit applies to the share of manifests removed
+        removed = read_manifest_uris(plan["Bucket"], plan["RemovalsKey"])
+        expected_count, existing_count = plan["total"], plan["previous"]
+        orphans = removed_iiif_documents(removed)
+        removed_count = len(removed)
+    elif workflow_type == "iiif":
+        expected = read_manifest_uris(source["Bucket"], source["Key"])
+        existing = [item["Key"] for item in list_objects(DEST_BUCKET, IIIF_PREFIX)]
+        orphans = iiif_orphans(existing, expected, partial=bool(plan.get("partial")))
+        expected_count, existing_count, removed_count = len(expected), len(existing), len(orphans)
+    elif workflow_type == "ead":
+        sources = [
+            item for item in list_objects(source["Bucket"], source.get("Prefix", "")) if item["Key"].endswith(".xml")
+        ]
+        expected = {item["Key"] for item in sources}
+        existing = [item["Key"] for item in list_objects(DEST_BUCKET, EAD_PREFIX)]
+        orphans = ead_orphans(existing, expected)
+        cached = [item["Key"] for item in list_objects(DEST_BUCKET, EAD_CACHE_PREFIX)]
+        cache_orphans = ead_cache_orphans(cached, [item["ETag"] for item in sources])
+        expected_count, existing_count, removed_count = len(expected), len(existing), len(orphans)
+    else:
+        raise ValueError(f"Unknown workflow type: {workflow_type}")
+
+    # An empty or truncated source listing would otherwise wipe the knowledge base
+    skipped = None
+    if existing_count and removed_count / existing_count > MAX_DELETE_FRACTION and not event.get("force"):
+        skipped = (
+            f"{removed_count} of {existing_count} documents would be deleted, "
+            f"more than the {MAX_DELETE_FRACTION:.0%} limit; rerun with force to apply"
+        )
+        print(f"Skipping document deletion: {skipped}")
+        # The same listing decides which parsed EAD intermediates are stale
+        orphans = cache_orphans = []
+        if workflow_type == "iiif" and plan.get("RemovalsKey"):
+            keep_removed_manifests(plan, read_manifest_uris(plan["Bucket"], plan["RemovalsKey"]))
+
+    deleted = 0 if DRY_RUN else delete_keys(orphans + cache_orphans)
+    report = {
+        "workflowType": workflow_type,
+        "expected": expected_count,
+        "existing": existing_count,
+        "orphans": len(orphans),
+        "cacheOrphans": len(cache_orphans),
+        "deleted": deleted,
+        "dryRun": DRY_RUN,
+        "skipped": skipped,
+    }
+    telemetry.emit_metrics(
+        {
+            "ExpectedDocuments": expected_count,
+            "ExistingDocuments": existing_count,
+            "OrphanDocuments": len(orphans),
+            "CacheOrphans": len(cache_orphans),
+            "DeletedObjects": deleted,
+        },
+        dimensions={"Function": "ReconcileDocuments"},
+        properties={"WorkflowType": workflow_type},
+    )
+    print(f"Reconciliation complete: {report}")
+    return report
@@ -0,0 +1,212 @@
+"""Write a report of a finished ingestion run to S3.
+
+Runs once the knowledge base ingestion job has reached a terminal state. The
+report covers the whole pipeline, so tuning changes can be measured end to end:
+
+* the time spent in each state, from the execution history
+* items, failures and items/sec for each Distributed Map run
+* documents scanned, indexed and failed by each data source's ingestion job,
+  and its docs/sec
+* bytes under the data source prefix, and how many of them this run wrote
+
+``changes_handler`` runs before ingestion and picks the data sources to ingest:
+those of the sources the run processed or, in incremental mode, just those it
+wrote or deleted documents in, so unchanged partitions aren't scanned at all.
+"""
+
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import boto3
+from shared import telemetry
+
+DEST_BUCKET = os.environ["DEST_BUCKET"]
+DATA_PREFIX = os.environ.get("DATA_PREFIX", "data/")
+REPORT_PREFIX = os.environ.get("REPORT_PREFIX", "reports/")
+
+s3 = boto3.client("s3")
+sfn = boto3.client("stepfunctions")
+
+# Map item counts summed across the run's map runs (several in adaptive concurrency mode)
+ITEM_COUNTS = ("total", "succeeded", "failed", "timedOut", "aborted")
+
+
+def parse_time(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+
+
+def seconds_between(start, stop):
+    start, stop = parse_time(start), parse_time(stop)
+    return round((stop - start).total_seconds(), 3) if start and stop else None
+
+
+def execution_events(execution_arn):
+    paginator = sfn.get_paginator("get_execution_history")
+    for page in paginator.paginate(executionArn=execution_arn, includeExecutionData=False):
+        yield from page["events"]
+
+
+def stage_durations(events):
+    """Seconds spent in each state, summed over every time it was entered (waves, polling)."""
+    entered = {}
+    durations = defaultdict(float)
+    map_run_arns = []
+    for event in events:
+        if event["type"].endswith("StateEntered"):
+            entered[event["stateEnteredEventDetails"]["name"]] = event["timestamp"]
+        elif event["type"].endswith("StateExited"):
+            name = event["stateExitedEventDetails"]["name"]
+            if name in entered:
+                durations[name] += seconds_between(entered.pop(name), event["timestamp"])
+        elif event["type"] == "MapRunStarted":
+            map_run_arns.append(event["mapRunStartedEventDetails"]["mapRunArn"])
+    return {name: round(seconds, 3) for name, seconds in durations.items()}, map_run_arns
+
+
+def map_run_summary(map_run_arns):
+    counts = dict.fromkeys(ITEM_COUNTS, 0)
+    seconds = 0.0
+    for arn in map_run_arns:
+        run = sfn.describe_map_run(mapRunArn=arn)
+        for name in ITEM_COUNTS:
+            counts[name] += run["itemCounts"].get(name, 0)
+        seconds += seconds_between(run["startDate"], run.get("stopDate") or datetime.now(timezone.utc)) or 0
+    return {
+        "runs": len(map_run_arns),
+        "items": counts,
+        "seconds": round(seconds, 3),
+        "items_per_second": round(counts["succeeded"] / seconds, 3) if seconds else None,
+    }
+
+
+def data_objects():
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=DEST_BUCKET, Prefix=DATA_PREFIX):
+        yield from page.get("Contents", [])
+
+
+def data_bytes(since):
+    """Return ``(total, written since)`` bytes of the documents under the data source prefix."""
+    total = written = 0
+    for item in data_objects():
+        total += item["Size"]
+        if item["LastModified"] >= since:
+            written += item["Size"]
+    return total, written
+
+
+def ingestion_summary(job, source_type=None):
+    statistics = job.get("Statistics", {})
+    seconds = seconds_between(job.get("StartedAt"), job.get("UpdatedAt"))
+    scanned = statistics.get("NumberOfDocumentsScanned", 0)
+    return {
+        "type": source_type,
+        "data_source_id": job.get("DataSourceId"),
+        "job_id": job.get("IngestionJobId"),
+        "status": job.get("Status"),
+        "failure_reasons": job.get("FailureReasons", []),
+        "seconds": seconds,
+        "documents": {
+            "scanned": scanned,
+            "new_indexed": statistics.get("NumberOfNewDocumentsIndexed", 0),
+            "modified_indexed": statistics.get("NumberOfModifiedDocumentsIndexed", 0),
+            "deleted": statistics.get("NumberOfDocumentsDeleted", 0),
+            "failed": statistics.get("NumberOfDocumentsFailed", 0),
+        },
+        "documents_per_second": round(scanned / seconds, 3) if seconds else None,
+    }
+
+
+def overall_status(ingestion):
+    """COMPLETE if every data source's job completed, otherwise the first other status."""
+    return next((job["status"] for job in ingestion if job["status"] != "COMPLETE"), "COMPLETE")
+
+
+def handler(event, _context):
+    execution_arn = event["executionArn"]
+    started = parse_time(event["startTime"])
+    finished = datetime.now(timezone.utc)
+
+    stages, map_run_arns = stage_durations(execution_events(execution_arn))
+    maps = map_run_summary(map_run_arns)
+    # One ingestion job per changed data source, run at the same time
+    ingestion = [ingestion_summary(job["IngestionJob"], job.get("type")) for job in event["ingestion"]]
+    status = overall_status(ingestion)
+    total_bytes, written_bytes = data_bytes(started)
+    report = {
+        "execution": execution_arn,
+        "workflowType": event.get("workflowType"),
+        "started": started.isoformat(),
+        "finished": finished.isoformat(),
+        "seconds": seconds_between(started, finished),
+        "stages": stages,
+        "maps": maps,
+        "ingestion": ingestion,
+        "bytes": {"data_source": total_bytes, "written": written_bytes},
+    }
+
+    key = f"{REPORT_PREFIX}{execution_arn.rsplit(':', 1)[-1]}.json"
+    s3.put_object(
+        Bucket=DEST_BUCKET, Key=key, Body=json.dumps(report, indent=2).encode("utf-8"), ContentType="application/json"
+    )
+    telemetry.emit_metrics(
+        {
+            "RunTime": (report["seconds"], "Seconds"),
+            "IngestionTime": (max((job["seconds"] or 0 for job in ingestion), default=0), "Seconds"),
+            "MapItemsPerSecond": maps["items_per_second"] or 0,
+            "DocumentsScanned": sum(job["documents"]["scanned"] for job in ingestion),
+            "DocumentsFailed": sum(job["documents"]["failed"] for job in ingestion),
+            "BytesWritten": (written_bytes, "Bytes"),
+        },
+        dimensions={"Function": "RunReport", "Workflow": str(event.get("workflowType"))},
+        properties={"Report": f"s3://{DEST_BUCKET}/{key}", "IngestionStatus": status},
+    )
+    print(f"Wrote run report to s3://{DEST_BUCKET}/{key}: {json.dumps(report, default=str)}")
+    return {"Bucket": DEST_BUCKET, "Key": key, "status": status}
+
+
+def changes_handler(event, _context):
+    """Count the documents written since the execution started, and those reconciliation deleted, per data source.
+
+    Returns the counts and the data sources to ingest.
+    """
+    since = parse_time(event["startTime"])
+    workflow_type = event.get("workflowType", "all")
+    data_sources = [
+        source for source in event.get("dataSources", []) if workflow_type == "all" or source["type"] == workflow_type
+    ]
+    # Written per data source (a type has one per shard); deletions are only known per type
+    written = dict.fromkeys((source["prefix"] for source in data_sources), 0)
+    deleted = dict.fromkeys((source["type"] for source in data_sources), 0)
+
+    for item in data_objects():
+        if item["LastModified"] >= since:
+            for prefix in written:
+                if item["Key"].startswith(prefix):
+                    written[prefix] += 1
+
+    # One reconciliation report, or one per source when their pipelines ran in parallel
+    reports = event.get("reconciliation") or []
+    if isinstance(reports, dict):
+        reports = [reports]
+    for report in reports:
+        if report and not report.get("dryRun") and report.get("workflowType") in deleted:
+            deleted[report["workflowType"]] += report.get("orphans", 0)
+
+    if event.get("mode") == "incremental":
+        data_sources = [source for source in data_sources if written[source["prefix"]] + deleted[source["type"]]]
+    print(
+        f"{written} documents written and {deleted} deleted since {since.isoformat()}; "
+        f"ingesting {[source['type'] for source in data_sources]}"
+    )
+    total_written, total_deleted = sum(written.values()), sum(deleted.values())
+    return {
+        "written": total_written,
+        "deleted": total_deleted,
+        "count": total_written + total_deleted,
+        "dataSources": data_sources,
+    }
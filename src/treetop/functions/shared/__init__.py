@@ -0,0 +1 @@
+"""Helpers shared by the ingestion Lambda functions (deployed as a Lambda layer)."""
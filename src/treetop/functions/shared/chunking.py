@@ -0,0 +1,141 @@
+"""Token-aware sizing of text records before they are uploaded for embedding.
+
+Token counts are estimated locally, without a model-specific tokenizer. Each
+word or punctuation mark counts as one token, and long words count as several
+sub-word tokens. That is close enough to keep records within the embedding
+budget and to spot degenerate tiny records.
+"""
+
+import math
+import re
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_PATTERN = re.compile(r"(?<=[.!?;])\s+")
+
+# Upper bounds (inclusive) of the histogram buckets reported for record sizes
+HISTOGRAM_BOUNDS = (32, 64, 128, 256, 512, 1024, 2048)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of embedding-model tokens in ``text``."""
+    return sum(max(1, math.ceil(len(piece) / 6)) for piece in _TOKEN_PATTERN.findall(text or ""))
+
+
+def split_text(text: str, max_tokens: int) -> List[str]:
+    """Split text into pieces of at most ``max_tokens``, preferring line then sentence then word boundaries."""
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+
+    candidates = [("\n", text.split("\n")), (" ", _SENTENCE_PATTERN.split(text)), (" ", text.split())]
+    splittable = [candidate for candidate in candidates if len(candidate[1]) > 1]
+    if not splittable:
+        # A single unbreakable run of characters; cut it by character count
+        width = max(1, len(text) * max_tokens // estimate_tokens(text))
+        return [text[i : i + width] for i in range(0, len(text), width)]
+    separator, units = splittable[0]
+
+    pieces: List[str] = []
+
+    current: List[str] = []
+    current_tokens = 0
+    for unit in units:
+        unit_tokens = estimate_tokens(unit)
+        if unit_tokens > max_tokens:
+            if current:
+                pieces.append(separator.join(current))
+                current, current_tokens = [], 0
+            pieces.extend(split_text(unit, max_tokens))
+            continue
+        if current and current_tokens + unit_tokens > max_tokens:
+            pieces.append(separator.join(current))
+            current, current_tokens = [], 0
+        current.append(unit)
+        current_tokens += unit_tokens
+    if current:
+        pieces.append(separator.join(current))
+    return [piece for piece in pieces if piece.strip()]
+
+
+def balance_records(
+    records: Sequence[Dict[str, Any]],
+    *,
+    target_tokens: int,
+    max_tokens: int,
+    min_tokens: int,
+    group_key: Optional[Callable[[Dict[str, Any]], Hashable]] = None,
+    header_lines: int = 0,
+) -> List[Dict[str, Any]]:
+    """Split oversized records and merge runs of tiny sibling records.
+
+    Records are ``{"text": ..., "metadata": {...}}`` dicts. A record over ``max_tokens``
+    is split into parts, and each part repeats the first ``header_lines`` lines of the
+    original text as context. Consecutive records under ``min_tokens`` with the same
+    ``group_key`` are merged until the merged record reaches ``target_tokens``.
+    """
+    balanced: List[Dict[str, Any]] = []
+
+    for record in records:
+        text = record["text"]
+        if estimate_tokens(text) <= max_tokens:
+            balanced.append(record)
+            continue
+
+        lines = text.split("\n")
+        header = "\n".join(lines[:header_lines]) if header_lines else ""
+        body = "\n".join(lines[header_lines:]) if header_lines else text
+        budget = max(1, max_tokens - estimate_tokens(header))
+        parts = split_text(body, budget)
+        for number, part in enumerate(parts, start=1):
+            metadata = dict(record.get("metadata", {}))
+            metadata.update({"part": number, "parts": len(parts)})
+            balanced.append({"text": f"{header}\n{part}" if header else part, "metadata": metadata})
+
+    merged: List[Dict[str, Any]] = []
+    pending: List[Dict[str, Any]] = []
+    pending_tokens = 0
+
+    def flush():
+        nonlocal pending, pending_tokens
+        if len(pending) == 1:
+            merged.append(pending[0])
+        elif pending:
+            metadata = dict(pending[0].get("metadata", {}))
+            metadata["merged_ids"] = [item.get("metadata", {}).get("id") for item in pending]
+            merged.append({"text": "\n\n".join(item["text"] for item in pending), "metadata": metadata})
+        pending, pending_tokens = [], 0
+
+    for record in balanced:
+        tokens = estimate_tokens(record["text"])
+        if tokens >= min_tokens:
+            flush()
+            merged.append(record)
+            continue
+        if pending and (
+            (group_key and group_key(pending[0]) != group_key(record)) or pending_tokens + tokens > target_tokens
+        ):
+            flush()
+        pending.append(record)
+        pending_tokens += tokens
+    flush()
+
+    return merged
+
+
+def size_histogram(token_counts: Sequence[int], bounds: Sequence[int] = HISTOGRAM_BOUNDS) -> Dict[str, int]:
+    """Bucket token counts into ``<=bound`` buckets plus an overflow bucket."""
+    labels = [f"<={bound}" for bound in bounds] + [f">{bounds[-1]}"]
+    histogram = dict.fromkeys(labels, 0)
+    for count in token_counts:
+        histogram[labels[bisect_left(bounds, count)]] += 1
+    return histogram
+
+
+def budgets_from_env(environ: Dict[str, str]) -> Dict[str, int]:
+    """Read the token budgets configured on a function (see ``[chunking]`` in config.toml)."""
+    return {
+        "target_tokens": int(environ.get("CHUNK_TARGET_TOKENS", "200")),
+        "max_tokens": int(environ.get("CHUNK_MAX_TOKENS", "300")),
+        "min_tokens": int(environ.get("CHUNK_MIN_TOKENS", "40")),
+    }
@@ -0,0 +1,58 @@
+"""Names of the documents written under the knowledge base's ``data/`` prefix.
+
+The writers (IIIF manifest fetch, EAD processing) and the reconciliation step
+both use these, so a document can always be traced back to its source.
+
+With ingestion sharding, each type's documents are spread over ``shard-NN/``
+directories by a hash of the document, one knowledge base data source each.
+"""
+
+import hashlib
+import os
+import re
+from typing import Optional
+
+# Per-canvas documents written by annotation harvesting: <manifest hash>-canvas-00001.txt
+_IIIF_NAME_PATTERN = re.compile(r"^(?P<hash>[0-9a-f]{64})(?:-canvas-\d+)?\.txt$")
+
+
+def iiif_uri_hash(uri: str) -> str:
+    return hashlib.sha256(uri.encode("utf-8")).hexdigest()
+
+
+def iiif_document_name(uri: str) -> str:
+    """Return the document name for a IIIF manifest: the SHA-256 of its URI."""
+    return f"{iiif_uri_hash(uri)}.txt"
+
+
+def iiif_canvas_document_name(uri: str, position: int) -> str:
+    """Return the document name for one canvas of a manifest (1-based ``position``)."""
+    return iiif_document_name(uri).replace(".txt", f"-canvas-{position:05d}.txt")
+
+
+def iiif_source_hash(name: str) -> Optional[str]:
+    """Return the manifest URI hash a IIIF document (or canvas document) name was derived from."""
+    match = _IIIF_NAME_PATTERN.match(os.path.basename(name))
+    return match.group("hash") if match else None
+
+
+def ead_document_name(key: str) -> str:
+    """Return the JSON document name written for an EAD source key."""
+    return os.path.basename(key).replace(".xml", ".json")
+
+
+def shard_directory(name_hash: str, shards: int) -> str:
+    """Return the shard directory (``shard-03/``) of a document's hash, or ``""`` when not sharded."""
+    if shards <= 1:
+        return ""
+    return f"shard-{int(name_hash[:8], 16) % shards:02d}/"
+
+
+def iiif_shard(uri_hash: str, shards: int) -> str:
+    """Shard directory of a manifest's documents; its canvas documents share it."""
+    return shard_directory(uri_hash, shards)
+
+
+def ead_shard(name: str, shards: int) -> str:
+    """Shard directory of an EAD document, from the hash of its name."""
+    return shard_directory(hashlib.sha256(name.encode("utf-8")).hexdigest(), shards)
@@ -0,0 +1,76 @@
+"""Compact cache of parsed EAD finding aids.
+
+Parsing XML with eadpy is the most expensive part of EAD processing. The parsed
+collection is flattened to gzipped JSON Lines, one component per line in document
+order with its depth and hierarchy path, and stored keyed by the source object's
+ETag so re-chunking runs can rebuild the tree without touching the XML.
+"""
+
+import gzip
+import json
+from typing import Any, Dict, Iterator
+
+# Bump when the line layout changes so stale cache entries are ignored
+CACHE_VERSION = "v1"
+
+
+def normalize_etag(etag: str) -> str:
+    """Strip the quotes (and weak validator marker) S3 wraps around ETags."""
+    etag = etag.strip()
+    if etag.startswith("W/"):
+        etag = etag[2:]
+    return etag.strip('"')
+
+
+def cache_key(prefix: str, etag: str) -> str:
+    """Return the S3 key of the cached intermediate for a source ETag."""
+    return f"{prefix}{CACHE_VERSION}/{normalize_etag(etag)}.jsonl.gz"
+
+
+def iter_components(collection: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Yield every component of a parsed collection (root first) without its children."""
+    stack = [(collection, 0, [])]
+    while stack:
+        node, depth, path = stack.pop()
+        line = {key: value for key, value in node.items() if key != "components"}
+        line["depth"] = depth
+        line["path"] = path + [node.get("title") or ""]
+        yield line
+        children = node.get("components") or []
+        # Push in reverse so children come out in document order
+        for child in reversed(children):
+            stack.append((child, depth + 1, line["path"]))
+
+
+def dumps(collection: Dict[str, Any]) -> bytes:
+    """Serialize a parsed collection to gzipped JSON Lines."""
+    lines = (json.dumps(line, ensure_ascii=False, separators=(",", ":")) for line in iter_components(collection))
+    return gzip.compress("\n".join(lines).encode("utf-8"))
+
+
+def loads(data: bytes) -> Dict[str, Any]:
+    """Rebuild the nested collection dictionary produced by ``eadpy.Ead.parse``.
+
+    Childless components come back with an empty ``components`` list.
+    """
+    root = None
+    ancestors = []
+    for raw in gzip.decompress(data).decode("utf-8").splitlines():
+        if not raw:
+            continue
+        node = json.loads(raw)
+        depth = node.pop("depth")
+        node.pop("path", None)
+        # Every node gets a component list: eadpy leaves it out of childless components, and
+        # its chunking treats a missing list and an empty one alike
+        node["components"] = []
+        if depth == 0:
+            root = node
+            ancestors = [root]
+            continue
+        del ancestors[depth:]
+        ancestors[-1]["components"].append(node)
+        ancestors.append(node)
+    if root is None:
+        raise ValueError("Parsed EAD cache entry is empty")
+    return root
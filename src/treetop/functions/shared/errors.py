@@ -0,0 +1,61 @@
+"""Typed errors raised by the ingestion handlers.
+
+Step Functions matches a Lambda error by the exception's class name, so the map
+states retry ``RetryableError`` with backoff and count ``PermanentError`` (and
+retries that run out) towards their tolerated failure percentage.
+"""
+
+from typing import Optional
+
+# AWS error codes for throttling and server-side trouble worth retrying
+RETRYABLE_AWS_CODES = frozenset(
+    {
+        "InternalError",
+        "RequestLimitExceeded",
+        "RequestTimeout",
+        "ServiceUnavailable",
+        "SlowDown",
+        "Throttling",
+        "ThrottlingException",
+        "TooManyRequestsException",
+    }
+)
+# botocore's connection-level exceptions, matched by name so this module stays stdlib-only
+_RETRYABLE_EXCEPTION_NAMES = frozenset(
+    {"ConnectionClosedError", "ConnectTimeoutError", "EndpointConnectionError", "ReadTimeoutError"}
+)
+RETRYABLE_HTTP_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class RetryableError(Exception):
+    """A transient failure (throttling, 5xx, network); the item is retried."""
+
+
+class PermanentError(Exception):
+    """A failure retrying won't fix (bad input, unparseable or missing source)."""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """True for throttling, server and connection errors from AWS SDK calls."""
+    if isinstance(exc, RetryableError):
+        return True
+    if isinstance(exc, (ConnectionError, TimeoutError)) or type(exc).__name__ in _RETRYABLE_EXCEPTION_NAMES:
+        return True
+    response = getattr(exc, "response", None)
+    if isinstance(response, dict):
+        code = response.get("Error", {}).get("Code")
+        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        return code in RETRYABLE_AWS_CODES or status in RETRYABLE_HTTP_STATUSES
+    return False
+
+
+def is_retryable_status(status: Optional[int]) -> bool:
+    return status in RETRYABLE_HTTP_STATUSES
+
+
+def classify(exc: BaseException, message: str) -> Exception:
+    """Wrap ``exc`` in the typed error to raise from a handler."""
+    if isinstance(exc, (RetryableError, PermanentError)):
+        return exc
+    error_type = RetryableError if is_retryable(exc) else PermanentError
+    return error_type(f"{message}: {exc}")
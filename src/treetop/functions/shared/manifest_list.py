@@ -0,0 +1,67 @@
+"""The crawler's manifest list and the lists derived from it.
+
+The crawler writes either ``manifests.csv`` (one URI per line, no header) or
+``manifests.jsonl`` (one object per line with ``uri``, ``label``, ``navDate``
+and ``id_hash``). The planning step writes the rows to process this run to
+``manifests.delta.<ext>``, in the same format, and the URIs that dropped out of
+the collection to ``manifests.removed.csv``. Manifests whose batches failed in
+the map are listed in ``manifests.failed.csv``. Next to its list the crawler
+writes ``manifests.status.json``, whose ``complete`` is false when collections
+failed to load, so manifests missing from the list can't be taken for removed.
+"""
+
+import hashlib
+import json
+from typing import Iterator, Optional, Tuple
+
+# Row fields that only identify the manifest, so don't count as changes
+_IDENTITY_FIELDS = ("uri", "id_hash")
+
+
+def is_jsonl(key: str) -> bool:
+    return key.endswith(".jsonl")
+
+
+def delta_key(key: str) -> str:
+    """``manifests.csv`` -> ``manifests.delta.csv`` (and likewise for JSONL)."""
+    stem, _, extension = key.rpartition(".")
+    return f"{stem}.delta.{extension}"
+
+
+def removals_key(key: str) -> str:
+    """``manifests.csv`` -> ``manifests.removed.csv``; removals are always plain URI lists."""
+    return f"{key.rpartition('.')[0]}.removed.csv"
+
+
+def failures_key(key: str) -> str:
+    """``manifests.csv`` -> ``manifests.failed.csv``."""
+    return f"{key.rpartition('.')[0]}.failed.csv"
+
+
+def status_key(key: str) -> str:
+    """``manifests.csv`` -> ``manifests.status.json``."""
+    return f"{key.rpartition('.')[0]}.status.json"
+
+
+def row_fingerprint(row: dict) -> str:
+    """Hash of the descriptive fields a collection lists for a manifest (label, navDate)."""
+    fields = {key: value for key, value in row.items() if key not in _IDENTITY_FIELDS}
+    if not any(value is not None for value in fields.values()):
+        return ""
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def parse_rows(body: str, jsonl: bool) -> Iterator[Tuple[str, str, Optional[str]]]:
+    """Yield ``(uri, line, fingerprint)`` for each row of a manifest list.
+
+    CSV rows carry no descriptive fields, so their fingerprint is ``None``.
+    """
+    for line in body.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if jsonl:
+            row = json.loads(line)
+            yield row["uri"], line, row_fingerprint(row)
+        else:
+            yield line, line, None
@@ -0,0 +1,207 @@
+"""Per-host politeness for functions that fetch from institutional servers.
+
+Three pieces work together:
+
+* ``AimdController`` adapts how many requests one invocation keeps in flight.
+  It adds a little after every success and halves after a throttle (a 429 or
+  503 response).
+* A token store shares a per-host request budget and ``Retry-After`` blocks
+  between concurrent invocations. ``LocalTokenStore`` keeps that state in memory,
+  for a single process and for tests. ``DynamoTokenStore`` keeps it in a DynamoDB
+  table so every invocation of a Distributed Map sees the same budget.
+* ``retry_delay`` picks a jittered backoff that never undercuts ``Retry-After``,
+  and gives up on servers that ask for a longer wait than the caller can afford.
+"""
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+
+class AimdController:
+    """Additive-increase/multiplicative-decrease concurrency limit.
+
+    The limit grows by roughly ``increase`` for every full window of successful
+    requests and is multiplied by ``decrease`` on a throttle. Throttles within
+    ``cooldown`` seconds of the last decrease are ignored, because requests that
+    were already in flight report the same overload.
+    """
+
+    def __init__(
+        self,
+        initial: float,
+        minimum: float = 1,
+        maximum: Optional[float] = None,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        cooldown: float = 1.0,
+    ) -> None:
+        self.minimum = minimum
+        self.maximum = maximum if maximum is not None else initial
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.value = min(max(initial, minimum), self.maximum)
+        self._last_decrease = float("-inf")
+
+    @property
+    def limit(self) -> int:
+        """The current limit as a whole number of concurrent requests."""
+        return max(1, int(self.value))
+
+    def on_success(self) -> None:
+        self.value = min(self.maximum, self.value + self.increase / self.value)
+
+    def on_throttle(self, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.value = max(self.minimum, self.value * self.decrease)
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Return the delay in seconds requested by a ``Retry-After`` header, or None if absent or malformed."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    now = time.time() if now is None else now
+    return max(0.0, retry_at - now)
+
+
+def retry_delay(
+    attempt: int,
+    base: float = 0.5,
+    cap: float = 30.0,
+    retry_after: Optional[float] = None,
+    rng: random.Random = random,
+    max_retry_after: Optional[float] = None,
+) -> Optional[float]:
+    """Full-jitter exponential backoff for ``attempt`` (0-based), never shorter than ``retry_after``.
+
+    Returns None when ``retry_after`` exceeds ``max_retry_after``: waiting that long would outlast
+    the invocation, so the caller should give up and leave the retry to a later one.
+    """
+    if retry_after is not None and max_retry_after is not None and retry_after > max_retry_after:
+        return None
+    delay = rng.uniform(0, min(cap, base * 2**attempt))
+    if retry_after is not None:
+        # Add a little jitter on top so waiting clients don't all return at the same instant
+        delay = retry_after + rng.uniform(0, base)
+    return delay
+
+
+class LocalTokenStore:
+    """In-memory token buckets keyed by host (a single-process stand-in for ``DynamoTokenStore``)."""
+
+    def __init__(self) -> None:
+        self._buckets: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, rate: float, burst: float, now: Optional[float] = None) -> float:
+        """Take one token for ``key``; returns 0 on success or the seconds to wait before trying again.
+
+        A ``rate`` of 0 disables the request budget, but ``block`` still applies.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            bucket = self._buckets.setdefault(key, {"tokens": burst, "updated": now, "blocked_until": 0.0})
+            wait, bucket["tokens"] = _take_token(bucket, rate, burst, now)
+            bucket["updated"] = now
+            return wait
+
+    def block(self, key: str, until: float) -> None:
+        """Stop handing out tokens for ``key`` until the epoch time ``until``."""
+        with self._lock:
+            bucket = self._buckets.setdefault(key, {"tokens": 0.0, "updated": until, "blocked_until": 0.0})
+            bucket["blocked_until"] = max(bucket["blocked_until"], until)
+
+
+class DynamoTokenStore:
+    """Token buckets shared across invocations through a DynamoDB table with a ``host`` string key.
+
+    Updates use optimistic concurrency on the ``updated`` attribute. A writer that
+    loses the race reads the item again and retries.
+    """
+
+    def __init__(self, client, table_name: str, max_conflicts: int = 5) -> None:
+        self.client = client
+        self.table_name = table_name
+        self.max_conflicts = max_conflicts
+
+    def _read(self, key: str) -> Optional[Dict[str, float]]:
+        item = self.client.get_item(TableName=self.table_name, Key={"host": {"S": key}}, ConsistentRead=True).get(
+            "Item"
+        )
+        if not item:
+            return None
+        return {name: float(item[name]["N"]) for name in ("tokens", "updated", "blocked_until") if name in item}
+
+    def _write(self, key: str, tokens: float, updated: float, previous: Optional[Dict[str, float]]) -> bool:
+        # Only the token fields are set, so a concurrent block() keeps its blocked_until
+        values = {":tokens": {"N": repr(tokens)}, ":updated": {"N": repr(updated)}}
+        if previous is None or "updated" not in previous:
+            condition = "attribute_not_exists(updated)"
+        else:
+            condition = "updated = :previous"
+            values[":previous"] = {"N": repr(previous["updated"])}
+        try:
+            self.client.update_item(
+                TableName=self.table_name,
+                Key={"host": {"S": key}},
+                UpdateExpression="SET tokens = :tokens, updated = :updated",
+                ConditionExpression=condition,
+                ExpressionAttributeValues=values,
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def acquire(self, key: str, rate: float, burst: float, now: Optional[float] = None) -> float:
+        """Take one token for ``key``; returns 0 on success or the seconds to wait before trying again."""
+        for _ in range(self.max_conflicts):
+            current = time.time() if now is None else now
+            previous = self._read(key)
+            bucket = {"tokens": burst, "updated": current, "blocked_until": 0.0, **(previous or {})}
+            wait, tokens = _take_token(bucket, rate, burst, current)
+            if wait or not rate:
+                # Without a request budget only blocks are shared, so there is nothing to write
+                return wait
+            if self._write(key, tokens, current, previous):
+                return 0.0
+        # Heavy contention on this host; back off briefly rather than spinning on the table
+        return 1.0 / rate if rate else 0.1
+
+    def block(self, key: str, until: float) -> None:
+        """Stop handing out tokens for ``key`` until the epoch time ``until``."""
+        try:
+            self.client.update_item(
+                TableName=self.table_name,
+                Key={"host": {"S": key}},
+                UpdateExpression="SET blocked_until = :until",
+                ConditionExpression="attribute_not_exists(blocked_until) OR blocked_until < :until",
+                ExpressionAttributeValues={":until": {"N": repr(until)}},
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            # Another invocation already set a later block
+            pass
+
+
+def _take_token(bucket: Dict[str, float], rate: float, burst: float, now: float):
+    """Refill ``bucket`` up to ``now`` and try to take a token; returns ``(wait_seconds, remaining_tokens)``."""
+    if now < bucket["blocked_until"]:
+        return bucket["blocked_until"] - now, bucket["tokens"]
+    if not rate:
+        return 0.0, bucket["tokens"]
+    tokens = min(burst, bucket["tokens"] + max(0.0, now - bucket["updated"]) * rate)
+    if tokens < 1:
+        return (1 - tokens) / rate, tokens
+    return 0.0, tokens - 1
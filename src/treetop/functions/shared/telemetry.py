@@ -0,0 +1,54 @@
+"""CloudWatch embedded metric format (EMF) helpers.
+
+Lambda forwards stdout to CloudWatch Logs, which extracts metrics from any log
+line shaped as an EMF document. This avoids PutMetricData calls on the hot path.
+"""
+
+import json
+import time
+from typing import Any, Dict, Optional, Tuple, Union
+
+NAMESPACE = "Treetop/Ingestion"
+
+MetricValue = Union[float, int, Tuple[Union[float, int], str]]
+
+
+def metric_document(
+    metrics: Dict[str, MetricValue],
+    dimensions: Optional[Dict[str, str]] = None,
+    properties: Optional[Dict[str, Any]] = None,
+    namespace: str = NAMESPACE,
+) -> Dict[str, Any]:
+    """Build an EMF document.
+
+    Metric values are either a number (unit "None") or a ``(value, unit)`` tuple.
+    Properties are logged alongside the metrics without becoming dimensions.
+    """
+    dimensions = dimensions or {}
+    definitions = []
+    document: Dict[str, Any] = dict(properties or {})
+    document.update(dimensions)
+    for name, value in metrics.items():
+        value, unit = value if isinstance(value, tuple) else (value, "None")
+        definitions.append({"Name": name, "Unit": unit})
+        document[name] = value
+
+    document["_aws"] = {
+        "Timestamp": int(time.time() * 1000),
+        "CloudWatchMetrics": [
+            {"Namespace": namespace, "Dimensions": [list(dimensions.keys())], "Metrics": definitions}
+        ],
+    }
+    return document
+
+
+def emit_metrics(
+    metrics: Dict[str, MetricValue],
+    dimensions: Optional[Dict[str, str]] = None,
+    properties: Optional[Dict[str, Any]] = None,
+    namespace: str = NAMESPACE,
+) -> Dict[str, Any]:
+    """Print an EMF document to stdout and return it."""
+    document = metric_document(metrics, dimensions, properties, namespace)
+    print(json.dumps(document, default=str))
+    return document
@@ -112,8 +112,14 @@ def handler(event, context):
             "body": json.dumps({"error": "Configuration error: missing knowledge base or data source ID"}),
         }
 
-    # Get ingestion job statuses by calling the updated function.
-    jobs = get_ingestion_jobs_status(knowledge_base_id, data_source_id)
+    # Get ingestion job statuses by calling the updated function. There is a data source per source
+    # type, listed comma separated.
+    jobs = []
+    for source_id in data_source_id.split(","):
+        jobs.extend(
+            {**job, "dataSourceId": source_id} for job in get_ingestion_jobs_status(knowledge_base_id, source_id)
+        )
+    jobs.sort(key=lambda job: job.get("startedAt") or "", reverse=True)
 
     # Prepare response
     response_data = {
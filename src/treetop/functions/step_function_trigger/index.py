@@ -7,42 +7,73 @@ import boto3
 sfn = boto3.client("stepfunctions")
 
 
+def running_executions(state_machine_arn):
+    """Return the names of the state machine's executions that are still running."""
+    response = sfn.list_executions(stateMachineArn=state_machine_arn, statusFilter="RUNNING", maxResults=10)
+    return [execution["name"] for execution in response.get("executions", [])]
+
+
+def source_input(workflow_type):
+    """The execution input fields of one source."""
+    source = {"s3": {"Bucket": os.environ["BUCKET"]}, "workflowType": workflow_type}
+    if workflow_type == "iiif":
+        # For IIIF workflow, we need the collection URL
+        source["collection_url"] = os.environ["SOURCE_COLLECTION"]
+        source["s3"]["Key"] = os.environ.get("COLLECTION_FILENAME", "manifests.csv")
+    elif workflow_type == "ead":
+        # For EAD workflow, we need the prefix where EAD XML files are stored
+        source["s3"]["Prefix"] = os.environ["SOURCE_PREFIX"]
+        source["s3"]["Bucket"] = os.environ["SOURCE_BUCKET"]
+    return source
+
+
 def handler(event, context):
     print(f"Event: {event}")
 
-    # Get environment variables
-    workflow_type = os.environ.get("WORKFLOW_TYPE", "iiif")
+    # Get environment variables; a stack with several sources lists them all
+    workflow_types = os.environ.get("WORKFLOW_TYPE", "iiif").split(",")
+    workflow_type = workflow_types[0] if len(workflow_types) == 1 else "all"
 
     # Allow overriding workflow type from the event
     if event and isinstance(event, dict) and "workflowType" in event:
         workflow_type = event["workflowType"]
 
+    # "incremental" (scheduled runs) skips unchanged inputs and ingests only if something changed
+    mode = event.get("mode", "full") if isinstance(event, dict) else "full"
+
+    # Overlapping runs would fight over the same data source
+    state_machine_arn = os.environ["STATE_MACHINE_ARN"]
+    running = running_executions(state_machine_arn)
+    if running:
+        print(f"Not starting a {mode} {workflow_type} run while {', '.join(running)} is still running")
+        return {
+            "statusCode": 409,
+            "body": json.dumps({"message": "Another execution is still running", "running": running}),
+        }
+
     # Debugging logs
-    print(f"Triggering Step Function with workflow type: {workflow_type}")
+    print(f"Triggering Step Function with workflow type: {workflow_type} ({mode})")
     print(f"Bucket: {os.environ['BUCKET']}")
 
-    # Common parameters
-    execution_input = {
-        "s3": {"Bucket": os.environ["BUCKET"]},
-        "workflowType": workflow_type,
-    }
-
-    # Add workflow-specific parameters
-    if workflow_type == "iiif":
-        # For IIIF workflow, we need the collection URL
-        execution_input["collection_url"] = os.environ["SOURCE_COLLECTION"]
-        execution_input["s3"]["Key"] = os.environ.get("COLLECTION_FILENAME", "manifests.csv")
-    elif workflow_type == "ead":
-        # For EAD workflow, we need the prefix where EAD XML files are stored
-        execution_input["s3"]["Prefix"] = os.environ["SOURCE_PREFIX"]
-        execution_input["s3"]["Bucket"] = os.environ["SOURCE_BUCKET"]
+    if len(workflow_types) > 1:
+        # The source pipelines run in parallel, each picking its input from "sources"; an overridden
+        # workflow type runs just that source's pipeline
+        selected = workflow_types if workflow_type == "all" else [workflow_type]
+        execution_input = {
+            "s3": {"Bucket": os.environ["BUCKET"]},
+            "workflowType": workflow_type,
+            "mode": mode,
+            "sources": {source_type: source_input(source_type) for source_type in selected},
+        }
+    else:
+        execution_input = {**source_input(workflow_type), "mode": mode}
 
     # Generate a unique name for this execution
     execution_name = f"{workflow_type}-{uuid.uuid4().hex[:8]}"
 
     # Start the execution
     response = sfn.start_execution(
-        stateMachineArn=os.environ["STATE_MACHINE_ARN"], name=execution_name, input=json.dumps(execution_input)
+        stateMachineArn=state_machine_arn, name=execution_name, input=json.dumps(execution_input)
     )
 
     return {
@@ -1,6 +1,7 @@
 from typing import Optional
 
 from aws_cdk import (
+    Duration,
     Fn,
     RemovalPolicy,
     Stack,
@@ -57,14 +58,20 @@ class TreetopStack(Stack):
             ),
             removal_policy=RemovalPolicy.DESTROY,
             auto_delete_objects=True,
+            # The manifest crawler streams its list as a multipart upload; drop uploads from crawls that never finished
+            lifecycle_rules=[s3.LifecycleRule(abort_incomplete_multipart_upload_after=Duration.days(7))],
         )
 
         # Get ECR configuration from context and data config to determine if ECS is needed
         data_config = self.node.try_get_context("data")
-        workflow_type = data_config.get("type") if data_config else None
+        # [data] is one source, or a list of [[data]] sources run in parallel
+        sources = data_config if isinstance(data_config, list) else [data_config or {}]
+        workflow_types = {source.get("type") for source in sources}
 
+        # A Lambda-only crawler needs no ECS cluster (nor the default VPC it runs in)
+        crawler_config = self.node.try_get_context("crawler") or {}
         ecs_construct = None
-        if workflow_type == "iiif":
+        if "iiif" in workflow_types and crawler_config.get("mode", "auto") != "lambda":
             # Get ECR config with defaults for IIIF workflows
             ecr_config = self.node.try_get_context("ecr")
             if not ecr_config:
@@ -76,7 +83,15 @@ class TreetopStack(Stack):
                 }
 
             ecr_image_uri = f"{ecr_config['registry']}/{ecr_config['repository']}:{ecr_config['tag']}"
-            ecs_construct = EcsConstruct(self, "EcsConstruct", data_bucket=data_bucket, ecr_image=ecr_image_uri)
+            # Fargate size of each crawler task (see [crawler] in config.toml)
+            ecs_construct = EcsConstruct(
+                self,
+                "EcsConstruct",
+                data_bucket=data_bucket,
+                ecr_image=ecr_image_uri,
+                cpu=crawler_config.get("cpu", 256),
+                memory_mib=crawler_config.get("memory", 512),
+            )
 
         # Database construct
         db_config = self.node.try_get_context("database")
@@ -92,6 +107,7 @@ class TreetopStack(Stack):
             db_credentials=database_construct.db_credentials,
             db_initialization=database_construct.db_init4_index,
             db_config=db_config,
+            data_config=data_config,
         )
 
         # Create the Amplify app first so we have the id
@@ -119,7 +135,8 @@ class TreetopStack(Stack):
             allowed_origins=[ui_domain, "localhost:3000"],  # TODO change when custom domain?
             amplify_app=amplify_app,
             knowledge_base_id=knowledge_base_construct.knowledge_base_id,
-            data_source_id=knowledge_base_construct.data_source_id,
+            # The status endpoint lists the ingestion jobs of every data source
+            data_source_id=",".join(knowledge_base_construct.data_source_ids),
         )
 
         # Create the UI
@@ -143,8 +160,7 @@ class TreetopStack(Stack):
             data_bucket=data_bucket,
             data_config=data_config,
             knowledge_base=knowledge_base_construct.knowledge_base,  # Pass the actual construct
-            data_source=knowledge_base_construct.s3_data_source,  # If you expose this
+            data_sources=knowledge_base_construct.data_sources,
             db_cluster=database_construct.db_cluster,  # Pass DB cluster
             knowledge_base_id=knowledge_base_construct.knowledge_base_id,
-            data_source_id=knowledge_base_construct.data_source_id,
         )
@@ -0,0 +1,237 @@
+"""Replay a recorded workload against a deployed function at several memory sizes.
+
+``record`` turns a Distributed Map run's results (its ResultWriter
+``manifest.json``) back into the payloads the map sent to the function, set
+to do the full work of each item: EAD files are parsed in ``full`` mode without
+the parse cache, and IIIF manifests are fetched unconditionally (``force``), so
+an incremental run's 304s and cache hits don't make every size look the same.
+``--as-recorded`` keeps the run's own mode and caches instead. ``run`` then
+sets each memory size in turn, invokes the function with every payload and
+reads billed duration and memory used from the invocation's ``REPORT`` line.
+The original memory size is restored afterwards. It recommends the cheapest
+size whose median duration is within ``--max-slowdown`` of the fastest, as a
+``[performance.<function>]`` table for ``config.toml``.
+
+The replay has the function's real side effects: documents are written again
+(with the same keys and content), EAD parse caches are rebuilt and IIIF sources
+are fetched again.
+Architecture can't change in place. To compare arm64 with x86_64, deploy with
+the other ``architecture`` and run the same workload again.
+
+Example (from the repository root)::
+
+    PYTHONPATH=src python -m treetop.tools.power_tuning record process_ead \\
+        s3://data-bucket/step-function-results/ead-processing/<run>/manifest.json ead.jsonl --limit 200
+    PYTHONPATH=src python -m treetop.tools.power_tuning run process_ead <function name> ead.jsonl \\
+        --memory 256 512 1024 2048
+"""
+
+import argparse
+import base64
+import json
+import re
+import statistics
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+# us-east-1 list prices; pass --gb-second-price for other regions
+GB_SECOND_PRICES = {"x86_64": 0.0000166667, "arm64": 0.0000133334}
+REQUEST_PRICE = 0.0000002
+
+_REPORT_FIELDS = {
+    "duration_ms": r"\tDuration: ([\d.]+) ms",
+    "billed_ms": r"Billed Duration: ([\d.]+) ms",
+    "memory_size": r"Memory Size: (\d+) MB",
+    "max_memory_used": r"Max Memory Used: (\d+) MB",
+    "init_ms": r"Init Duration: ([\d.]+) ms",
+}
+
+
+def ead_payload(item_input, as_recorded=False):
+    payload = {
+        "bucket": item_input["sourceBucket"],
+        "key": item_input["item"]["Key"],
+        "etag": item_input["item"]["ETag"],
+    }
+    if as_recorded:
+        return {**payload, "mode": item_input.get("mode", "full")}
+    return {**payload, "mode": "full", "refresh_cache": True}
+
+
+def iiif_payload(item_input, as_recorded=False):
+    return {"rows": item_input["Items"]} if as_recorded else {"rows": item_input["Items"], "force": True}
+
+
+# How each map's item processor input becomes its function's payload
+PAYLOADS = {"process_ead": ead_payload, "fetch_iiif_manifest": iiif_payload}
+
+
+def split_s3_url(url):
+    bucket, _, key = url[len("s3://") :].partition("/")
+    return bucket, key
+
+
+def read_json(s3, bucket, key):
+    return json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+
+
+def recorded_payloads(s3, function, manifest_url, limit=None, as_recorded=False):
+    """Yield the payloads of a map run's item executions, read from its ResultWriter manifest."""
+    to_payload = PAYLOADS[function]
+    manifest = read_json(s3, *split_s3_url(manifest_url))
+    count = 0
+    for result_files in manifest.get("ResultFiles", {}).values():
+        for result_file in result_files:
+            for execution in read_json(s3, manifest["DestinationBucket"], result_file["Key"]):
+                if limit is not None and count >= limit:
+                    return
+                yield to_payload(json.loads(execution["Input"]), as_recorded)
+                count += 1
+
+
+def parse_report(log_tail):
+    """Return the numbers of an invocation's ``REPORT`` log line."""
+    line = next((line for line in log_tail.splitlines() if line.startswith("REPORT")), "")
+    report = {}
+    for name, pattern in _REPORT_FIELDS.items():
+        match = re.search(pattern, line)
+        if match:
+            report[name] = float(match.group(1))
+    return report
+
+
+def invocation_cost(billed_ms, memory_mb, gb_second_price):
+    return billed_ms / 1000 * memory_mb / 1024 * gb_second_price + REQUEST_PRICE
+
+
+def summarize(memory_mb, invocations, gb_second_price):
+    """Summarise the invocations run at one memory size."""
+    reports = [invocation["report"] for invocation in invocations if "billed_ms" in invocation["report"]]
+    durations = sorted(report["duration_ms"] for report in reports)
+    costs = [invocation_cost(report["billed_ms"], memory_mb, gb_second_price) for report in reports]
+    return {
+        "memory": memory_mb,
+        "invocations": len(invocations),
+        "errors": sum(1 for invocation in invocations if invocation["error"]),
+        "p50_ms": round(statistics.median(durations), 1) if durations else None,
+        "p95_ms": round(durations[int(0.95 * (len(durations) - 1))], 1) if durations else None,
+        "max_memory_used": max((report.get("max_memory_used", 0) for report in reports), default=None),
+        "cost_per_1000": round(statistics.mean(costs) * 1000, 6) if costs else None,
+    }
+
+
+def recommend(summaries, max_slowdown):
+    """The cheapest error-free memory size whose median duration is within ``max_slowdown`` of the fastest."""
+    candidates = [summary for summary in summaries if not summary["errors"] and summary["p50_ms"] is not None]
+    if not candidates:
+        return None
+    fastest = min(summary["p50_ms"] for summary in candidates)
+    return min(
+        (summary for summary in candidates if summary["p50_ms"] <= fastest * max_slowdown),
+        key=lambda summary: (summary["cost_per_1000"], summary["p50_ms"]),
+    )
+
+
+def invoke(lambda_client, function_name, payload):
+    response = lambda_client.invoke(
+        FunctionName=function_name, Payload=json.dumps(payload).encode("utf-8"), LogType="Tail"
+    )
+    log_tail = base64.b64decode(response.get("LogResult", "")).decode("utf-8", errors="replace")
+    return {"error": response.get("FunctionError"), "report": parse_report(log_tail)}
+
+
+def set_memory(lambda_client, function_name, memory_mb):
+    lambda_client.update_function_configuration(FunctionName=function_name, MemorySize=memory_mb)
+    lambda_client.get_waiter("function_updated_v2").wait(FunctionName=function_name)
+
+
+def run_workload(lambda_client, function_name, payloads, memory_sizes, concurrency, warmup, gb_second_price):
+    """Replay the payloads at each memory size; returns one summary per size."""
+    original = lambda_client.get_function_configuration(FunctionName=function_name)["MemorySize"]
+    summaries = []
+    try:
+        for memory_mb in memory_sizes:
+            set_memory(lambda_client, function_name, memory_mb)
+            # The first invocations after an update start cold
+            for payload in payloads[:warmup]:
+                invoke(lambda_client, function_name, payload)
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                invocations = list(
+                    executor.map(lambda payload: invoke(lambda_client, function_name, payload), payloads)
+                )
+            summary = summarize(memory_mb, invocations, gb_second_price)
+            print(json.dumps(summary))
+            summaries.append(summary)
+    finally:
+        set_memory(lambda_client, function_name, original)
+    return summaries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded workload to pick a function's memory size.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record = commands.add_parser("record", help="Write a map run's item payloads to a JSONL workload")
+    record.add_argument("function", choices=sorted(PAYLOADS), help="The [performance] name of the map's function")
+    record.add_argument("manifest", help="s3:// URL of the map run's ResultWriter manifest.json")
+    record.add_argument("workload", help="JSONL file to write")
+    record.add_argument("--limit", type=int, help="Record at most this many payloads")
+    record.add_argument(
+        "--as-recorded", action="store_true", help="Keep the run's mode and caches instead of forcing full work"
+    )
+
+    run = commands.add_parser("run", help="Replay a workload at each memory size and recommend one")
+    run.add_argument("function", help="The [performance] name to recommend settings for, e.g. process_ead")
+    run.add_argument("function_name", help="Deployed function name or ARN")
+    run.add_argument("workload", help="JSONL file of payloads")
+    run.add_argument("--memory", type=int, nargs="+", default=[256, 512, 1024, 1769, 3008], help="Sizes in MB")
+    run.add_argument("--concurrency", type=int, default=4, help="Invocations at the same time")
+    run.add_argument("--warmup", type=int, default=1, help="Invocations discarded after each memory change")
+    run.add_argument("--max-slowdown", type=float, default=1.1, help="Slowdown accepted for a cheaper size")
+    run.add_argument("--gb-second-price", type=float, help="Price per GB-second (default: us-east-1 list price)")
+    run.add_argument("--report", help="Also write the summaries and recommendation to this JSON file")
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        with open(args.workload, "w") as f:
+            count = 0
+            for payload in recorded_payloads(
+                boto3.client("s3"), args.function, args.manifest, args.limit, args.as_recorded
+            ):
+                f.write(json.dumps(payload) + "\n")
+                count += 1
+        print(f"Recorded {count} payloads to {args.workload}")
+        return 0
+
+    with open(args.workload) as f:
+        payloads = [json.loads(line) for line in f if line.strip()]
+    if not payloads:
+        print(f"No payloads in {args.workload}")
+        return 1
+
+    lambda_client = boto3.client("lambda")
+    architecture = lambda_client.get_function_configuration(FunctionName=args.function_name)["Architectures"][0]
+    gb_second_price = args.gb_second_price or GB_SECOND_PRICES[architecture]
+    print(f"Replaying {len(payloads)} payloads on {args.function_name} ({architecture}) at {args.memory} MB")
+    summaries = run_workload(
+        lambda_client, args.function_name, payloads, args.memory, args.concurrency, args.warmup, gb_second_price
+    )
+
+    best = recommend(summaries, args.max_slowdown)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"architecture": architecture, "summaries": summaries, "recommended": best}, f, indent=2)
+    if best is None:
+        print("Every memory size had errors; nothing to recommend")
+        return 1
+    print(
+        f"Recommended: {best['memory']} MB (p50 {best['p50_ms']} ms, ${best['cost_per_1000']} per 1000 invocations)\n"
+        f'\n[performance.{args.function}]\nmemory = {best["memory"]}\narchitecture = "{architecture}"'
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
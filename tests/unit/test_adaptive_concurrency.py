@@ -0,0 +1,98 @@
+"""Unit tests for the adaptive map concurrency controller."""
+
+import importlib
+import io
+import json
+from unittest.mock import Mock
+
+import pytest
+
+
+@pytest.fixture
+def adaptive_mod(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("DEST_BUCKET", "data-bucket")
+    monkeypatch.setenv("WAVE_SIZE", "2")
+    monkeypatch.setenv("MIN_CONCURRENCY", "2")
+    monkeypatch.setenv("MAX_CONCURRENCY", "12")
+    mod = importlib.reload(importlib.import_module("adaptive_concurrency.index"))
+    mod.s3 = Mock()
+    return mod
+
+
+def execution(seconds, status="SUCCEEDED", error=None, throttles=0, start=0):
+    record = {
+        "Status": status,
+        "StartDate": f"2024-05-01T12:00:{start:02d}.000Z",
+        "StopDate": f"2024-05-01T12:00:{start + seconds:02d}.000Z",
+    }
+    if status == "SUCCEEDED":
+        record["Output"] = json.dumps({"Payload": {"throttles": throttles}})
+    else:
+        record["Error"] = error
+    return record
+
+
+def result_objects(mod, records):
+    objects = {
+        "results/manifest.json": {"DestinationBucket": "data-bucket", "ResultFiles": {"SUCCEEDED": [{"Key": "r/0"}]}},
+        "r/0": records,
+    }
+    mod.s3.get_object.side_effect = lambda Bucket, Key: {"Body": io.BytesIO(json.dumps(objects[Key]).encode())}
+
+
+def test_waves_handler_splits_the_manifest_list(adaptive_mod):
+    adaptive_mod.s3.get_object.return_value = {"Body": io.BytesIO(b"a\nb\n\nc\n")}
+
+    waves = adaptive_mod.waves_handler(
+        {"workflow": "iiif", "source": {"Bucket": "data-bucket", "Key": "manifests.delta.csv"}, "concurrency": 20},
+        None,
+    )
+
+    written = {call.kwargs["Key"]: call.kwargs["Body"] for call in adaptive_mod.s3.put_object.call_args_list}
+    assert written == {"waves/iiif/wave-00001.csv": b"a\nb\n", "waves/iiif/wave-00002.csv": b"c\n"}
+    assert (waves["count"], waves["Key"], waves["done"]) == (2, "waves/iiif/wave-00001.csv", False)
+    # The configured concurrency is the starting point, within the bounds
+    assert waves["concurrency"] == 12
+
+
+def test_next_concurrency(adaptive_mod):
+    healthy = {"throttle_rate": 0.0, "error_rate": 0.0, "p50_seconds": 10.0}
+
+    assert adaptive_mod.next_concurrency(4, healthy, None) == (6, True)
+    assert adaptive_mod.next_concurrency(10, healthy, 10.0) == (12, True)
+    assert adaptive_mod.next_concurrency(8, {**healthy, "throttle_rate": 0.1}, 10.0) == (4, False)
+    assert adaptive_mod.next_concurrency(3, {**healthy, "error_rate": 0.5}, 10.0) == (2, False)
+    # Latency well past the first wave's means the source is saturating
+    assert adaptive_mod.next_concurrency(8, {**healthy, "p50_seconds": 20.0}, 10.0) == (6, True)
+
+
+def test_handler_backs_off_after_throttling_and_reports_best_wave(adaptive_mod):
+    waves = {
+        "workflow": "ead",
+        "Prefix": "waves/ead/",
+        "Extension": "jsonl",
+        "count": 3,
+        "index": 0,
+        "concurrency": 4,
+        "settled": 4,
+        "best": None,
+        "baseline_seconds": None,
+        "history": [],
+    }
+    result_objects(adaptive_mod, [execution(2, start=0), execution(2, start=1)])
+    waves = adaptive_mod.handler(
+        {"waves": waves, "resultWriter": {"Bucket": "b", "Key": "results/manifest.json"}}, None
+    )
+
+    assert (waves["concurrency"], waves["settled"], waves["baseline_seconds"]) == (6, 4, 2.0)
+    assert waves["Key"] == "waves/ead/wave-00002.jsonl"
+
+    result_objects(adaptive_mod, [execution(2, throttles=3), execution(3, "FAILED", "Lambda.TooManyRequestsException")])
+    waves = adaptive_mod.handler(
+        {"waves": waves, "resultWriter": {"Bucket": "b", "Key": "results/manifest.json"}}, None
+    )
+
+    assert (waves["concurrency"], waves["settled"], waves["done"]) == (3, 4, False)
+    assert waves["history"][-1]["throttle_rate"] == 1.0
+    assert waves["history"][-1]["error_rate"] == 0.5
@@ -0,0 +1,75 @@
+"""Unit tests for the token-aware chunk analyzer."""
+
+from shared import chunking
+
+
+def record(record_id, text, parent="root"):
+    return {"text": text, "metadata": {"id": record_id, "ancestors": [parent]}}
+
+
+def test_estimate_tokens():
+    assert chunking.estimate_tokens("") == 0
+    assert chunking.estimate_tokens("Box 1 of 2.") == 5
+    # Long words count as several sub-word tokens
+    assert chunking.estimate_tokens("internationalization") == 4
+
+
+def test_split_text_respects_budget():
+    text = "\n".join(f"Line {i} has a handful of words in it." for i in range(50))
+
+    pieces = chunking.split_text(text, 40)
+
+    assert len(pieces) > 1
+    assert all(chunking.estimate_tokens(piece) <= 40 for piece in pieces)
+    assert "\n".join(pieces) == text
+
+
+def test_split_text_without_whitespace():
+    pieces = chunking.split_text("x" * 600, 10)
+
+    assert "".join(pieces) == "x" * 600
+    assert all(chunking.estimate_tokens(piece) <= 10 for piece in pieces)
+
+
+def test_balance_splits_oversized_and_repeats_header():
+    body = " ".join(f"Sentence number {i} is here." for i in range(100))
+    records = [record("big", f"Path: A > B\nTitle: Big\n{body}")]
+
+    balanced = chunking.balance_records(records, target_tokens=50, max_tokens=60, min_tokens=0, header_lines=2)
+
+    assert len(balanced) > 1
+    assert all(item["text"].startswith("Path: A > B\nTitle: Big\n") for item in balanced)
+    assert all(chunking.estimate_tokens(item["text"]) <= 60 for item in balanced)
+    assert [item["metadata"]["part"] for item in balanced] == list(range(1, len(balanced) + 1))
+    assert balanced[0]["metadata"]["id"] == "big"
+
+
+def test_balance_merges_tiny_siblings_only():
+    records = [
+        record("a", "Title: A", parent="s1"),
+        record("b", "Title: B", parent="s1"),
+        record("c", "Title: C", parent="s2"),
+        record("d", " ".join(["word"] * 30), parent="s2"),
+    ]
+
+    balanced = chunking.balance_records(
+        records,
+        target_tokens=100,
+        max_tokens=200,
+        min_tokens=10,
+        group_key=lambda item: tuple(item["metadata"]["ancestors"]),
+    )
+
+    assert [item["metadata"]["id"] for item in balanced] == ["a", "c", "d"]
+    assert balanced[0]["text"] == "Title: A\n\nTitle: B"
+    assert balanced[0]["metadata"]["merged_ids"] == ["a", "b"]
+    assert "merged_ids" not in balanced[1]["metadata"]
+
+
+def test_size_histogram():
+    histogram = chunking.size_histogram([1, 32, 33, 5000])
+
+    assert histogram["<=32"] == 2
+    assert histogram["<=64"] == 1
+    assert histogram[">2048"] == 1
+    assert sum(histogram.values()) == 4
@@ -0,0 +1,120 @@
+"""Unit tests for bulk EAD processing (needs eadpy, as the ead function does)."""
+
+import hashlib
+import importlib
+import io
+import json
+import pathlib
+import sys
+
+import pytest
+from shared import ead_cache
+
+pytest.importorskip("eadpy")
+
+FUNCTION_DIR = pathlib.Path(__file__).parents[2] / "src/treetop/functions/ead"
+
+FINDING_AID = """<?xml version="1.0" encoding="UTF-8"?>
+<ead xmlns="urn:isbn:1-931666-22-9">
+  <eadheader><eadid>test-ead</eadid></eadheader>
+  <archdesc level="collection">
+    <did><unittitle>Papers</unittitle><unitid>MS 1</unitid></did>
+    <dsc>
+      <c01 id="s1" level="series"><did><unittitle>Correspondence</unittitle></did></c01>
+    </dsc>
+  </archdesc>
+</ead>
+"""
+
+
+class FakeS3:
+    """In-memory S3 keeping each object's body and metadata."""
+
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+        class ClientError(Exception):
+            pass
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, Metadata=None, ContentEncoding=None):
+        self.objects[(Bucket, Key)] = {"Body": Body, "Metadata": Metadata or {}, "ContentEncoding": ContentEncoding}
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self.exceptions.NoSuchKey(Key)
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)]["Body"])}
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self.exceptions.ClientError(Key)
+        return {"Metadata": self.objects[(Bucket, Key)]["Metadata"]}
+
+
+@pytest.fixture
+def backfill_mod(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("DEST_BUCKET", "data-bucket")
+    index = importlib.reload(importlib.import_module("ead.index"))
+    # backfill.py imports its sibling as a top-level module, as when run as a script
+    monkeypatch.setitem(sys.modules, "index", index)
+    monkeypatch.syspath_prepend(str(FUNCTION_DIR))
+    monkeypatch.delitem(sys.modules, "backfill", raising=False)
+    mod = importlib.import_module("backfill")
+    mod._s3 = FakeS3()
+    index.s3 = mod._s3
+    return mod
+
+
+@pytest.fixture
+def source(tmp_path):
+    directory = tmp_path / "ead-files"
+    directory.mkdir()
+    (directory / "papers.xml").write_text(FINDING_AID)
+    return directory / "papers.xml"
+
+
+def test_local_output(backfill_mod, source, tmp_path):
+    dest = tmp_path / "out"
+
+    assert backfill_mod.main([str(source.parent), str(dest), "--workers", "1"]) == 0
+
+    document = json.loads((dest / "data/ead/papers.json").read_text())
+    assert document and all("text" in record for record in document)
+    etag = hashlib.md5(source.read_bytes()).hexdigest()
+    cached = ead_cache.loads((dest / ead_cache.cache_key("cache/ead/", etag)).read_bytes())
+    assert cached["title"] == "Papers"
+
+
+def test_s3_output_records_document_metadata(backfill_mod, source):
+    summary = backfill_mod.process_source(str(source), "s3://data-bucket", "data/ead/", "cache/ead/", rechunk=False)
+
+    objects = backfill_mod._s3.objects
+    etag = hashlib.md5(source.read_bytes()).hexdigest()
+    document = objects[("data-bucket", "data/ead/papers.json")]
+    assert document["Metadata"] == backfill_mod.index.document_metadata(etag)
+    cache = objects[("data-bucket", ead_cache.cache_key("cache/ead/", etag))]
+    assert (cache["ContentEncoding"], cache["Metadata"]) == ("gzip", {"source": str(source)})
+    assert summary["chunks"] == len(json.loads(document["Body"]))
+
+    # Re-chunking reads the cached parse and records the same metadata
+    rechunked = backfill_mod.process_source(str(source), "s3://data-bucket", "data/ead/", "cache/ead/", rechunk=True)
+    assert rechunked["cached"] is True
+    assert objects[("data-bucket", "data/ead/papers.json")]["Metadata"] == document["Metadata"]
+
+
+def test_incremental_run_skips_backfilled_files(backfill_mod, source):
+    index = backfill_mod.index
+    backfill_mod.process_source(str(source), "s3://data-bucket", "data/ead/", "cache/ead/", rechunk=False)
+    # The map passes the source object's ETag, which S3 quotes
+    etag = f'"{hashlib.md5(source.read_bytes()).hexdigest()}"'
+
+    assert index.is_unchanged("data-bucket", "data/ead/papers.json", etag)
+    response = index.handler(
+        {"bucket": "source-bucket", "key": "ead/papers.xml", "etag": etag, "mode": "incremental"}, None
+    )
+    assert json.loads(response["body"])["message"] == "Ead file unchanged"
+    assert not index.is_unchanged("data-bucket", "data/ead/papers.json", '"other"')
@@ -0,0 +1,91 @@
+"""Unit tests for the parsed EAD cache helpers."""
+
+import gzip
+import json
+
+import pytest
+from shared import ead_cache
+
+
+@pytest.fixture
+def collection():
+    return {
+        "id": "ead-1",
+        "level": "collection",
+        "title": "Papers",
+        "components": [
+            {
+                "id": "ead-1_s1",
+                "level": "series",
+                "title": "Series 1",
+                "components": [
+                    {"id": "ead-1_s1_f1", "level": "file", "title": "Folder 1"},
+                    {"id": "ead-1_s1_f2", "level": "item", "title": "Letter"},
+                ],
+            },
+            {"id": "ead-1_s2", "level": "series", "title": None},
+        ],
+    }
+
+
+def with_component_lists(node):
+    """The node with an explicit (possibly empty) component list at every level."""
+    return {**node, "components": [with_component_lists(child) for child in node.get("components", [])]}
+
+
+def test_round_trip(collection):
+    assert ead_cache.loads(ead_cache.dumps(collection)) == with_component_lists(collection)
+
+
+def test_round_trip_without_components():
+    collection = {"id": "ead-2", "title": "Empty", "components": []}
+
+    assert ead_cache.loads(ead_cache.dumps(collection)) == collection
+
+
+def test_round_trip_normalizes_nested_component_lists():
+    collection = {
+        "id": "ead-3",
+        "title": "Nested",
+        "components": [
+            {
+                "id": "ead-3_s1",
+                "title": "Series",
+                "components": [
+                    {"id": "ead-3_s1_ss1", "title": "Subseries", "components": [{"id": "ead-3_f1", "title": "File"}]},
+                    # An empty list that a writer dropped, and one that was kept
+                    {"id": "ead-3_s1_ss2", "title": "Empty subseries"},
+                    {"id": "ead-3_s1_ss3", "title": "Kept empty", "components": []},
+                ],
+            },
+            {"id": "ead-3_s2", "title": "Back at depth 1"},
+        ],
+    }
+
+    restored = ead_cache.loads(ead_cache.dumps(collection))
+
+    assert restored == with_component_lists(collection)
+    series = restored["components"][0]["components"]
+    assert [child["components"] for child in series[1:]] == [[], []]
+    assert series[0]["components"][0]["components"] == []
+    # Serializing the restored tree again gives the same lines
+    assert ead_cache.loads(ead_cache.dumps(restored)) == restored
+
+
+def test_lines_carry_depth_and_path(collection):
+    lines = [json.loads(line) for line in gzip.decompress(ead_cache.dumps(collection)).decode().splitlines()]
+
+    assert [line["id"] for line in lines] == ["ead-1", "ead-1_s1", "ead-1_s1_f1", "ead-1_s1_f2", "ead-1_s2"]
+    assert [line["depth"] for line in lines] == [0, 1, 2, 2, 1]
+    assert lines[3]["path"] == ["Papers", "Series 1", "Letter"]
+    assert all("components" not in line for line in lines)
+
+
+def test_cache_key_normalizes_etag():
+    assert ead_cache.cache_key("cache/ead/", '"abc123"') == "cache/ead/v1/abc123.jsonl.gz"
+    assert ead_cache.cache_key("cache/ead/", 'W/"abc-2"') == "cache/ead/v1/abc-2.jsonl.gz"
+
+
+def test_loads_empty_raises():
+    with pytest.raises(ValueError):
+        ead_cache.loads(gzip.compress(b""))
@@ -0,0 +1,115 @@
+"""Unit tests for event-driven EAD processing and the debounced sync."""
+
+import importlib
+import io
+import json
+from unittest.mock import Mock
+
+import pytest
+from botocore.exceptions import ClientError
+
+
+@pytest.fixture
+def events_mod(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("DEST_BUCKET", "data-bucket")
+    monkeypatch.setenv("SYNC_QUEUE_URL", "https://sqs/sync")
+    monkeypatch.setenv("QUIET_SECONDS", "300")
+    mod = importlib.reload(importlib.import_module("ead_events.index"))
+    mod.s3 = Mock()
+    mod.s3.exceptions.NoSuchKey = KeyError
+    mod.sqs = Mock()
+    mod.lambda_client = Mock()
+    mod.bedrock_agent = Mock()
+    mod.time = Mock()
+    mod.time.time.return_value = 10_000.0
+    return mod
+
+
+def timestamps(mod, **values):
+    keys = {"last-change": mod.LAST_CHANGE_KEY, "synced": mod.SYNCED_KEY}
+    objects = {keys[name]: str(value).encode() for name, value in values.items()}
+    mod.s3.get_object.side_effect = lambda Bucket, Key: {"Body": io.BytesIO(objects[Key])}
+
+
+def message(detail_type, key, message_id="m1"):
+    body = {"detail-type": detail_type, "detail": {"bucket": {"name": "source"}, "object": {"key": key, "etag": "abc"}}}
+    return {"messageId": message_id, "body": json.dumps(body)}
+
+
+def test_changes_processed_and_sync_queued(events_mod):
+    events_mod.lambda_client.invoke.return_value = {"StatusCode": 200}
+
+    result = events_mod.handler(
+        {
+            "Records": [
+                message("Object Created", "ead/a.xml", "m1"),
+                message("Object Deleted", "ead/b.xml", "m2"),
+                message("Object Created", "ead/readme.txt", "m3"),
+            ]
+        },
+        None,
+    )
+
+    assert result == {"batchItemFailures": []}
+    payload = json.loads(events_mod.lambda_client.invoke.call_args.kwargs["Payload"])
+    assert payload == {"bucket": "source", "key": "ead/a.xml", "etag": "abc"}
+    events_mod.s3.delete_object.assert_called_once_with(Bucket="data-bucket", Key="data/ead/b.json")
+    events_mod.s3.put_object.assert_called_once()
+    assert events_mod.sqs.send_message.call_args.kwargs["DelaySeconds"] == 300
+
+
+def test_failed_processing_reported_for_redelivery(events_mod):
+    events_mod.lambda_client.invoke.return_value = {"FunctionError": "Unhandled", "Payload": io.BytesIO(b"boom")}
+
+    result = events_mod.handler({"Records": [message("Object Created", "ead/a.xml")]}, None)
+
+    assert result == {"batchItemFailures": [{"itemIdentifier": "m1"}]}
+    events_mod.sqs.send_message.assert_not_called()
+
+
+def test_sync_waits_for_quiet_period(events_mod):
+    timestamps(events_mod, **{"last-change": 9_900.0})
+
+    assert events_mod.sync_handler({}, None)["reason"] == "changes still arriving"
+    events_mod.bedrock_agent.start_ingestion_job.assert_not_called()
+    assert events_mod.sqs.send_message.call_args.kwargs["DelaySeconds"] == 200
+
+
+def test_sync_starts_one_job_after_changes_settle(events_mod):
+    timestamps(events_mod, **{"last-change": 9_000.0, "synced": 8_000.0})
+    events_mod.bedrock_agent.start_ingestion_job.return_value = {"ingestionJob": {"ingestionJobId": "job-1"}}
+
+    assert events_mod.sync_handler({}, None) == {"started": True, "ingestionJobIds": ["job-1"]}
+    assert events_mod.s3.put_object.call_args.kwargs["Body"] == b"9000.0"
+
+    timestamps(events_mod, **{"last-change": 9_000.0, "synced": 9_000.0})
+    assert events_mod.sync_handler({}, None)["reason"] == "up to date"
+
+
+def test_sync_retries_later_while_a_job_runs(events_mod):
+    timestamps(events_mod, **{"last-change": 9_000.0})
+    events_mod.bedrock_agent.start_ingestion_job.side_effect = ClientError(
+        {"Error": {"Code": "ConflictException"}}, "StartIngestionJob"
+    )
+
+    assert events_mod.sync_handler({}, None)["reason"] == "ingestion running"
+    events_mod.sqs.send_message.assert_called_once()
+    events_mod.s3.put_object.assert_not_called()
+
+
+def test_sync_starts_a_job_on_every_shard(events_mod):
+    events_mod.DATA_SOURCE_ID = "shard-0,shard-1"
+    timestamps(events_mod, **{"last-change": 9_000.0})
+    events_mod.bedrock_agent.start_ingestion_job.side_effect = [
+        {"ingestionJob": {"ingestionJobId": "job-1"}},
+        ClientError({"Error": {"Code": "ConflictException"}}, "StartIngestionJob"),
+    ]
+
+    result = events_mod.sync_handler({}, None)
+
+    assert result == {"started": True, "ingestionJobIds": ["job-1"], "reason": "ingestion running"}
+    calls = events_mod.bedrock_agent.start_ingestion_job.call_args_list
+    assert [call.kwargs["dataSourceId"] for call in calls] == ["shard-0", "shard-1"]
+    events_mod.sqs.send_message.assert_called_once()
+    events_mod.s3.put_object.assert_not_called()
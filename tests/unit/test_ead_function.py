@@ -0,0 +1,52 @@
+"""Unit tests for chunking EAD finding aids from a cached parse (needs eadpy, as the ead function does)."""
+
+import importlib
+import pathlib
+
+import pytest
+from shared import ead_cache
+
+eadpy = pytest.importorskip("eadpy")
+
+REQUIREMENTS = pathlib.Path(__file__).parents[2] / "src/treetop/functions/ead/requirements.txt"
+
+FINDING_AID = """<?xml version="1.0" encoding="UTF-8"?>
+<ead xmlns="urn:isbn:1-931666-22-9">
+  <eadheader><eadid>test-ead</eadid></eadheader>
+  <archdesc level="collection">
+    <did><unittitle>Papers</unittitle><unitid>MS 1</unitid><unitdate>1900-1950</unitdate></did>
+    <scopecontent><p>Letters and diaries.</p></scopecontent>
+    <dsc>
+      <c01 id="s1" level="series">
+        <did><unittitle>Correspondence</unittitle></did>
+        <c02 id="f1" level="file"><did><unittitle>Letters, 1901</unittitle></did></c02>
+        <c02 id="f2" level="file"><did><unittitle>Letters, 1902</unittitle></did></c02>
+      </c01>
+      <c01 id="s2" level="series"><did><unittitle>Diaries</unittitle></did></c01>
+    </dsc>
+  </archdesc>
+</ead>
+"""
+
+
+@pytest.fixture
+def ead_mod(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    return importlib.reload(importlib.import_module("ead.index"))
+
+
+def test_eadpy_version_matches_requirements():
+    # ParsedEad relies on Ead.__init__ calling parse(); check it again when bumping the pin
+    assert f"eadpy=={eadpy.__version__}" in REQUIREMENTS.read_text().split()
+
+
+def test_chunks_from_cached_parse_match_xml(ead_mod, tmp_path):
+    source = tmp_path / "test.xml"
+    source.write_text(FINDING_AID)
+    parsed = ead_mod.parse_ead(str(source))
+
+    from_xml = eadpy.Ead(str(source)).create_item_chunks()
+    from_cache = ead_mod.create_chunks(ead_cache.loads(ead_cache.dumps(parsed)))
+
+    assert from_xml
+    assert from_cache == from_xml
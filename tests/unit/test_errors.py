@@ -0,0 +1,37 @@
+"""Unit tests for the typed handler errors."""
+
+from shared import errors
+
+
+class ClientError(Exception):
+    def __init__(self, code, status=400):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}}
+
+
+class EndpointConnectionError(Exception):
+    pass
+
+
+def test_transient_errors_are_retryable():
+    assert errors.is_retryable(ClientError("SlowDown", 503))
+    assert errors.is_retryable(ClientError("InternalError", 500))
+    assert errors.is_retryable(EndpointConnectionError("no route"))
+    assert errors.is_retryable(TimeoutError())
+    assert errors.is_retryable_status(429)
+
+
+def test_client_errors_are_permanent():
+    assert not errors.is_retryable(ClientError("NoSuchKey", 404))
+    assert not errors.is_retryable(ValueError("not XML"))
+    assert not errors.is_retryable_status(404)
+
+
+def test_classify_wraps_in_typed_error():
+    retryable = errors.classify(ClientError("ThrottlingException"), "Error processing s3://bucket/key")
+    permanent = errors.classify(ValueError("not XML"), "Error processing s3://bucket/key")
+
+    assert isinstance(retryable, errors.RetryableError)
+    assert isinstance(permanent, errors.PermanentError)
+    assert str(permanent) == "Error processing s3://bucket/key: not XML"
+    assert errors.classify(permanent, "ignored") is permanent
@@ -0,0 +1,458 @@
+"""Unit tests for fetching and storing IIIF manifests (needs the get_iiif_manifest function's requirements)."""
+
+import asyncio
+import importlib
+import io
+import json
+import pathlib
+from unittest.mock import Mock
+
+import pytest
+from botocore.exceptions import ClientError
+
+aiohttp = pytest.importorskip("aiohttp")
+pytest.importorskip("ijson")
+pytest.importorskip("loam_iiif")
+
+FUNCTION_DIR = pathlib.Path(__file__).parents[2] / "src/treetop/functions/get_iiif_manifest"
+URI = "https://example.edu/iiif/m1/manifest"
+
+
+def manifest(uri=URI, title="Letter home", canvases=0):
+    return {
+        "@context": "http://iiif.io/api/presentation/3/context.json",
+        "id": uri,
+        "type": "Manifest",
+        "label": {"en": [title]},
+        "summary": {"en": ["A letter."]},
+        "items": [{"id": f"{uri}/canvas/{n}", "type": "Canvas"} for n in range(canvases)],
+    }
+
+
+class FakeStream:
+    def __init__(self, body):
+        self.body = body
+
+    async def read(self, size=-1):
+        size = len(self.body) if size < 0 else size
+        chunk, self.body = self.body[:size], self.body[size:]
+        return chunk
+
+
+class FakeResponse:
+    def __init__(self, status=200, body=b"", headers=None, content_length="auto", content_type="application/json"):
+        self.status = status
+        self.body = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.headers = headers or {}
+        self.content_length = len(self.body) if content_length == "auto" else content_length
+        self.content_type = content_type
+        self.content = FakeStream(self.body)
+
+    async def text(self):
+        return self.body.decode("utf-8")
+
+    async def read(self):
+        return self.body
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise aiohttp.ClientResponseError(Mock(real_url="url"), (), status=self.status, message="error")
+
+
+class FakeSession:
+    """Answers each URI with its queued responses in turn, recording requests and how many were in flight."""
+
+    def __init__(self, responses, delay=0):
+        self.responses = {uri: list(queue) for uri, queue in responses.items()}
+        self.delay = delay
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+
+    def get(self, uri, headers=None):
+        session = self
+
+        class Request:
+            async def __aenter__(self):
+                session.requests.append((uri, headers or {}))
+                session.active += 1
+                session.max_active = max(session.max_active, session.active)
+                await asyncio.sleep(session.delay)
+                response = session.responses[uri].pop(0)
+                if isinstance(response, Exception):
+                    raise response
+                return response
+
+            async def __aexit__(self, *exc_info):
+                session.active -= 1
+
+        return Request()
+
+
+@pytest.fixture
+def fetch_mod(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("DEST_BUCKET", "data-bucket")
+    monkeypatch.setenv("DEST_PREFIX", "data/iiif/")
+    monkeypatch.syspath_prepend(str(FUNCTION_DIR))
+    mod = importlib.reload(importlib.import_module("get_iiif_manifest.index"))
+    mod.s3 = Mock()
+    mod.s3.head_object.return_value = {"Metadata": {}}
+    mod.s3.get_object.side_effect = ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+    mod.s3.get_paginator.return_value.paginate.return_value = [{}]
+    mod.token_store = mod.ratelimit.LocalTokenStore()
+    mod.telemetry = Mock()
+    retry_delay = mod.ratelimit.retry_delay
+
+    def immediate_retry(attempt, **kwargs):
+        # Keep the decision to give up, but retry straight away
+        return None if retry_delay(attempt, **kwargs) is None else 0
+
+    monkeypatch.setattr(mod.ratelimit, "retry_delay", immediate_retry)
+    return mod
+
+
+def run_row(mod, session, row, force=False, concurrency=10):
+    async def run():
+        fetcher = mod.PoliteFetcher(session)
+        result = await mod.process_row(fetcher, asyncio.Semaphore(concurrency), row, force)
+        return result, fetcher
+
+    return asyncio.run(run())
+
+
+def test_process_row_stores_manifest_text(fetch_mod):
+    session = FakeSession({URI: [FakeResponse(body=manifest(), headers={"ETag": '"v1"'})]})
+
+    result, _ = run_row(fetch_mod, session, {"uri": URI})
+
+    key = result["s3_key"]
+    assert result == {
+        "uri": URI,
+        "statusCode": 200,
+        "message": "Manifest fetched and stored successfully",
+        "s3_key": key,
+        "changed": True,
+        "harvested_canvases": 0,
+    }
+    assert key.startswith("data/iiif/")
+    put = fetch_mod.s3.put_object.call_args.kwargs
+    assert put["Key"] == key
+    assert "Title: Letter home" in put["Body"]
+    assert put["Metadata"] == {"etag": '"v1"', "text-sha256": fetch_mod.text_hash(put["Body"])}
+
+
+def test_process_row_not_modified(fetch_mod):
+    session = FakeSession({URI: [FakeResponse(status=304)]})
+
+    result, _ = run_row(fetch_mod, session, {"uri": URI})
+
+    assert result["statusCode"] == 200
+    assert result["changed"] is False
+    assert result["message"] == "Manifest unchanged (not modified)"
+    fetch_mod.s3.put_object.assert_not_called()
+
+
+def test_process_row_failures(fetch_mod):
+    session = FakeSession({URI: [FakeResponse(status=404)]})
+
+    result, _ = run_row(fetch_mod, session, {"uri": URI})
+
+    assert result["uri"] == URI
+    assert result["statusCode"] == 404
+    assert result["retryable"] is False
+    assert result["message"] == "Error fetching IIIF manifest"
+    assert run_row(fetch_mod, FakeSession({}), {"label": "no uri"})[0] == {
+        "uri": None,
+        "statusCode": 400,
+        "message": "No 'uri' provided in row.",
+    }
+    fetch_mod.s3.put_object.assert_not_called()
+
+
+def test_process_row_gives_up_on_persistent_throttling(fetch_mod):
+    fetch_mod.MAX_ATTEMPTS = 2
+    session = FakeSession({URI: [FakeResponse(status=503), FakeResponse(status=503)]})
+
+    result, fetcher = run_row(fetch_mod, session, {"uri": URI})
+
+    assert result["statusCode"] == 503
+    assert result["retryable"] is True
+    assert len(session.requests) == 2
+    assert fetcher.throttles == 2
+
+
+def test_throttled_fetch_retried_with_smaller_host_limit(fetch_mod):
+    session = FakeSession(
+        {URI: [FakeResponse(status=429, headers={"Retry-After": "0"}), FakeResponse(body=manifest())]}
+    )
+    block = Mock(wraps=fetch_mod.token_store.block)
+    fetch_mod.token_store.block = block
+
+    result, fetcher = run_row(fetch_mod, session, {"uri": URI})
+
+    assert result["changed"] is True
+    assert (fetcher.retries, fetcher.throttles) == (1, 1)
+    assert fetcher.gates["example.edu"].controller.limit < fetch_mod.BATCH_CONCURRENCY
+    # The Retry-After is shared with other invocations through the token store
+    assert block.call_args.args[0] == "example.edu"
+
+
+def test_timeouts_retried_without_shrinking_host_limit(fetch_mod):
+    session = FakeSession({URI: [asyncio.TimeoutError(), FakeResponse(body=manifest())]})
+
+    result, fetcher = run_row(fetch_mod, session, {"uri": URI})
+
+    assert result["changed"] is True
+    assert (fetcher.retries, fetcher.throttles) == (1, 0)
+    assert fetcher.gates["example.edu"].controller.limit == fetch_mod.BATCH_CONCURRENCY
+
+
+def test_long_retry_after_gives_up_as_retryable(fetch_mod):
+    fetch_mod.MAX_RETRY_AFTER = 60
+    session = FakeSession({URI: [FakeResponse(status=429, headers={"Retry-After": "3600"})]})
+
+    result, fetcher = run_row(fetch_mod, session, {"uri": URI})
+
+    assert result["statusCode"] == 429
+    assert result["retryable"] is True
+    assert fetcher.retries == 0
+    # Other rows for the host give up straight away instead of sleeping through the block
+    session = FakeSession({URI: [FakeResponse(body=manifest())]})
+    assert run_row(fetch_mod, session, {"uri": URI})[0]["retryable"] is True
+    assert session.requests == []
+
+
+def test_rows_share_batch_concurrency(fetch_mod):
+    uris = [f"https://host{n}.example.edu/manifest" for n in range(6)]
+    session = FakeSession({uri: [FakeResponse(body=manifest(uri))] for uri in uris}, delay=0.01)
+
+    async def run():
+        fetcher = fetch_mod.PoliteFetcher(session)
+        semaphore = asyncio.Semaphore(2)
+        return await asyncio.gather(*(fetch_mod.process_row(fetcher, semaphore, {"uri": uri}) for uri in uris))
+
+    results = asyncio.run(run())
+
+    assert [result["statusCode"] for result in results] == [200] * 6
+    assert session.max_active == 2
+
+
+def test_host_gate_caps_requests_to_one_host(fetch_mod):
+    uris = [f"https://example.edu/iiif/m{n}/manifest" for n in range(4)]
+    session = FakeSession({uri: [FakeResponse(body=manifest(uri))] for uri in uris}, delay=0.01)
+
+    async def run():
+        fetcher = fetch_mod.PoliteFetcher(session)
+        fetcher.gates["example.edu"] = gate = fetch_mod.HostGate()
+        # As if earlier throttles had halved the limit down to its minimum
+        gate.controller.value = gate.controller.maximum = 1
+        return await asyncio.gather(
+            *(fetch_mod.process_row(fetcher, asyncio.Semaphore(10), {"uri": uri}) for uri in uris)
+        )
+
+    asyncio.run(run())
+
+    assert session.max_active == 1
+
+
+def test_large_manifests_streamed_without_canvases(fetch_mod):
+    fetch_mod.STREAM_THRESHOLD_BYTES = 1000
+    large, small = manifest(canvases=50), manifest(canvases=2)
+
+    def fetch(body, content_length="auto"):
+        session = FakeSession({URI: [FakeResponse(body=body, content_length=content_length)]})
+        return asyncio.run(fetch_mod.fetch_manifest(session, URI, {}))[0]
+
+    without_canvases = {key: value for key, value in large.items() if key != "items"}
+    assert fetch(large) == without_canvases
+    assert fetch(large, content_length=None) == without_canvases
+    assert fetch(small) == small
+
+
+def test_streaming_parse_falls_back_to_lenient_parser(fetch_mod):
+    fetch_mod.STREAM_THRESHOLD_BYTES = 0
+    # ijson rejects the trailing comma loam-iiif's decoder accepts
+    body = b'{"id": "%s", "type": "Manifest", "label": {"en": ["Letter home"]},}' % URI.encode()
+    session = FakeSession({URI: [FakeResponse(body=body), FakeResponse(body=body)]})
+
+    manifest_json, _ = asyncio.run(fetch_mod.fetch_manifest(session, URI, {}))
+
+    assert manifest_json["label"] == {"en": ["Letter home"]}
+    assert len(session.requests) == 2
+
+
+def stored_digest(mod):
+    """The text hash a previous run stored for ``manifest()``."""
+    return mod.text_hash(mod.extract_text(URI, manifest()))
+
+
+def test_conditional_request_uses_stored_validators(fetch_mod):
+    fetch_mod.s3.head_object.return_value = {
+        "Metadata": {"etag": '"v1"', "last-modified": "Wed, 01 May 2024 12:00:00 GMT", "text-sha256": "abc"}
+    }
+    session = FakeSession({URI: [FakeResponse(status=304), FakeResponse(status=304)]})
+
+    run_row(fetch_mod, session, {"uri": URI})
+    run_row(fetch_mod, session, {"uri": URI}, force=True)
+
+    (_, headers), (_, forced_headers) = session.requests
+    assert headers["If-None-Match"] == '"v1"'
+    assert headers["If-Modified-Since"] == "Wed, 01 May 2024 12:00:00 GMT"
+    # A forced run makes unconditional requests
+    assert "If-None-Match" not in forced_headers
+
+
+def test_identical_text_not_rewritten(fetch_mod):
+    digest = stored_digest(fetch_mod)
+    fetch_mod.s3.head_object.return_value = {"Metadata": {"etag": '"v1"', "text-sha256": digest}}
+    session = FakeSession({URI: [FakeResponse(body=manifest(), headers={"ETag": '"v1"'})]})
+
+    result, _ = run_row(fetch_mod, session, {"uri": URI})
+
+    assert result["changed"] is False
+    assert result["message"] == "Manifest unchanged (identical text)"
+    fetch_mod.s3.put_object.assert_not_called()
+
+
+def test_identical_text_with_new_validators_saved_in_sidecar(fetch_mod):
+    digest = stored_digest(fetch_mod)
+    fetch_mod.s3.head_object.return_value = {"Metadata": {"etag": '"v1"', "text-sha256": digest}}
+    headers = {"ETag": '"v2"', "Last-Modified": "Thu, 02 May 2024 12:00:00 GMT"}
+    session = FakeSession({URI: [FakeResponse(body=manifest(), headers=headers)]})
+
+    result, _ = run_row(fetch_mod, session, {"uri": URI})
+
+    assert result["changed"] is False
+    # The document itself is left alone, so its LastModified doesn't read as a change
+    fetch_mod.s3.copy_object.assert_not_called()
+    put = fetch_mod.s3.put_object.call_args.kwargs
+    assert put["Key"] == f"state/iiif-validators/{result['s3_key'].rpartition('/')[2]}.json"
+    assert json.loads(put["Body"]) == {
+        "etag": '"v2"',
+        "last-modified": "Thu, 02 May 2024 12:00:00 GMT",
+        "text-sha256": digest,
+    }
+
+
+@pytest.mark.parametrize("sidecar_digest, etag", [("abc", '"v2"'), ("older", '"v1"')])
+def test_sidecar_validators_used_while_text_matches(fetch_mod, sidecar_digest, etag):
+    fetch_mod.s3.head_object.return_value = {"Metadata": {"etag": '"v1"', "text-sha256": "abc"}}
+    sidecar = json.dumps({"etag": '"v2"', "text-sha256": sidecar_digest}).encode()
+    fetch_mod.s3.get_object.side_effect = lambda Bucket, Key: {"Body": io.BytesIO(sidecar)}
+    session = FakeSession({URI: [FakeResponse(status=304)]})
+
+    run_row(fetch_mod, session, {"uri": URI})
+
+    ((_, headers),) = session.requests
+    assert headers["If-None-Match"] == etag
+
+
+def test_no_validators_sent_without_a_document(fetch_mod):
+    # A sidecar left from before the document was deleted must not turn the refetch into a 304
+    fetch_mod.s3.get_object.side_effect = lambda Bucket, Key: {"Body": io.BytesIO(b'{"etag": "v1"}')}
+    session = FakeSession({URI: [FakeResponse(body=manifest())]})
+
+    result, _ = run_row(fetch_mod, session, {"uri": URI})
+
+    assert session.requests[0][1].get("If-None-Match") is None
+    assert result["changed"] is True
+
+
+def test_canvas_documents_rewritten_only_when_text_changes(fetch_mod):
+    fetch_mod.HARVEST_ANNOTATIONS = "canvas"
+    annotation = {"type": "Annotation", "body": {"type": "TextualBody", "value": "Hi"}}
+    page = {"id": f"{URI}/page/1", "type": "AnnotationPage", "items": [annotation]}
+    manifest_json = {**manifest(), "items": [{"id": f"{URI}/canvas/1", "type": "Canvas", "annotations": [page]}]}
+    text = "Manifest ID: https://example.edu/iiif/m1/manifest\nTitle: Letter home"
+
+    def harvest(force=False):
+        fetcher = fetch_mod.PoliteFetcher(FakeSession({}))
+        return asyncio.run(fetch_mod.harvest_full_text(fetcher, URI, manifest_json, text, force))
+
+    assert harvest() == (text, 1)
+    put = fetch_mod.s3.put_object.call_args.kwargs
+    assert put["Body"] == f"{text}\nCanvas: Canvas 1\nHi"
+    assert put["Metadata"] == {"text-sha256": fetch_mod.text_hash(put["Body"])}
+
+    fetch_mod.s3.put_object.reset_mock()
+    fetch_mod.s3.head_object.return_value = {"Metadata": put["Metadata"]}
+    harvest()
+    fetch_mod.s3.put_object.assert_not_called()
+    # A forced run writes every document again
+    harvest(force=True)
+    fetch_mod.s3.put_object.assert_called_once()
+
+
+def test_canvas_documents_past_the_harvest_removed(fetch_mod):
+    fetch_mod.HARVEST_ANNOTATIONS = "canvas"
+    annotation = {"type": "Annotation", "body": {"type": "TextualBody", "value": "Hi"}}
+    page = {"id": f"{URI}/page/1", "type": "AnnotationPage", "items": [annotation]}
+    manifest_json = {**manifest(), "items": [{"id": f"{URI}/canvas/1", "type": "Canvas", "annotations": [page]}]}
+    # The manifest used to have three canvases with text
+    keys = [f"data/iiif/{fetch_mod.document_keys.iiif_canvas_document_name(URI, n)}" for n in (1, 2, 3)]
+    fetch_mod.s3.get_paginator.return_value.paginate.return_value = [{"Contents": [{"Key": key} for key in keys]}]
+    fetch_mod.s3.delete_objects.return_value = {}
+    fetcher = fetch_mod.PoliteFetcher(FakeSession({}))
+
+    asyncio.run(fetch_mod.harvest_full_text(fetcher, URI, manifest_json, "Manifest ID: x", False))
+
+    paginate = fetch_mod.s3.get_paginator.return_value.paginate.call_args.kwargs
+    assert paginate == {
+        "Bucket": "data-bucket",
+        "Prefix": f"data/iiif/{fetch_mod.document_keys.iiif_uri_hash(URI)}-canvas-",
+    }
+    delete = fetch_mod.s3.delete_objects.call_args.kwargs["Delete"]
+    assert delete["Objects"] == [{"Key": keys[1]}, {"Key": keys[2]}]
+
+
+def test_failed_canvas_cleanup_leaves_manifest_unwritten(fetch_mod):
+    fetch_mod.HARVEST_ANNOTATIONS = "canvas"
+    fetch_mod.s3.get_paginator.return_value.paginate.return_value = [{"Contents": [{"Key": "stale"}]}]
+    fetch_mod.s3.delete_objects.return_value = {"Errors": [{"Key": "stale", "Code": "SlowDown", "Message": "busy"}]}
+    session = FakeSession({URI: [FakeResponse(body=manifest())]})
+
+    result, _ = run_row(fetch_mod, session, {"uri": URI})
+
+    assert (result["statusCode"], result["retryable"]) == (500, True)
+    fetch_mod.s3.put_object.assert_not_called()
+
+
+def failure(uri, status_code, retryable):
+    return {"uri": uri, "statusCode": status_code, "message": "error", "retryable": retryable}
+
+
+def test_batch_with_only_permanent_failures_succeeds(fetch_mod, monkeypatch):
+    results = [
+        {"uri": URI, "statusCode": 200, "changed": True},
+        failure("https://example.edu/gone", 404, False),
+        failure("https://example.edu/empty", 400, False),
+    ]
+
+    async def process_rows(rows, force=False):
+        return results, 0
+
+    monkeypatch.setattr(fetch_mod, "process_rows", process_rows)
+
+    response = fetch_mod.handler({"rows": [{"uri": result["uri"]} for result in results]}, None)
+
+    assert response["results"] == results
+    assert (response["succeeded"], response["failed"], response["changed"]) == (1, 2, 1)
+    metrics = fetch_mod.telemetry.emit_metrics.call_args.args[0]
+    assert metrics == {"RetryableFailures": 0, "PermanentFailures": 2}
+
+
+def test_batch_with_retryable_failures_raises(fetch_mod, monkeypatch):
+    results = [failure("https://example.edu/gone", 404, False), failure("https://example.edu/busy", 503, True)]
+
+    async def process_rows(rows, force=False):
+        return results, 1
+
+    monkeypatch.setattr(fetch_mod, "process_rows", process_rows)
+
+    with pytest.raises(fetch_mod.errors.RetryableError) as raised:
+        fetch_mod.handler({"rows": [{"uri": result["uri"]} for result in results]}, None)
+
+    assert json.loads(str(raised.value))["failed"] == 2
+    metrics = fetch_mod.telemetry.emit_metrics.call_args.args[0]
+    assert metrics == {"RetryableFailures": 1, "PermanentFailures": 1}
@@ -0,0 +1,70 @@
+"""Unit tests for extracting full text from IIIF canvas annotations."""
+
+import json
+
+from get_iiif_manifest import annotations
+
+ALTO = (
+    b'<?xml version="1.0" encoding="UTF-8"?>'
+    b'<alto xmlns="http://www.loc.gov/standards/alto/ns-v3#"><Layout><Page><PrintSpace><TextBlock>'
+    b'<TextLine><String CONTENT="Second"/><SP/><String CONTENT="page"/></TextLine>'
+    b'<TextLine><String CONTENT="caf\xc3\xa9"/></TextLine>'
+    b"</TextBlock></PrintSpace></Page></Layout></alto>"
+)
+
+
+def test_canvases_from_presentation_3_and_2():
+    v3 = {"items": [{"id": "c1", "type": "Canvas"}]}
+    v2 = {"sequences": [{"canvases": [{"@id": "c1"}, {"@id": "c2"}]}]}
+
+    assert [canvas["id"] for canvas in annotations.canvases(v3)] == ["c1"]
+    assert [canvas["@id"] for canvas in annotations.canvases(v2)] == ["c1", "c2"]
+
+
+def test_text_resources_filters_non_text_see_also():
+    canvas = {
+        "annotations": [{"id": "https://example.edu/page/1", "type": "AnnotationPage"}],
+        "seeAlso": [
+            {"id": "https://example.edu/alto/1.xml", "format": "application/xml", "profile": "alto"},
+            {"id": "https://example.edu/1.jpg", "format": "image/jpeg"},
+        ],
+        "rendering": {"id": "https://example.edu/1.txt", "format": "text/plain"},
+    }
+
+    assert [annotations.resource_id(resource) for resource in annotations.text_resources(canvas)] == [
+        "https://example.edu/page/1",
+        "https://example.edu/alto/1.xml",
+        "https://example.edu/1.txt",
+    ]
+
+
+def test_annotation_text_presentation_3_and_2():
+    page = {
+        "type": "AnnotationPage",
+        "items": [
+            {"type": "Annotation", "body": {"type": "TextualBody", "value": "<p>Dear diary,</p>"}},
+            {"type": "Annotation", "body": {"type": "Image", "id": "https://example.edu/1.jpg"}},
+            {"type": "Annotation", "body": [{"type": "TextualBody", "value": "fish &amp; chips"}]},
+        ],
+    }
+    annotation_list = {"resources": [{"resource": {"@type": "cnt:ContentAsText", "chars": "Line one"}}]}
+
+    assert annotations.annotation_text(page) == "Dear diary,\nfish & chips"
+    assert annotations.annotation_text(annotation_list) == "Line one"
+    assert annotations.is_embedded_page(page)
+    assert not annotations.is_embedded_page({"id": "https://example.edu/page/1"})
+
+
+def test_resource_text_by_format():
+    page = {"items": [{"body": {"type": "TextualBody", "value": "From JSON"}}]}
+
+    assert annotations.resource_text(json.dumps(page).encode(), "application/json") == "From JSON"
+    assert annotations.resource_text(ALTO, "application/xml") == "Second page\ncafé"
+    assert annotations.resource_text(b"<div class='ocr_line'>A&amp;B</div>", "text/vnd.hocr+html") == "A&B"
+    assert annotations.resource_text(b"  plain text \n", "text/plain") == "plain text"
+
+
+def test_canvas_label_fallback():
+    assert annotations.canvas_label({"label": {"en": ["p. 1"]}}, 1) == "p. 1"
+    assert annotations.canvas_label({"label": "f. 2r"}, 2) == "f. 2r"
+    assert annotations.canvas_label({}, 3) == "Canvas 3"
@@ -49,6 +49,67 @@ def test_knowledge_base_resource_created(stack_and_template):
 
 def test_data_source_created(stack_and_template):
     stack, template = stack_and_template
+    # The single data source keeps the logical ID and name it had before sources were split by type
+    (logical_id,) = template.find_resources("AWS::Bedrock::DataSource")
+    assert "MyCfnDataSource" in logical_id
     template.has_resource_properties(
-        "AWS::Bedrock::DataSource", {"Name": "TreetopS3DataSource", "Description": "Treetop S3 Data Source"}
+        "AWS::Bedrock::DataSource",
+        {
+            "Name": "TreetopS3DataSource",
+            "DataSourceConfiguration": {
+                "S3Configuration": assertions.Match.object_like({"InclusionPrefixes": ["data/ead/"]}),
+                "Type": "S3",
+            },
+        },
+    )
+
+
+def test_data_source_per_source_type():
+    app = core.App()
+    app.node.set_context("stack_prefix", "alice")
+    app.node.set_context(
+        "data",
+        [
+            {"type": "iiif", "collection_url": "http://example.com", "chunking": {"max_tokens": 500}},
+            {
+                "type": "ead",
+                "s3": {"bucket": "test-bucket", "prefix": "test-prefix/"},
+                "chunking": {"strategy": "NONE"},
+            },
+        ],
+    )
+    app.node.set_context("crawler", {"mode": "lambda"})
+    app.node.set_context(
+        "embedding_model_arn", "arn:aws:sagemaker:us-east-1:123456789012:model/bedrock-embedding-model"
+    )
+    app.node.set_context(
+        "foundation_model_arn", "arn:aws:sagemaker:us-east-1:123456789012:model/bedrock-embedding-model"
+    )
+    app.node.set_context("aws:cdk:bundling-stacks", [])  # Disable bundling to speed up tests
+    stack = TreetopStack(app, "alice-Treetop", env={"account": "123456789012", "region": "us-east-1"})
+    template = assertions.Template.from_stack(stack)
+
+    template.resource_count_is("AWS::Bedrock::DataSource", 2)
+    template.has_resource_properties(
+        "AWS::Bedrock::DataSource",
+        {
+            "Name": "TreetopS3DataSource",
+            "DataSourceConfiguration": {
+                "S3Configuration": assertions.Match.object_like({"InclusionPrefixes": ["data/iiif/"]}),
+                "Type": "S3",
+            },
+            "VectorIngestionConfiguration": {
+                "ChunkingConfiguration": {
+                    "ChunkingStrategy": "FIXED_SIZE",
+                    "FixedSizeChunkingConfiguration": {"MaxTokens": 500, "OverlapPercentage": 20},
+                }
+            },
+        },
+    )
+    template.has_resource_properties(
+        "AWS::Bedrock::DataSource",
+        {
+            "Name": "TreetopEadS3DataSource",
+            "VectorIngestionConfiguration": {"ChunkingConfiguration": {"ChunkingStrategy": "NONE"}},
+        },
     )
@@ -0,0 +1,414 @@
+"""Unit tests for the IIIF collection crawler (needs loam-iiif, as the crawler image does)."""
+
+import asyncio
+import importlib
+import importlib.metadata
+import io
+import json
+import pathlib
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("loam_iiif")
+
+IIIF_DIR = pathlib.Path(__file__).parents[2] / "iiif"
+ROOT = "https://example.edu/iiif/collection"
+
+
+def manifest_ref(name, label=None):
+    return {"id": f"https://example.edu/iiif/{name}/manifest", "type": "Manifest", "label": {"en": [label or name]}}
+
+
+def collection_ref(path):
+    return {"id": f"https://example.edu/iiif/{path}", "type": "Collection"}
+
+
+def manifest_uri(name):
+    return f"https://example.edu/iiif/{name}/manifest"
+
+
+class FakeBody(io.BytesIO):
+    def iter_lines(self):
+        return iter(self.read().splitlines())
+
+
+class FakeS3:
+    """In-memory S3 with the calls the crawler makes; multipart uploads are assembled on completion."""
+
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.completed = []
+        self.aborted = []
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise self.exceptions.NoSuchKey(Key)
+        return {"Body": FakeBody(self.objects[Key])}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.objects[Key] = Body
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+    def delete_objects(self, Bucket, Delete):
+        for item in Delete["Objects"]:
+            self.objects.pop(item["Key"], None)
+
+    def create_multipart_upload(self, Bucket, Key, ContentType=None):
+        upload_id = f"upload-{len(self.uploads) + 1}"
+        self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId][PartNumber] = Body
+        return {"ETag": f'"{UploadId}-{PartNumber}"'}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append((Key, UploadId))
+        del self.uploads[UploadId]
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = MultipartUpload["Parts"]
+        self.completed.append([part["PartNumber"] for part in parts])
+        self.objects[Key] = b"".join(self.uploads[UploadId][part["PartNumber"]] for part in parts)
+
+
+def list_uris(s3, key):
+    return sorted(line.decode("utf-8") for line in s3.objects[key].splitlines())
+
+
+def flat_collection(mod, names):
+    mod.documents[ROOT] = {"id": ROOT, "type": "Collection", "items": [manifest_ref(name) for name in names]}
+
+
+@pytest.fixture
+def crawler_mod(monkeypatch):
+    monkeypatch.syspath_prepend(str(IIIF_DIR))
+    mod = importlib.reload(importlib.import_module("manifest_fetcher"))
+    documents = {}
+    fetches = []
+
+    class FakeClient(mod.IIIFClient):
+        """Serves collection documents from ``documents``; None (a failed fetch) for anything else."""
+
+        def __init__(self, **kwargs):
+            super().__init__(no_cache=True)
+
+        def fetch_json(self, url):
+            fetches.append(url)
+            return documents.get(url)
+
+    monkeypatch.setattr(mod, "IIIFClient", FakeClient)
+    mod.documents = documents
+    mod.fetches = fetches
+    return mod
+
+
+def test_loam_iiif_version_matches_requirements():
+    # The crawler calls loam-iiif's private item helpers; check them again when bumping the pin
+    pinned = f"loam-iiif=={importlib.metadata.version('loam-iiif')}"
+    assert pinned in (IIIF_DIR / "requirements.txt").read_text().split()
+
+
+def test_link_url(crawler_mod):
+    page = "https://example.edu/iiif/collection/page/2"
+
+    assert crawler_mod.link_url(page, ROOT) == page
+    assert crawler_mod.link_url({"id": page, "type": "CollectionPage"}, ROOT) == page
+    assert crawler_mod.link_url({"@id": page}, ROOT) == page
+    assert crawler_mod.link_url("page/2", ROOT + "/") == page
+    assert crawler_mod.link_url({"type": "CollectionPage"}, ROOT) is None
+    assert crawler_mod.link_url(None, ROOT) is None
+
+
+def test_paginated_collection_crawled_through_first_and_next(crawler_mod):
+    # IIIF 2.1.1 paging, with the link forms seen in the wild: an object, a relative URL and a string
+    crawler_mod.documents.update(
+        {
+            ROOT: {"@id": ROOT, "@type": "sc:Collection", "first": {"@id": f"{ROOT}/page/1"}},
+            f"{ROOT}/page/1": {"manifests": [manifest_ref("a")], "next": "2"},
+            f"{ROOT}/page/2": {"manifests": [manifest_ref("b")], "next": {"id": f"{ROOT}/page/3"}},
+            f"{ROOT}/page/3": {"manifests": [manifest_ref("c")], "collections": [collection_ref("sub")]},
+            "https://example.edu/iiif/sub": {"items": [manifest_ref("d")]},
+        }
+    )
+
+    manifests = asyncio.run(crawler_mod.CollectionCrawler(ROOT, concurrency=2).crawl())
+
+    assert sorted(manifests) == [manifest_uri(name) for name in "abcd"]
+    assert sorted(crawler_mod.fetches) == sorted(crawler_mod.documents)
+
+
+def test_checkpoint_round_trip(crawler_mod):
+    s3 = FakeS3()
+    checkpoints = crawler_mod.Checkpoints(s3, "bucket", ROOT)
+
+    assert checkpoints.load() is None
+    checkpoints.save({"frontier": [["collection", ROOT]], "seen": [ROOT]})
+    assert checkpoints.load() == {"root": ROOT, "frontier": [["collection", ROOT]], "seen": [ROOT]}
+    assert crawler_mod.Checkpoints(s3, "bucket", ROOT + "?other").load() is None
+    checkpoints.clear()
+    assert checkpoints.load() is None
+
+
+def test_interrupted_crawl_resumes_from_checkpoint(crawler_mod, monkeypatch):
+    s3 = FakeS3()
+    slow = "https://example.edu/iiif/slow"
+    crawler_mod.documents.update(
+        {
+            ROOT: {"id": ROOT, "type": "Collection", "items": [manifest_ref("a"), collection_ref("slow")]},
+            slow: {"items": [manifest_ref("b")]},
+        }
+    )
+    fake_client = crawler_mod.IIIFClient
+
+    class SlowClient(fake_client):
+        def fetch_json(self, url):
+            if url == slow:
+                time.sleep(0.3)
+            return super().fetch_json(url)
+
+    monkeypatch.setattr(crawler_mod, "IIIFClient", SlowClient)
+    with pytest.raises(crawler_mod.CrawlHandoff):
+        crawler_mod.fetch_collection(ROOT, s3=s3, bucket_name="bucket", deadline=time.monotonic() + 0.1)
+
+    state = crawler_mod.Checkpoints(s3, "bucket", ROOT).load()
+    # The slow collection was in flight, so it goes back on the frontier
+    assert state["frontier"] == [["collection", slow]]
+    assert list(state["manifests"]) == [manifest_uri("a")]
+
+    monkeypatch.setattr(crawler_mod, "IIIFClient", fake_client)
+    crawler_mod.fetches.clear()
+    manifests = crawler_mod.fetch_collection(ROOT, s3=s3, bucket_name="bucket")
+
+    assert sorted(manifests) == [manifest_uri("a"), manifest_uri("b")]
+    # The root isn't fetched again
+    assert crawler_mod.fetches == [slow]
+
+
+def test_manifest_list_streamed_in_parts(crawler_mod):
+    crawler_mod.PART_SIZE = 1
+    s3 = FakeS3()
+    flat_collection(crawler_mod, "abc")
+
+    crawler_mod.fetch_collection(ROOT, s3=s3, bucket_name="bucket", key="manifests.csv")
+
+    assert list_uris(s3, "manifests.csv") == [manifest_uri(name) for name in "abc"]
+    assert s3.completed == [[1]]
+
+
+def test_resumed_upload_renumbers_parts_and_rewrites_unuploaded_rows(crawler_mod):
+    s3 = FakeS3()
+    upload_id = s3.create_multipart_upload(Bucket="bucket", Key="manifests.jsonl")["UploadId"]
+    uploaded = f'{{"uri": "{manifest_uri("a")}"}}\n'.encode()
+    parts = [s3.upload_part("bucket", "manifests.jsonl", upload_id, number, uploaded) for number in (1, 3)]
+    writer = crawler_mod.ManifestListWriter(s3, "bucket", "manifests.jsonl")
+    crawler = crawler_mod.CollectionCrawler(ROOT, writer=writer)
+
+    crawler.restore(
+        {
+            "frontier": [],
+            "seen": [ROOT],
+            # Part 2 was uploading when the checkpoint was taken, so "b" is still held back
+            "manifests": {manifest_uri("a"): None, manifest_uri("b"): {"label": "b", "navDate": None}},
+            "writer": {
+                "upload_id": upload_id,
+                "parts": [
+                    {"PartNumber": number, "ETag": part["ETag"]} for number, part in zip((3, 1), parts, strict=True)
+                ],
+            },
+        }
+    )
+
+    assert writer.next_part == 4
+    assert [json.loads(line)["uri"] for line in writer.buffer.getvalue().splitlines()] == [manifest_uri("b")]
+    writer.close()
+    assert s3.completed == [[1, 3, 4]]
+
+
+def test_shards_planned_and_merged(crawler_mod):
+    s3 = FakeS3()
+    subs = [f"https://example.edu/iiif/sub{n}" for n in range(3)]
+    crawler_mod.documents[ROOT] = {
+        "id": ROOT,
+        "type": "Collection",
+        "items": [manifest_ref("top"), *(collection_ref(f"sub{n}") for n in range(3))],
+    }
+    for n, sub in enumerate(subs):
+        # sub2 also lists "top", which the merge drops as a duplicate
+        crawler_mod.documents[sub] = {"items": [manifest_ref(f"m{n}"), *([manifest_ref("top")] if n == 2 else [])]}
+    shards = crawler_mod.CrawlShards(s3, "bucket", ROOT, "manifests.jsonl")
+
+    plan = crawler_mod.plan_shards(ROOT, 2)
+
+    assert plan["shards"] == [[subs[0], subs[2]], [subs[1]]]
+    assert list(plan["manifests"]) == [manifest_uri("top")]
+    assert set(plan["seen"]) == {ROOT, *subs}
+
+    shards.save_plan(plan)
+    for index in range(2):
+        crawler_mod.crawl_shard(shards, index)
+    crawler_mod.fetches.clear()
+    assert crawler_mod.merge_shards(shards, "manifests.jsonl") == 4
+
+    rows = [json.loads(line) for line in s3.objects["manifests.jsonl"].splitlines()]
+    assert sorted(row["uri"] for row in rows) == sorted(manifest_uri(name) for name in ("top", "m0", "m1", "m2"))
+    assert rows[0] == {
+        "uri": manifest_uri("top"),
+        "label": "top",
+        "navDate": None,
+        "id_hash": rows[0]["id_hash"],
+    }
+    # Only the final list and its status are left
+    assert sorted(s3.objects) == ["manifests.jsonl", "manifests.status.json"]
+    assert json.loads(s3.objects["manifests.status.json"]) == {"complete": True, "failed": []}
+    assert crawler_mod.fetches == []
+
+
+def test_plan_shards_expands_levels_until_enough_collections(crawler_mod):
+    crawler_mod.documents[ROOT] = {"id": ROOT, "type": "Collection", "items": [collection_ref("a")]}
+    crawler_mod.documents["https://example.edu/iiif/a"] = {"items": [collection_ref("a/1"), collection_ref("a/2")]}
+
+    plan = crawler_mod.plan_shards(ROOT, 2)
+
+    assert plan["shards"] == [["https://example.edu/iiif/a/1"], ["https://example.edu/iiif/a/2"]]
+
+
+@pytest.mark.parametrize("handoff, kept", [("resume", True), ("restart", False)])
+def test_lambda_crawl_hands_off_to_fargate(crawler_mod, monkeypatch, handoff, kept):
+    s3 = FakeS3()
+    flat_collection(crawler_mod, "ab")
+    monkeypatch.setenv("BUCKET_NAME", "bucket")
+    monkeypatch.setattr(crawler_mod.boto3, "client", lambda service: s3)
+    crawler_mod.HANDOFF_MARGIN = 60
+    # Less time left than the handoff margin: stop straight away
+    context = SimpleNamespace(get_remaining_time_in_millis=lambda: 30_000)
+    event = {"collection_url": ROOT, "s3": {"Bucket": "bucket", "Key": "manifests.csv"}, "handoff": handoff}
+
+    with pytest.raises(crawler_mod.CrawlHandoff):
+        crawler_mod.handler(event, context)
+
+    checkpoints = crawler_mod.Checkpoints(s3, "bucket", ROOT)
+    assert (checkpoints.load() is not None) == kept
+    assert "manifests.csv" not in s3.objects
+
+    # The Fargate task carries on from the checkpoint, or starts over, and clears it when done
+    monkeypatch.setenv("COLLECTION_URL", ROOT)
+    crawler_mod.MANIFEST_LIST_KEY = "manifests.csv"
+    crawler_mod.main()
+    assert list_uris(s3, "manifests.csv") == [manifest_uri("a"), manifest_uri("b")]
+    assert checkpoints.load() is None
+
+
+def test_lambda_crawl_finishes_within_deadline(crawler_mod, monkeypatch):
+    s3 = FakeS3()
+    flat_collection(crawler_mod, "ab")
+    monkeypatch.setenv("BUCKET_NAME", "bucket")
+    monkeypatch.setattr(crawler_mod.boto3, "client", lambda service: s3)
+    context = SimpleNamespace(get_remaining_time_in_millis=lambda: 900_000)
+
+    result = crawler_mod.handler({"collection_url": ROOT, "s3": {"Key": "manifests.csv"}}, context)
+
+    assert result == {"manifests": 2, "key": "manifests.csv"}
+    assert list_uris(s3, "manifests.csv") == [manifest_uri("a"), manifest_uri("b")]
+    assert crawler_mod.Checkpoints(s3, "bucket", ROOT).load() is None
+
+
+def test_failed_collection_marks_list_incomplete(crawler_mod):
+    s3 = FakeS3()
+    broken = "https://example.edu/iiif/broken"
+    crawler_mod.documents[ROOT] = {
+        "id": ROOT,
+        "type": "Collection",
+        "items": [manifest_ref("a"), collection_ref("broken")],
+    }
+
+    crawler_mod.fetch_collection(ROOT, s3=s3, bucket_name="bucket", key="manifests.csv")
+
+    assert list_uris(s3, "manifests.csv") == [manifest_uri("a")]
+    assert json.loads(s3.objects["manifests.status.json"]) == {"complete": False, "failed": [broken]}
+
+
+def test_failed_shard_collection_marks_merged_list_incomplete(crawler_mod):
+    s3 = FakeS3()
+    crawler_mod.documents[ROOT] = {
+        "id": ROOT,
+        "type": "Collection",
+        "items": [collection_ref("a"), collection_ref("b")],
+    }
+    crawler_mod.documents["https://example.edu/iiif/a"] = {"items": [manifest_ref("a1")]}
+    shards = crawler_mod.CrawlShards(s3, "bucket", ROOT, "manifests.csv")
+
+    shards.save_plan(crawler_mod.plan_shards(ROOT, 2))
+    for index in range(2):
+        crawler_mod.crawl_shard(shards, index)
+    crawler_mod.merge_shards(shards, "manifests.csv")
+
+    assert list_uris(s3, "manifests.csv") == [manifest_uri("a1")]
+    assert json.loads(s3.objects["manifests.status.json"]) == {
+        "complete": False,
+        "failed": ["https://example.edu/iiif/b"],
+    }
+    assert sorted(s3.objects) == ["manifests.csv", "manifests.status.json"]
+
+
+def slow_collection(crawler_mod, monkeypatch):
+    """A collection whose second sub-collection takes longer than the crawl's deadline."""
+    slow = "https://example.edu/iiif/slow"
+    crawler_mod.documents.update(
+        {
+            ROOT: {"id": ROOT, "type": "Collection", "items": [manifest_ref("a"), collection_ref("slow")]},
+            slow: {"items": [manifest_ref("b")]},
+        }
+    )
+
+    class SlowClient(crawler_mod.IIIFClient):
+        def fetch_json(self, url):
+            if url == slow:
+                time.sleep(0.3)
+            return super().fetch_json(url)
+
+    monkeypatch.setattr(crawler_mod, "IIIFClient", SlowClient)
+
+
+def test_restarted_handoff_aborts_upload(crawler_mod, monkeypatch):
+    crawler_mod.PART_SIZE = 1
+    s3 = FakeS3()
+    slow_collection(crawler_mod, monkeypatch)
+    monkeypatch.setenv("BUCKET_NAME", "bucket")
+    monkeypatch.setattr(crawler_mod.boto3, "client", lambda service: s3)
+    crawler_mod.HANDOFF_MARGIN = 0
+    context = SimpleNamespace(get_remaining_time_in_millis=lambda: 100)
+    event = {"collection_url": ROOT, "s3": {"Key": "manifests.csv"}, "handoff": "restart"}
+
+    with pytest.raises(crawler_mod.CrawlHandoff):
+        crawler_mod.handler(event, context)
+
+    assert [key for key, _upload_id in s3.aborted] == ["manifests.csv"]
+    assert s3.uploads == {}
+    assert crawler_mod.Checkpoints(s3, "bucket", ROOT).load() is None
+
+
+def test_failed_crawl_aborts_upload_and_clears_checkpoint(crawler_mod, monkeypatch):
+    crawler_mod.PART_SIZE = 1
+    s3 = FakeS3()
+    flat_collection(crawler_mod, "ab")
+
+    def fail(**kwargs):
+        raise RuntimeError("S3 is down")
+
+    monkeypatch.setattr(s3, "complete_multipart_upload", fail)
+
+    with pytest.raises(RuntimeError):
+        crawler_mod.fetch_collection(ROOT, s3=s3, bucket_name="bucket", key="manifests.csv")
+
+    assert [key for key, _upload_id in s3.aborted] == ["manifests.csv"]
+    assert crawler_mod.Checkpoints(s3, "bucket", ROOT).load() is None
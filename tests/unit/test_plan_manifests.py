@@ -0,0 +1,185 @@
+"""Unit tests for planning incremental IIIF runs."""
+
+import gzip
+import importlib
+import io
+import json
+import time
+from unittest.mock import Mock
+
+import pytest
+from shared import document_keys, manifest_list
+
+NOW = 1_700_000_000
+DAY = 86400
+
+
+@pytest.fixture
+def plan_mod(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("DEST_BUCKET", "data-bucket")
+    return importlib.reload(importlib.import_module("plan_manifests.index"))
+
+
+def rows(*uris):
+    return [(uri, uri, None) for uri in uris]
+
+
+def test_manifest_list_keys_and_rows():
+    assert manifest_list.delta_key("manifests.jsonl") == "manifests.delta.jsonl"
+    assert manifest_list.removals_key("manifests.jsonl") == "manifests.removed.csv"
+
+    line = json.dumps({"uri": "https://example.edu/m/1", "label": "One", "navDate": None, "id_hash": "abc"})
+    ((uri, parsed_line, fingerprint),) = manifest_list.parse_rows(f"{line}\n\n", jsonl=True)
+    assert (uri, parsed_line) == ("https://example.edu/m/1", line)
+    assert fingerprint == manifest_list.row_fingerprint({"label": "One", "navDate": None})
+    assert list(manifest_list.parse_rows("https://example.edu/m/1\n", jsonl=False)) == [
+        ("https://example.edu/m/1", "https://example.edu/m/1", None)
+    ]
+
+
+def test_plan_selects_new_changed_missing_and_due(plan_mod):
+    uris = [f"https://example.edu/m/{name}" for name in ("same", "changed", "missing", "due", "new")]
+    same, changed, missing, due, new = uris
+    previous = {
+        same: ["fp", NOW - DAY],
+        changed: ["old", NOW - DAY],
+        missing: ["fp", NOW - DAY],
+        due: ["fp", NOW - 8 * DAY],
+        "https://example.edu/m/gone": ["fp", NOW - DAY],
+    }
+    existing = {document_keys.iiif_uri_hash(uri) for uri in (same, changed, due)}
+    crawled = [(uri, uri, "new" if uri == changed else "fp") for uri in uris]
+
+    lines, removed, state, counts = plan_mod.plan(crawled, previous, existing, NOW)
+
+    assert lines == [changed, missing, due, new]
+    assert removed == ["https://example.edu/m/gone"]
+    assert counts == {"new": 1, "changed": 1, "missing": 1, "due": 1}
+    assert state[same] == ["fp", NOW - DAY]
+    assert state[changed] == ["new", NOW]
+    # New manifests come due at staggered times within the revalidation interval
+    assert NOW - 7 * DAY < state[new][1] <= NOW
+
+
+def test_full_plan_includes_everything(plan_mod):
+    uri = "https://example.edu/m/1"
+    previous = {uri: [None, NOW]}
+
+    lines, removed, _state, counts = plan_mod.plan(
+        rows(uri), previous, {document_keys.iiif_uri_hash(uri)}, NOW, full=True
+    )
+
+    assert lines == [uri]
+    assert removed == []
+    assert counts["due"] == 1
+
+
+def test_handler_writes_delta_removals_and_pending_state(plan_mod):
+    kept, gone = "https://example.edu/m/kept", "https://example.edu/m/gone"
+    state = {"manifests": {kept: [None, time.time()], gone: [None, time.time()]}}
+    state_key, pending_state_key = plan_mod.state_keys("https://example.edu/collection")
+    objects = {
+        "manifests.csv": f"{kept}\nhttps://example.edu/m/new\n".encode(),
+        state_key: gzip.compress(json.dumps(state).encode()),
+    }
+    plan_mod.s3 = Mock()
+    plan_mod.s3.get_object.side_effect = lambda Bucket, Key: {"Body": io.BytesIO(objects[Key])}
+    # Lists from before the crawler wrote a status count as complete
+    plan_mod.s3.exceptions.NoSuchKey = KeyError
+    paginator = Mock()
+    paginator.paginate.return_value = [{"Contents": [{"Key": f"data/iiif/{document_keys.iiif_document_name(kept)}"}]}]
+    plan_mod.s3.get_paginator.return_value = paginator
+
+    report = plan_mod.handler(
+        {"s3": {"Bucket": "data-bucket", "Key": "manifests.csv"}, "collection_url": "https://example.edu/collection"},
+        None,
+    )
+
+    written = {call.kwargs["Key"]: call.kwargs["Body"] for call in plan_mod.s3.put_object.call_args_list}
+    assert (report["Key"], report["PendingStateKey"]) == ("manifests.delta.csv", pending_state_key)
+    assert (report["count"], report["new"], report["removed"], report["full"]) == (1, 1, 1, False)
+    assert written["manifests.delta.csv"] == b"https://example.edu/m/new\n"
+    assert written["manifests.removed.csv"] == f"{gone}\n".encode()
+    pending = json.loads(gzip.decompress(written[pending_state_key]))["manifests"]
+    assert set(pending) == {kept, "https://example.edu/m/new"}
+
+
+def test_incomplete_crawl_removes_nothing(plan_mod):
+    kept, unlisted = "https://example.edu/m/kept", "https://example.edu/m/unlisted"
+    previous = {kept: [None, NOW - DAY], unlisted: [None, NOW - DAY]}
+    existing = {document_keys.iiif_uri_hash(uri) for uri in previous}
+
+    lines, removed, state, _counts = plan_mod.plan(rows(kept), previous, existing, NOW, partial=True)
+
+    assert (lines, removed) == ([], [])
+    assert state == previous
+
+
+def test_handler_reads_crawl_status(plan_mod):
+    kept, unlisted = "https://example.edu/m/kept", "https://example.edu/m/unlisted"
+    state_key, _pending_state_key = plan_mod.state_keys("https://example.edu/collection")
+    objects = {
+        "manifests.csv": f"{kept}\n".encode(),
+        "manifests.status.json": json.dumps({"complete": False, "failed": ["https://example.edu/c/1"]}).encode(),
+        state_key: gzip.compress(json.dumps({"manifests": {kept: [None, NOW], unlisted: [None, NOW]}}).encode()),
+    }
+    plan_mod.s3 = Mock()
+    plan_mod.s3.get_object.side_effect = lambda Bucket, Key: {"Body": io.BytesIO(objects[Key])}
+    plan_mod.s3.get_paginator.return_value.paginate.return_value = []
+
+    report = plan_mod.handler(
+        {"s3": {"Bucket": "data-bucket", "Key": "manifests.csv"}, "collection_url": "https://example.edu/collection"},
+        None,
+    )
+
+    written = {call.kwargs["Key"]: call.kwargs["Body"] for call in plan_mod.s3.put_object.call_args_list}
+    assert (report["partial"], report["failedCollections"], report["removed"]) == (True, 1, 0)
+    assert written["manifests.removed.csv"] == b""
+
+
+def test_failures_handler_lists_failed_batches_and_marks_them_due(plan_mod):
+    failed, ok = "https://example.edu/m/failed", "https://example.edu/m/ok"
+    _state_key, pending_state_key = plan_mod.state_keys("https://example.edu/collection")
+    state = {"manifests": {failed: ["fp", NOW], ok: ["fp", NOW]}}
+    objects = {
+        "results/manifest.json": json.dumps(
+            {"DestinationBucket": "data-bucket", "ResultFiles": {"FAILED": [{"Key": "results/FAILED_0.json"}]}}
+        ).encode(),
+        "results/FAILED_0.json": json.dumps(
+            [{"Input": json.dumps({"Items": [{"uri": failed}]}), "Status": "FAILED"}]
+        ).encode(),
+        pending_state_key: gzip.compress(json.dumps(state).encode()),
+    }
+    plan_mod.s3 = Mock()
+    plan_mod.s3.get_object.side_effect = lambda Bucket, Key: {"Body": io.BytesIO(objects[Key])}
+
+    report = plan_mod.failures_handler(
+        {
+            "s3": {"Bucket": "data-bucket", "Key": "manifests.csv"},
+            "plan": {"PendingStateKey": pending_state_key},
+            "resultWriter": {"Bucket": "data-bucket", "Key": "results/manifest.json"},
+        },
+        None,
+    )
+
+    written = {call.kwargs["Key"]: call.kwargs["Body"] for call in plan_mod.s3.put_object.call_args_list}
+    assert report == {"FailedKey": "manifests.failed.csv", "failed": 1}
+    assert written["manifests.failed.csv"] == f"{failed}\n".encode()
+    pending = json.loads(gzip.decompress(written[pending_state_key]))["manifests"]
+    assert pending == {failed: ["fp", 0], ok: ["fp", NOW]}
+
+
+def test_documents_outside_their_shard_count_as_missing(plan_mod):
+    placed, moved = "https://example.edu/m/placed", "https://example.edu/m/moved"
+    plan_mod.SHARDS = 3
+    plan_mod.s3 = Mock()
+    paginator = Mock()
+    placed_hash = document_keys.iiif_uri_hash(placed)
+    placed_key = f"data/iiif/{document_keys.iiif_shard(placed_hash, 3)}{document_keys.iiif_document_name(placed)}"
+    paginator.paginate.return_value = [
+        {"Contents": [{"Key": placed_key}, {"Key": f"data/iiif/{document_keys.iiif_document_name(moved)}"}]}
+    ]
+    plan_mod.s3.get_paginator.return_value = paginator
+
+    assert plan_mod.existing_document_hashes() == {placed_hash}
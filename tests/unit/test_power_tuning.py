@@ -0,0 +1,105 @@
+"""Unit tests for the power-tuning replay."""
+
+import base64
+import io
+import json
+from unittest.mock import Mock
+
+from treetop.tools import power_tuning
+
+REPORT = (
+    "START RequestId: abc Version: $LATEST\n"
+    "END RequestId: abc\n"
+    "REPORT RequestId: abc\tDuration: 812.34 ms\tBilled Duration: 813 ms\tMemory Size: 512 MB\t"
+    "Max Memory Used: 201 MB\tInit Duration: 402.10 ms\t\n"
+)
+
+
+def invocation(duration_ms, memory_mb, error=None):
+    report = {"duration_ms": duration_ms, "billed_ms": duration_ms, "memory_size": memory_mb, "max_memory_used": 100}
+    return {"error": error, "report": report}
+
+
+def test_parse_report():
+    assert power_tuning.parse_report(REPORT) == {
+        "duration_ms": 812.34,
+        "billed_ms": 813.0,
+        "memory_size": 512.0,
+        "max_memory_used": 201.0,
+        "init_ms": 402.1,
+    }
+    assert power_tuning.parse_report("no report here") == {}
+
+
+def test_summarize():
+    invocations = [invocation(100, 512), invocation(300, 512), invocation(200, 512, error="Unhandled")]
+
+    summary = power_tuning.summarize(512, invocations, 0.0000166667)
+
+    assert summary["invocations"] == 3
+    assert summary["errors"] == 1
+    assert summary["p50_ms"] == 200
+    assert summary["p95_ms"] == 200
+    assert summary["cost_per_1000"] == round(
+        1000 * sum(power_tuning.invocation_cost(ms, 512, 0.0000166667) for ms in (100, 300, 200)) / 3, 6
+    )
+
+
+def test_recommend_cheapest_size_within_slowdown():
+    summaries = [
+        {"memory": 256, "errors": 0, "p50_ms": 1000, "cost_per_1000": 0.0045},
+        {"memory": 512, "errors": 0, "p50_ms": 420, "cost_per_1000": 0.0037},
+        {"memory": 1024, "errors": 0, "p50_ms": 400, "cost_per_1000": 0.0069},
+        {"memory": 128, "errors": 2, "p50_ms": 2000, "cost_per_1000": 0.0030},
+    ]
+
+    assert power_tuning.recommend(summaries, 1.1)["memory"] == 512
+    assert power_tuning.recommend(summaries, 1.01)["memory"] == 1024
+    assert power_tuning.recommend(summaries[3:], 1.1) is None
+
+
+def test_recorded_payloads_from_result_writer_manifest():
+    executions = [
+        {
+            "Input": json.dumps(
+                {"sourceBucket": "src", "mode": "incremental", "item": {"Key": f"ead/{n}.xml", "ETag": n}}
+            )
+        }
+        for n in range(3)
+    ]
+    manifest = {"DestinationBucket": "results", "ResultFiles": {"SUCCEEDED": [{"Key": "run/SUCCEEDED_0.json"}]}}
+    bodies = {"manifest.json": manifest, "run/SUCCEEDED_0.json": executions}
+    s3 = Mock()
+    s3.get_object.side_effect = lambda Bucket, Key: {"Body": io.BytesIO(json.dumps(bodies[Key]).encode())}
+
+    payloads = list(power_tuning.recorded_payloads(s3, "process_ead", "s3://results/manifest.json", limit=2))
+    as_recorded = power_tuning.recorded_payloads(s3, "process_ead", "s3://results/manifest.json", as_recorded=True)
+
+    # Forced to full work, so incremental skips and cache hits don't flatten the measurements
+    assert payloads == [
+        {"bucket": "src", "key": "ead/0.xml", "etag": 0, "mode": "full", "refresh_cache": True},
+        {"bucket": "src", "key": "ead/1.xml", "etag": 1, "mode": "full", "refresh_cache": True},
+    ]
+    assert next(as_recorded) == {"bucket": "src", "key": "ead/0.xml", "etag": 0, "mode": "incremental"}
+
+
+def test_iiif_payload_forces_fetch():
+    item_input = {"Items": [{"uri": "https://example.edu/m1"}]}
+
+    assert power_tuning.iiif_payload(item_input) == {"rows": item_input["Items"], "force": True}
+    assert power_tuning.iiif_payload(item_input, as_recorded=True) == {"rows": item_input["Items"]}
+
+
+def test_run_workload_restores_memory():
+    lambda_client = Mock()
+    lambda_client.get_function_configuration.return_value = {"MemorySize": 128}
+    lambda_client.invoke.return_value = {"LogResult": base64.b64encode(REPORT.encode()).decode()}
+
+    summaries = power_tuning.run_workload(lambda_client, "fn", [{"n": 1}, {"n": 2}], [256, 512], 2, 1, 0.0000166667)
+
+    assert [summary["memory"] for summary in summaries] == [256, 512]
+    assert [summary["invocations"] for summary in summaries] == [2, 2]
+    memory_sizes = [call.kwargs["MemorySize"] for call in lambda_client.update_function_configuration.call_args_list]
+    assert memory_sizes == [256, 512, 128]
+    # One warmup and two measured invocations per size
+    assert lambda_client.invoke.call_count == 6
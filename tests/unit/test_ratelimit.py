@@ -0,0 +1,164 @@
+"""Unit tests for the per-host rate limiting helpers."""
+
+import random
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+from shared import ratelimit
+
+
+def test_aimd_halves_once_per_cooldown_and_recovers():
+    controller = ratelimit.AimdController(initial=8, maximum=8, cooldown=1.0)
+
+    controller.on_throttle(now=10.0)
+    controller.on_throttle(now=10.5)  # same overload, already accounted for
+    assert controller.limit == 4
+
+    controller.on_throttle(now=12.0)
+    assert controller.limit == 2
+
+    for _ in range(20):
+        controller.on_success()
+    assert controller.limit > 2
+    for _ in range(1000):
+        controller.on_success()
+    assert controller.limit == 8
+
+
+def test_aimd_never_drops_below_minimum():
+    controller = ratelimit.AimdController(initial=2, minimum=1, cooldown=0)
+    for step in range(10):
+        controller.on_throttle(now=float(step))
+    assert controller.limit == 1
+
+
+def test_parse_retry_after():
+    assert ratelimit.parse_retry_after("120") == 120.0
+    assert ratelimit.parse_retry_after("Wed, 21 Oct 2015 07:28:10 GMT", now=1445412480.0) == 10.0
+    assert ratelimit.parse_retry_after("soon") is None
+    assert ratelimit.parse_retry_after(None) is None
+
+
+def test_retry_delay_respects_retry_after():
+    rng = random.Random(0)
+    for attempt in range(5):
+        assert 0 <= ratelimit.retry_delay(attempt, base=0.5, cap=4, rng=rng) <= 4
+    assert ratelimit.retry_delay(0, base=0.5, retry_after=3, rng=rng) >= 3
+
+
+def test_retry_delay_gives_up_past_max_retry_after():
+    assert ratelimit.retry_delay(0, retry_after=3600, max_retry_after=60) is None
+    assert ratelimit.retry_delay(0, retry_after=30, max_retry_after=60) >= 30
+    assert ratelimit.retry_delay(0, max_retry_after=60) is not None
+
+
+def test_local_token_store_refills_at_rate():
+    store = ratelimit.LocalTokenStore()
+
+    assert store.acquire("iiif.example.edu", rate=2, burst=2, now=0.0) == 0
+    assert store.acquire("iiif.example.edu", rate=2, burst=2, now=0.0) == 0
+    assert store.acquire("iiif.example.edu", rate=2, burst=2, now=0.0) == 0.5
+    assert store.acquire("iiif.example.edu", rate=2, burst=2, now=0.5) == 0
+    # Buckets are per host
+    assert store.acquire("other.example.edu", rate=2, burst=2, now=0.5) == 0
+
+
+def test_local_token_store_block_applies_without_rate():
+    store = ratelimit.LocalTokenStore()
+    store.block("iiif.example.edu", until=30.0)
+
+    assert store.acquire("iiif.example.edu", rate=0, burst=1, now=10.0) == 20.0
+    assert store.acquire("iiif.example.edu", rate=0, burst=1, now=30.0) == 0
+
+
+@pytest.fixture
+def dynamodb():
+    client = boto3.client("dynamodb", region_name="us-east-1", aws_access_key_id="test", aws_secret_access_key="test")
+    with Stubber(client) as stubber:
+        yield client, stubber
+        stubber.assert_no_pending_responses()
+
+
+def bucket_item(tokens, updated, blocked_until=0.0):
+    return {
+        "host": {"S": "iiif.example.edu"},
+        "tokens": {"N": repr(tokens)},
+        "updated": {"N": repr(updated)},
+        "blocked_until": {"N": repr(blocked_until)},
+    }
+
+
+def get_bucket(stubber, item=None):
+    stubber.add_response(
+        "get_item",
+        {"Item": item} if item else {},
+        {"TableName": "limits", "Key": {"host": {"S": "iiif.example.edu"}}, "ConsistentRead": True},
+    )
+
+
+def token_update(tokens, updated, condition, values=None):
+    # Only the token fields are written, leaving blocked_until to block()
+    return {
+        "TableName": "limits",
+        "Key": {"host": {"S": "iiif.example.edu"}},
+        "UpdateExpression": "SET tokens = :tokens, updated = :updated",
+        "ConditionExpression": condition,
+        "ExpressionAttributeValues": {
+            ":tokens": {"N": repr(tokens)},
+            ":updated": {"N": repr(updated)},
+            **(values or {}),
+        },
+    }
+
+
+def test_dynamo_token_store_takes_token_with_conditional_update(dynamodb):
+    client, stubber = dynamodb
+    store = ratelimit.DynamoTokenStore(client, "limits")
+    get_bucket(stubber)
+    stubber.add_response(
+        "update_item",
+        {},
+        token_update(1.0, 10.0, "attribute_not_exists(updated)"),
+    )
+    get_bucket(stubber, bucket_item(1.0, 10.0))
+    stubber.add_response(
+        "update_item",
+        {},
+        token_update(0.5, 10.25, "updated = :previous", {":previous": {"N": "10.0"}}),
+    )
+
+    assert store.acquire("iiif.example.edu", rate=2.0, burst=2.0, now=10.0) == 0
+    # Half a token refilled since the last update, plus the one left
+    assert store.acquire("iiif.example.edu", rate=2.0, burst=2.0, now=10.25) == 0
+
+
+def test_dynamo_token_store_retries_on_contention(dynamodb):
+    client, stubber = dynamodb
+    store = ratelimit.DynamoTokenStore(client, "limits", max_conflicts=2)
+    # Another invocation takes the token between our read and our write, twice
+    for _ in range(2):
+        get_bucket(stubber, bucket_item(2.0, 10.0))
+        stubber.add_client_error("update_item", "ConditionalCheckFailedException")
+
+    # Out of attempts, it backs off for one token's worth of time
+    assert store.acquire("iiif.example.edu", rate=4, burst=2, now=10.0) == 0.25
+
+
+def test_dynamo_token_store_waits_for_empty_bucket_or_block(dynamodb):
+    client, stubber = dynamodb
+    store = ratelimit.DynamoTokenStore(client, "limits")
+    get_bucket(stubber, bucket_item(0.0, 10.0))
+    get_bucket(stubber, bucket_item(2.0, 10.0, blocked_until=40.0))
+
+    # Neither read is followed by a write
+    assert store.acquire("iiif.example.edu", rate=2, burst=2, now=10.0) == 0.5
+    assert store.acquire("iiif.example.edu", rate=2, burst=2, now=10.0) == 30.0
+
+
+def test_dynamo_token_store_block_keeps_later_block(dynamodb):
+    client, stubber = dynamodb
+    store = ratelimit.DynamoTokenStore(client, "limits")
+    stubber.add_client_error("update_item", "ConditionalCheckFailedException")
+
+    store.block("iiif.example.edu", until=50.0)
@@ -0,0 +1,221 @@
+"""Unit tests for the orphan reconciliation Lambda function."""
+
+import gzip
+import importlib
+import io
+import json
+from unittest.mock import Mock
+
+import pytest
+from shared import document_keys, ead_cache
+
+KEEP_URI = "https://example.edu/iiif/manifest/keep"
+GONE_URI = "https://example.edu/iiif/manifest/gone"
+
+
+@pytest.fixture
+def reconcile_mod(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("DEST_BUCKET", "data-bucket")
+    mod = importlib.reload(importlib.import_module("reconcile.index"))
+    mod.s3 = Mock()
+    mod.s3.delete_objects.return_value = {}
+    return mod
+
+
+def listing(mod, objects_by_prefix):
+    paginator = Mock()
+    paginator.paginate.side_effect = lambda Bucket, Prefix: [{"Contents": objects_by_prefix.get(Prefix, [])}]
+    mod.s3.get_paginator.return_value = paginator
+
+
+def deleted_keys(mod):
+    return [item["Key"] for call in mod.s3.delete_objects.call_args_list for item in call.kwargs["Delete"]["Objects"]]
+
+
+def test_iiif_orphans_include_canvas_documents(reconcile_mod):
+    keys = [
+        f"data/iiif/{document_keys.iiif_document_name(KEEP_URI)}",
+        f"data/iiif/{document_keys.iiif_document_name(GONE_URI)}",
+        f"data/iiif/{document_keys.iiif_canvas_document_name(GONE_URI, 3)}",
+        "data/iiif/README.txt",
+    ]
+
+    assert reconcile_mod.iiif_orphans(keys, {KEEP_URI}) == keys[1:3]
+
+
+def test_partial_list_only_moves_misplaced_documents(reconcile_mod):
+    reconcile_mod.SHARDS = 4
+    shard = document_keys.iiif_shard(document_keys.iiif_uri_hash(KEEP_URI), 4)
+    name = document_keys.iiif_document_name(KEEP_URI)
+    keys = [
+        f"data/iiif/{shard}{name}",
+        f"data/iiif/{name}",
+        f"data/iiif/{document_keys.iiif_document_name(GONE_URI)}",
+    ]
+
+    assert reconcile_mod.iiif_orphans(keys, {KEEP_URI}, partial=True) == [keys[1]]
+
+
+def test_read_manifest_uris_from_jsonl(reconcile_mod):
+    rows = [{"uri": KEEP_URI, "label": "Kept", "navDate": None}, {"uri": GONE_URI, "label": None, "navDate": None}]
+    body = "".join(json.dumps(row) + "\n" for row in rows)
+    reconcile_mod.s3.get_object.return_value = {"Body": io.BytesIO(body.encode())}
+
+    assert reconcile_mod.read_manifest_uris("data-bucket", "manifests.jsonl") == {KEEP_URI, GONE_URI}
+
+
+def test_iiif_handler_deletes_orphans(reconcile_mod):
+    reconcile_mod.s3.get_object.return_value = {"Body": io.BytesIO(f"{KEEP_URI}\n\n".encode())}
+    listing(
+        reconcile_mod,
+        {
+            "data/iiif/": [
+                {"Key": f"data/iiif/{document_keys.iiif_document_name(KEEP_URI)}"},
+                {"Key": f"data/iiif/{document_keys.iiif_document_name(GONE_URI)}"},
+            ]
+        },
+    )
+
+    report = reconcile_mod.handler(
+        {"workflowType": "iiif", "s3": {"Bucket": "data-bucket", "Key": "manifests.csv"}}, None
+    )
+
+    assert report["expected"] == 1
+    assert report["orphans"] == 1
+    assert report["deleted"] == 1
+    assert deleted_keys(reconcile_mod) == [f"data/iiif/{document_keys.iiif_document_name(GONE_URI)}"]
+
+
+def test_ead_handler_deletes_documents_and_stale_cache(reconcile_mod):
+    listing(
+        reconcile_mod,
+        {
+            "finding-aids/": [{"Key": "finding-aids/keep.xml", "ETag": '"abc"'}],
+            "data/ead/": [{"Key": "data/ead/keep.json"}, {"Key": "data/ead/gone.json"}, {"Key": "data/ead/x.json"}],
+            "cache/ead/": [
+                {"Key": ead_cache.cache_key("cache/ead/", '"abc"')},
+                {"Key": ead_cache.cache_key("cache/ead/", '"old"')},
+            ],
+        },
+    )
+
+    report = reconcile_mod.handler(
+        {"workflowType": "ead", "s3": {"Bucket": "source-bucket", "Prefix": "finding-aids/"}, "force": True}, None
+    )
+
+    assert report["orphans"] == 2
+    assert report["cacheOrphans"] == 1
+    assert deleted_keys(reconcile_mod) == [
+        "data/ead/gone.json",
+        "data/ead/x.json",
+        ead_cache.cache_key("cache/ead/", '"old"'),
+    ]
+
+
+def test_mass_deletion_is_skipped_without_force(reconcile_mod):
+    reconcile_mod.s3.get_object.return_value = {"Body": io.BytesIO(b"")}
+    listing(reconcile_mod, {"data/iiif/": [{"Key": f"data/iiif/{document_keys.iiif_document_name(GONE_URI)}"}]})
+
+    report = reconcile_mod.handler(
+        {"workflowType": "iiif", "s3": {"Bucket": "data-bucket", "Key": "manifests.csv"}}, None
+    )
+
+    assert report["skipped"]
+    assert report["deleted"] == 0
+    reconcile_mod.s3.delete_objects.assert_not_called()
+
+
+def test_mass_deletion_guard_keeps_ead_cache(reconcile_mod):
+    # A truncated source listing: one finding aid left of three
+    listing(
+        reconcile_mod,
+        {
+            "finding-aids/": [{"Key": "finding-aids/keep.xml", "ETag": '"abc"'}],
+            "data/ead/": [{"Key": "data/ead/keep.json"}, {"Key": "data/ead/a.json"}, {"Key": "data/ead/b.json"}],
+            "cache/ead/": [{"Key": ead_cache.cache_key("cache/ead/", etag)} for etag in ('"abc"', '"a"', '"b"')],
+        },
+    )
+    reconcile_mod.telemetry = Mock()
+
+    report = reconcile_mod.handler(
+        {"workflowType": "ead", "s3": {"Bucket": "source-bucket", "Prefix": "finding-aids/"}}, None
+    )
+
+    assert report["skipped"]
+    assert (report["orphans"], report["cacheOrphans"], report["deleted"]) == (0, 0, 0)
+    reconcile_mod.s3.delete_objects.assert_not_called()
+    assert reconcile_mod.telemetry.emit_metrics.call_args.args[0]["CacheOrphans"] == 0
+
+
+def test_refused_removals_kept_in_pending_state(reconcile_mod):
+    state = gzip.compress(json.dumps({"manifests": {KEEP_URI: ["fp", 1], GONE_URI: ["fp", 2]}}).encode())
+    pending = gzip.compress(json.dumps({"manifests": {KEEP_URI: ["fp", 3]}}).encode())
+    objects = {"manifests.removed.csv": f"{GONE_URI}\n".encode(), "state.json.gz": state, "pending.json.gz": pending}
+    reconcile_mod.s3.get_object.side_effect = lambda Bucket, Key: {"Body": io.BytesIO(objects[Key])}
+    gone_hash = document_keys.iiif_uri_hash(GONE_URI)
+    listing(
+        reconcile_mod, {f"data/iiif/{gone_hash}": [{"Key": f"data/iiif/{document_keys.iiif_document_name(GONE_URI)}"}]}
+    )
+    plan = {
+        "Bucket": "data-bucket",
+        "RemovalsKey": "manifests.removed.csv",
+        "StateKey": "state.json.gz",
+        "PendingStateKey": "pending.json.gz",
+        "full": False,
+        "total": 1,
+        "previous": 2,
+    }
+    event = {"workflowType": "iiif", "s3": {"Bucket": "data-bucket", "Key": "manifests.csv"}, "plan": plan}
+    reconcile_mod.MAX_DELETE_FRACTION = 0.25
+
+    report = reconcile_mod.handler({**event, "force": False}, None)
+
+    assert report["skipped"]
+    reconcile_mod.s3.delete_objects.assert_not_called()
+    put = reconcile_mod.s3.put_object.call_args.kwargs
+    assert put["Key"] == "pending.json.gz"
+    assert json.loads(gzip.decompress(put["Body"]))["manifests"] == {KEEP_URI: ["fp", 3], GONE_URI: ["fp", 2]}
+
+    reconcile_mod.s3.put_object.reset_mock()
+    report = reconcile_mod.handler({**event, "force": True}, None)
+
+    assert (report["skipped"], report["deleted"]) == (None, 1)
+    reconcile_mod.s3.put_object.assert_not_called()
+
+
+def test_planned_removals_delete_only_removed_manifests(reconcile_mod):
+    reconcile_mod.s3.get_object.return_value = {"Body": io.BytesIO(f"{GONE_URI}\n".encode())}
+    gone_hash = document_keys.iiif_uri_hash(GONE_URI)
+    listing(
+        reconcile_mod,
+        {
+            f"data/iiif/{gone_hash}": [
+                {"Key": f"data/iiif/{document_keys.iiif_document_name(GONE_URI)}"},
+                {"Key": f"data/iiif/{document_keys.iiif_canvas_document_name(GONE_URI, 1)}"},
+            ]
+        },
+    )
+    plan = {"Bucket": "data-bucket", "RemovalsKey": "manifests.removed.csv", "full": False, "total": 9, "previous": 10}
+
+    report = reconcile_mod.handler(
+        {"workflowType": "iiif", "s3": {"Bucket": "data-bucket", "Key": "manifests.csv"}, "plan": plan}, None
+    )
+
+    assert report["expected"] == 9
+    assert report["deleted"] == 2
+    reconcile_mod.s3.get_object.assert_called_once_with(Bucket="data-bucket", Key="manifests.removed.csv")
+
+
+def test_documents_outside_their_shard_are_orphans(reconcile_mod):
+    reconcile_mod.SHARDS = 4
+    shard = document_keys.iiif_shard(document_keys.iiif_uri_hash(KEEP_URI), 4)
+    name = document_keys.iiif_document_name(KEEP_URI)
+    keys = [f"data/iiif/{shard}{name}", f"data/iiif/{name}"]
+
+    assert shard.startswith("shard-")
+    assert reconcile_mod.iiif_orphans(keys, {KEEP_URI}) == keys[1:]
+
+    ead_name = document_keys.ead_document_name("ead/finding-aid.xml")
+    ead_keys = [f"data/ead/{document_keys.ead_shard(ead_name, 4)}{ead_name}", f"data/ead/{ead_name}"]
+    assert reconcile_mod.ead_orphans(ead_keys, ["ead/finding-aid.xml"]) == ead_keys[1:]
@@ -0,0 +1,135 @@
+"""Unit tests for the end-to-end run report."""
+
+import importlib
+import json
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock
+
+import pytest
+
+START = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def report_mod(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("DEST_BUCKET", "data-bucket")
+    mod = importlib.reload(importlib.import_module("run_report.index"))
+    mod.s3 = Mock()
+    mod.sfn = Mock()
+    return mod
+
+
+def at(seconds):
+    return START + timedelta(seconds=seconds)
+
+
+def state_event(kind, name, seconds):
+    key = "stateEnteredEventDetails" if kind == "Entered" else "stateExitedEventDetails"
+    return {"type": f"TaskState{kind}", "timestamp": at(seconds), key: {"name": name}}
+
+
+def test_stage_durations_sum_repeated_states(report_mod):
+    events = [
+        state_event("Entered", "PlanIiifManifests", 0),
+        state_event("Exited", "PlanIiifManifests", 5),
+        {"type": "MapRunStarted", "timestamp": at(5), "mapRunStartedEventDetails": {"mapRunArn": "run-1"}},
+        state_event("Entered", "GetIngestionJob", 10),
+        state_event("Exited", "GetIngestionJob", 11),
+        state_event("Entered", "GetIngestionJob", 20),
+        state_event("Exited", "GetIngestionJob", 22.5),
+    ]
+
+    stages, map_runs = report_mod.stage_durations(events)
+
+    assert stages == {"PlanIiifManifests": 5.0, "GetIngestionJob": 3.5}
+    assert map_runs == ["run-1"]
+
+
+def test_handler_writes_report(report_mod):
+    paginator = Mock()
+    paginator.paginate.return_value = [{"events": []}]
+    report_mod.sfn.get_paginator.return_value = paginator
+    listing = Mock()
+    listing.paginate.return_value = [
+        {"Contents": [{"Size": 100, "LastModified": at(-60)}, {"Size": 40, "LastModified": at(30)}]}
+    ]
+    report_mod.s3.get_paginator.return_value = listing
+    job = {
+        "IngestionJobId": "job-1",
+        "Status": "COMPLETE",
+        "StartedAt": "2024-05-01T12:01:00Z",
+        "UpdatedAt": "2024-05-01T12:01:50Z",
+        "Statistics": {"NumberOfDocumentsScanned": 100, "NumberOfDocumentsFailed": 2},
+    }
+
+    result = report_mod.handler(
+        {
+            "executionArn": "arn:aws:states:us-east-1:123:execution:machine:run-1",
+            "startTime": "2024-05-01T12:00:00Z",
+            "workflowType": "ead",
+            "ingestion": [{"type": "ead", "IngestionJob": job}],
+        },
+        None,
+    )
+
+    body = json.loads(report_mod.s3.put_object.call_args.kwargs["Body"])
+    assert result == {"Bucket": "data-bucket", "Key": "reports/run-1.json", "status": "COMPLETE"}
+    assert body["ingestion"][0]["type"] == "ead"
+    assert body["ingestion"][0]["seconds"] == 50.0
+    assert body["ingestion"][0]["documents_per_second"] == 2.0
+    assert body["ingestion"][0]["documents"]["failed"] == 2
+    assert body["bytes"] == {"data_source": 140, "written": 40}
+    assert body["maps"]["runs"] == 0
+
+
+DATA_SOURCES = [
+    {"type": "iiif", "prefix": "data/iiif/", "dataSourceId": "iiif-ds"},
+    {"type": "ead", "prefix": "data/ead/", "dataSourceId": "ead-ds"},
+]
+
+
+def test_changes_counts_written_and_deleted_documents(report_mod):
+    listing = Mock()
+    listing.paginate.return_value = [
+        {
+            "Contents": [
+                {"Key": "data/ead/old.txt", "LastModified": at(-60)},
+                {"Key": "data/ead/new.txt", "LastModified": at(30)},
+            ]
+        }
+    ]
+    report_mod.s3.get_paginator.return_value = listing
+
+    changes = report_mod.changes_handler(
+        {
+            "startTime": "2024-05-01T12:00:00Z",
+            "workflowType": "ead",
+            "reconciliation": {"workflowType": "ead", "orphans": 2, "dryRun": False},
+            "dataSources": DATA_SOURCES,
+        },
+        None,
+    )
+
+    assert changes == {"written": 1, "deleted": 2, "count": 3, "dataSources": [DATA_SOURCES[1]]}
+
+
+def test_changes_ingests_only_changed_data_sources_in_incremental_mode(report_mod):
+    listing = Mock()
+    listing.paginate.return_value = [{"Contents": [{"Key": "data/iiif/new.txt", "LastModified": at(30)}]}]
+    report_mod.s3.get_paginator.return_value = listing
+    event = {
+        "startTime": "2024-05-01T12:00:00Z",
+        "workflowType": "all",
+        "reconciliation": [
+            {"workflowType": "iiif", "orphans": 2, "dryRun": False},
+            {"workflowType": "ead", "orphans": 5, "dryRun": True},
+        ],
+        "dataSources": DATA_SOURCES,
+    }
+
+    full = report_mod.changes_handler({**event, "mode": "full"}, None)
+    incremental = report_mod.changes_handler({**event, "mode": "incremental"}, None)
+
+    assert full["dataSources"] == DATA_SOURCES
+    assert incremental == {"written": 1, "deleted": 2, "count": 3, "dataSources": [DATA_SOURCES[0]]}
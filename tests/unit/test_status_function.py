@@ -208,6 +208,22 @@ class TestStatusHandler:
             assert body["totalJobs"] == 1
             assert body["ingestionJobs"][0]["status"] == "COMPLETE"
 
+    def test_status_handler_lists_jobs_of_every_data_source(self, status_mod, monkeypatch):
+        """Test the handler with a data source per source type."""
+        monkeypatch.setenv("DATA_SOURCE_ID", "iiif-ds-id,ead-ds-id")
+        with patch("src.treetop.functions.status.index.get_ingestion_jobs_status") as mock_get_jobs:
+            mock_get_jobs.side_effect = [
+                [{"ingestionJobId": "iiif-job", "startedAt": datetime(2024, 1, 1).isoformat()}],
+                [{"ingestionJobId": "ead-job", "startedAt": datetime(2024, 1, 2).isoformat()}],
+            ]
+
+            admin_token = create_mock_jwt_token(["Admin"])
+            response = status_mod.handler({"headers": {"Authorization": f"Bearer {admin_token}"}}, Mock())
+
+            body = json.loads(response["body"])
+            assert [job["ingestionJobId"] for job in body["ingestionJobs"]] == ["ead-job", "iiif-job"]
+            assert body["ingestionJobs"][1]["dataSourceId"] == "iiif-ds-id"
+
     def test_handler_non_admin_user_denied(self, status_mod):
         """Test handler with non-admin user returns 403."""
         user_token = create_mock_jwt_token(["User"])
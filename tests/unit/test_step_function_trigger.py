@@ -0,0 +1,62 @@
+"""Unit tests for the function that starts state machine executions."""
+
+import importlib
+import json
+from datetime import datetime
+from unittest.mock import Mock
+
+import pytest
+
+
+@pytest.fixture
+def trigger_mod(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("STATE_MACHINE_ARN", "arn:aws:states:us-east-1:123:stateMachine:treetop")
+    monkeypatch.setenv("BUCKET", "data-bucket")
+    monkeypatch.setenv("WORKFLOW_TYPE", "ead")
+    monkeypatch.setenv("SOURCE_BUCKET", "source-bucket")
+    monkeypatch.setenv("SOURCE_PREFIX", "ead/")
+    mod = importlib.reload(importlib.import_module("step_function_trigger.index"))
+    mod.sfn = Mock()
+    mod.sfn.start_execution.return_value = {"executionArn": "arn:execution", "startDate": datetime(2024, 5, 1)}
+    return mod
+
+
+def test_scheduled_run_starts_in_incremental_mode(trigger_mod):
+    trigger_mod.sfn.list_executions.return_value = {"executions": []}
+
+    response = trigger_mod.handler({"mode": "incremental"}, None)
+
+    assert response["statusCode"] == 200
+    execution_input = json.loads(trigger_mod.sfn.start_execution.call_args.kwargs["input"])
+    assert execution_input["mode"] == "incremental"
+    assert execution_input["s3"] == {"Bucket": "source-bucket", "Prefix": "ead/"}
+
+
+def test_refuses_to_overlap_a_running_execution(trigger_mod):
+    trigger_mod.sfn.list_executions.return_value = {"executions": [{"name": "ead-1234abcd"}]}
+
+    response = trigger_mod.handler({}, None)
+
+    assert response["statusCode"] == 409
+    assert json.loads(response["body"])["running"] == ["ead-1234abcd"]
+    trigger_mod.sfn.start_execution.assert_not_called()
+
+
+def test_multi_source_stack_runs_every_source(trigger_mod, monkeypatch):
+    monkeypatch.setenv("WORKFLOW_TYPE", "iiif,ead")
+    monkeypatch.setenv("SOURCE_COLLECTION", "https://example.org/collection")
+    monkeypatch.setenv("COLLECTION_FILENAME", "manifests.jsonl")
+    trigger_mod.sfn.list_executions.return_value = {"executions": []}
+
+    trigger_mod.handler({}, None)
+
+    execution_input = json.loads(trigger_mod.sfn.start_execution.call_args.kwargs["input"])
+    assert execution_input["workflowType"] == "all"
+    assert execution_input["sources"]["iiif"]["s3"] == {"Bucket": "data-bucket", "Key": "manifests.jsonl"}
+    assert execution_input["sources"]["ead"]["s3"] == {"Bucket": "source-bucket", "Prefix": "ead/"}
+
+    trigger_mod.handler({"workflowType": "ead"}, None)
+
+    execution_input = json.loads(trigger_mod.sfn.start_execution.call_args.kwargs["input"])
+    assert list(execution_input["sources"]) == ["ead"]
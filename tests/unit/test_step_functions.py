@@ -0,0 +1,695 @@
+import json
+
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+import pytest
+
+from treetop.stacks.treetop_stack import TreetopStack
+
+
+def build_template(data, **context):
+    app = core.App()
+    app.node.set_context("stack_prefix", "alice")
+    app.node.set_context("data", data)
+    app.node.set_context(
+        "embedding_model_arn", "arn:aws:sagemaker:us-east-1:123456789012:model/bedrock-embedding-model"
+    )
+    app.node.set_context(
+        "foundation_model_arn", "arn:aws:sagemaker:us-east-1:123456789012:model/bedrock-embedding-model"
+    )
+    for key, value in context.items():
+        app.node.set_context(key, value)
+    app.node.set_context("aws:cdk:bundling-stacks", [])  # Disable bundling to speed up tests
+    stack = TreetopStack(app, "alice-Treetop", env={"account": "123456789012", "region": "us-east-1"})
+    return assertions.Template.from_stack(stack)
+
+
+def state_machine_definition(template, name="TreetopStackSpinup"):
+    """Return the state machine definition as a dict, with CloudFormation tokens replaced by placeholders."""
+    (resource,) = [
+        resource
+        for logical_id, resource in template.find_resources("AWS::StepFunctions::StateMachine").items()
+        if name in logical_id
+    ]
+    definition = resource["Properties"]["DefinitionString"]
+    if isinstance(definition, dict):
+        definition = "".join(part if isinstance(part, str) else "TOKEN" for part in definition["Fn::Join"][1])
+    return json.loads(definition)
+
+
+def find_state(states, name):
+    """Find a state by name, searching nested Map/Parallel processors."""
+    for state_name, state in states.items():
+        if state_name == name:
+            return state
+        processors = [state.get("ItemProcessor"), state.get("Iterator"), *state.get("Branches", [])]
+        for processor in filter(None, processors):
+            found = find_state(processor["States"], name)
+            if found:
+                return found
+    return None
+
+
+@pytest.fixture(scope="module")
+def iiif_template():
+    return build_template(
+        {"type": "iiif", "collection_url": "http://example.com"},
+        ecr={"registry": "public.ecr.aws", "repository": "nulib-staging/treetop-iiif-fetcher", "tag": "latest"},
+    )
+
+
+@pytest.fixture(scope="module")
+def ead_template():
+    return build_template({"type": "ead", "s3": {"bucket": "test-bucket", "prefix": "test-prefix/"}})
+
+
+def test_shared_layer_created(ead_template):
+    ead_template.resource_count_is("AWS::Lambda::LayerVersion", 1)
+
+
+def test_ead_function_uses_parse_cache(ead_template):
+    ead_template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Environment": {
+                "Variables": assertions.Match.object_like(
+                    {"DEST_PREFIX": "data/ead/", "CACHE_PREFIX": "cache/ead/", "DEBUG_SAMPLE_CHUNKS": "0"}
+                )
+            },
+            "Layers": [{"Ref": assertions.Match.string_like_regexp("SharedFunctionsLayer.*")}],
+        },
+    )
+
+
+def test_chunking_budgets_passed_to_functions(ead_template):
+    ead_template.resource_properties_count_is(
+        "AWS::Lambda::Function",
+        {
+            "Environment": {
+                "Variables": assertions.Match.object_like(
+                    {"CHUNK_TARGET_TOKENS": "200", "CHUNK_MAX_TOKENS": "300", "CHUNK_MIN_TOKENS": "40"}
+                )
+            }
+        },
+        2,
+    )
+
+
+def test_chunking_budgets_configurable():
+    template = build_template(
+        {"type": "ead", "s3": {"bucket": "test-bucket", "prefix": "test-prefix/"}},
+        chunking={"max_tokens": 250},
+    )
+
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {"Environment": {"Variables": assertions.Match.object_like({"CHUNK_MAX_TOKENS": "250"})}},
+    )
+
+
+def test_iiif_map_batches_manifests(iiif_template):
+    states = state_machine_definition(iiif_template)["States"]
+    iiif_map = find_state(states, "IIIFDistributedMapWithItemReader")
+
+    assert iiif_map["ItemBatcher"] == {"MaxItemsPerBatch": 20}
+    fetch = find_state(states, "InvokeFetchManifest")
+    assert fetch["Parameters"]["Payload"] == {"rows.$": "$.Items"}
+    iiif_template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {"Environment": {"Variables": assertions.Match.object_like({"BATCH_CONCURRENCY": "10"})}},
+    )
+
+
+def test_iiif_fetch_rate_limit_defaults(iiif_template):
+    iiif_template.resource_count_is("AWS::DynamoDB::Table", 0)
+    iiif_template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Environment": {
+                "Variables": assertions.Match.object_like(
+                    {"HOST_RATE_LIMIT": "0", "HOST_BURST": "0", "MAX_ATTEMPTS": "5", "MAX_RETRY_AFTER": "60"}
+                )
+            }
+        },
+    )
+
+
+def test_iiif_fetch_shared_rate_limit_table():
+    template = build_template(
+        {"type": "iiif", "collection_url": "http://example.com"},
+        rate_limit={"requests_per_second": 8, "burst": 16},
+    )
+
+    template.has_resource_properties(
+        "AWS::DynamoDB::Table",
+        {"KeySchema": [{"AttributeName": "host", "KeyType": "HASH"}], "BillingMode": "PAY_PER_REQUEST"},
+    )
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Environment": {
+                "Variables": assertions.Match.object_like(
+                    {
+                        "HOST_RATE_LIMIT": "8",
+                        "HOST_BURST": "16",
+                        "RATE_LIMIT_TABLE": {"Ref": assertions.Match.string_like_regexp("HostRateLimitTable.*")},
+                    }
+                )
+            }
+        },
+    )
+
+
+def test_iiif_fetch_max_retry_after_must_fit_timeout():
+    with pytest.raises(ValueError, match="max_retry_after_seconds"):
+        build_template(
+            {"type": "iiif", "collection_url": "http://example.com"}, rate_limit={"max_retry_after_seconds": 300}
+        )
+
+
+def test_iiif_fetch_memory_and_streaming_configurable():
+    template = build_template(
+        {"type": "iiif", "collection_url": "http://example.com"},
+        manifest_fetch_memory=1024,
+        manifest_stream_threshold_mb=2,
+    )
+
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "MemorySize": 1024,
+            "Environment": {"Variables": assertions.Match.object_like({"STREAM_THRESHOLD_BYTES": "2000000"})},
+        },
+    )
+
+
+def test_iiif_annotation_harvesting_configurable(iiif_template):
+    iiif_template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {"Environment": {"Variables": assertions.Match.object_like({"HARVEST_ANNOTATIONS": ""})}},
+    )
+
+    template = build_template(
+        {"type": "iiif", "collection_url": "http://example.com"},
+        annotations={"mode": "canvas", "concurrency": 8},
+    )
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Environment": {
+                "Variables": assertions.Match.object_like(
+                    {
+                        "HARVEST_ANNOTATIONS": "canvas",
+                        "ANNOTATION_CONCURRENCY": "8",
+                        "ANNOTATION_CACHE_PREFIX": "cache/iiif-annotations/",
+                    }
+                )
+            }
+        },
+    )
+
+
+def test_reconciliation_runs_before_each_map(iiif_template, ead_template):
+    iiif_states = state_machine_definition(iiif_template)["States"]
+    assert iiif_states["PlanIiifManifests"]["Next"] == "ReconcileIiifDocuments"
+    assert iiif_states["ReconcileIiifDocuments"]["Next"] == "HasManifestChanges"
+    assert iiif_states["ReconcileIiifDocuments"]["ResultPath"] == "$.reconciliation"
+
+    ead_states = state_machine_definition(ead_template)["States"]
+    assert ead_states["ReconcileEadDocuments"]["Next"] == "EadDistributedMapWithItemReader"
+    ead_template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Environment": {
+                "Variables": assertions.Match.object_like({"MAX_DELETE_FRACTION": "0.5", "DRY_RUN": "false"})
+            }
+        },
+    )
+
+
+def test_crawler_task_configured_and_retried(iiif_template):
+    states = state_machine_definition(iiif_template)["States"]
+    run_task = states["TreetopRunFargateManifestFetcherTask"]
+
+    environment = run_task["Parameters"]["Overrides"]["ContainerOverrides"][0]["Environment"]
+    assert {"Name": "CRAWL_CONCURRENCY", "Value": "8"} in environment
+    assert {"Name": "CHECKPOINT_INTERVAL", "Value": "60"} in environment
+    assert run_task["Retry"][0]["ErrorEquals"] == ["States.TaskFailed"]
+
+
+def test_iiif_map_reads_planned_delta(iiif_template):
+    states = state_machine_definition(iiif_template)["States"]
+
+    assert states["TreetopRunFargateManifestFetcherTask"]["Next"] == "PlanIiifManifests"
+    assert states["PlanIiifManifests"]["ResultPath"] == "$.plan"
+    assert states["HasManifestChanges"]["Choices"][0]["Next"] == "IIIFDistributedMapWithItemReader"
+    assert states["HasManifestChanges"]["Default"] == "NoManifestChanges"
+    assert states["IIIFDistributedMapWithItemReader"]["ItemReader"]["Parameters"]["Key.$"] == "$.plan.Key"
+    assert states["IIIFDistributedMapWithItemReader"]["Next"] == "RecordFailedManifests"
+    assert states["RecordFailedManifests"]["Parameters"]["resultWriter.$"] == "$.processing.ResultWriterDetails"
+    assert states["RecordFailedManifests"]["Next"] == "CommitManifestState"
+    assert states["IIIFDistributedMapWithItemReader"]["ResultPath"] == "$.processing"
+    assert states["CommitManifestState"]["Parameters"]["Key.$"] == "$.plan.StateKey"
+    assert states["CommitManifestState"]["Next"] == "DetectDocumentChanges"
+    iiif_template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Environment": {
+                "Variables": assertions.Match.object_like(
+                    {"STATE_PREFIX": "state/iiif-manifests/", "REVALIDATE_DAYS": "7"}
+                )
+            }
+        },
+    )
+
+
+def test_manifest_list_format_jsonl():
+    template = build_template(
+        {"type": "iiif", "collection_url": "http://example.com"},
+        ecr={"registry": "public.ecr.aws", "repository": "nulib-staging/treetop-iiif-fetcher", "tag": "latest"},
+        manifest_list_format="jsonl",
+    )
+    states = state_machine_definition(template)["States"]
+
+    assert find_state(states, "IIIFDistributedMapWithItemReader")["ItemReader"]["ReaderConfig"] == {
+        "InputType": "JSONL"
+    }
+    environment = states["TreetopRunFargateManifestFetcherTask"]["Parameters"]["Overrides"]["ContainerOverrides"][0][
+        "Environment"
+    ]
+    assert {"Name": "MANIFEST_LIST_KEY", "Value.$": "$.s3.Key"} in environment
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {"Environment": {"Variables": assertions.Match.object_like({"COLLECTION_FILENAME": "manifests.jsonl"})}},
+    )
+
+
+def test_sharded_crawl():
+    template = build_template(
+        {"type": "iiif", "collection_url": "http://example.com"},
+        ecr={"registry": "public.ecr.aws", "repository": "nulib-staging/treetop-iiif-fetcher", "tag": "latest"},
+        crawler={"shards": 4, "cpu": 512, "memory": 1024},
+    )
+    states = state_machine_definition(template)["States"]
+
+    assert states["CrawlerChoice"]["Choices"][0]["Next"] == "PlanCrawlShards"
+    assert states["CrawlCollectionInLambda"]["Catch"][0]["Next"] == "PlanCrawlShards"
+    assert states["CrawlCollectionInLambda"]["Parameters"]["handoff"] == "restart"
+    assert states["ListCrawlShards"]["Result"] == {"shards": ["0", "1", "2", "3"]}
+    assert states["CrawlShards"]["MaxConcurrency"] == 4
+    assert states["CrawlShards"]["Next"] == "MergeCrawlShards"
+    assert states["MergeCrawlShards"]["Next"] == "PlanIiifManifests"
+    environment = find_state(states, "CrawlShard")["Parameters"]["Overrides"]["ContainerOverrides"][0]["Environment"]
+    assert {"Name": "CRAWL_MODE", "Value": "shard"} in environment
+    assert {"Name": "SHARD_INDEX", "Value.$": "$.shard"} in environment
+    template.has_resource_properties("AWS::ECS::TaskDefinition", {"Cpu": "512", "Memory": "1024"})
+
+
+def test_lambda_crawl_hands_off_to_fargate(iiif_template):
+    states = state_machine_definition(iiif_template)["States"]
+
+    assert states["CrawlerChoice"]["Default"] == "CrawlCollectionInLambda"
+    lambda_crawl = states["CrawlCollectionInLambda"]
+    assert lambda_crawl["Next"] == "PlanIiifManifests"
+    assert lambda_crawl["Catch"] == [
+        {
+            "ErrorEquals": ["CrawlHandoff", "Sandbox.Timedout"],
+            "ResultPath": "$.crawl_handoff",
+            "Next": "TreetopRunFargateManifestFetcherTask",
+        }
+    ]
+    assert lambda_crawl["Parameters"]["handoff"] == "resume"
+    iiif_template.has_resource_properties(
+        "AWS::Lambda::Function", {"Handler": "manifest_fetcher.handler", "Timeout": 900, "MemorySize": 1024}
+    )
+
+
+def test_lambda_only_crawler_skips_ecs():
+    template = build_template({"type": "iiif", "collection_url": "http://example.com"}, crawler={"mode": "lambda"})
+    states = state_machine_definition(template)["States"]
+
+    assert states["DataTypeChoice"]["Choices"][0]["Next"] == "CrawlCollectionInLambda"
+    assert "CrawlerChoice" not in states
+    template.resource_count_is("AWS::ECS::Cluster", 0)
+
+
+def test_map_children_are_express_by_default(iiif_template, ead_template):
+    iiif_map = find_state(state_machine_definition(iiif_template)["States"], "IIIFDistributedMapWithItemReader")
+    ead_map = find_state(state_machine_definition(ead_template)["States"], "EadDistributedMapWithItemReader")
+
+    assert iiif_map["ItemProcessor"]["ProcessorConfig"] == {"Mode": "DISTRIBUTED", "ExecutionType": "EXPRESS"}
+    assert ead_map["ItemProcessor"]["ProcessorConfig"]["ExecutionType"] == "EXPRESS"
+    assert iiif_map["ItemProcessor"]["States"]["InvokeFetchManifest"]["TimeoutSeconds"] == 290
+    assert ead_map["ItemProcessor"]["States"]["ProcessEadFile"]["TimeoutSeconds"] == 200
+    assert "ResultWriter" in iiif_map and "ResultWriter" in ead_map
+
+
+def test_map_execution_type_standard():
+    template = build_template(
+        {"type": "ead", "s3": {"bucket": "test-bucket", "prefix": "test-prefix/"}}, map_execution_type="standard"
+    )
+    ead_map = find_state(state_machine_definition(template)["States"], "EadDistributedMapWithItemReader")
+
+    assert ead_map["ItemProcessor"]["ProcessorConfig"]["ExecutionType"] == "STANDARD"
+    assert ead_map["ItemProcessor"]["States"]["ProcessEadFile"]["TimeoutSeconds"] == 43200
+
+
+def test_map_items_retried_with_failure_threshold(iiif_template, ead_template):
+    iiif_map = find_state(state_machine_definition(iiif_template)["States"], "IIIFDistributedMapWithItemReader")
+    ead_map = find_state(state_machine_definition(ead_template)["States"], "EadDistributedMapWithItemReader")
+
+    (retry,) = iiif_map["ItemProcessor"]["States"]["InvokeFetchManifest"]["Retry"]
+    assert retry["ErrorEquals"][:2] == ["RetryableError", "Lambda.TooManyRequestsException"]
+    assert (retry["MaxAttempts"], retry["BackoffRate"], retry["JitterStrategy"]) == (3, 2, "FULL")
+    assert ead_map["ItemProcessor"]["States"]["ProcessEadFile"]["Retry"] == [retry]
+    assert iiif_map["ToleratedFailurePercentage"] == ead_map["ToleratedFailurePercentage"] == 5
+
+
+def test_retries_configurable():
+    template = build_template(
+        {"type": "ead", "s3": {"bucket": "test-bucket", "prefix": "test-prefix/"}},
+        retries={"max_attempts": 5, "tolerated_failure_percentage": 0},
+    )
+    ead_map = find_state(state_machine_definition(template)["States"], "EadDistributedMapWithItemReader")
+
+    assert ead_map["ItemProcessor"]["States"]["ProcessEadFile"]["Retry"][0]["MaxAttempts"] == 5
+    assert ead_map["ToleratedFailurePercentage"] == 0
+
+
+def test_adaptive_concurrency_runs_maps_in_waves():
+    template = build_template(
+        {"type": "iiif", "collection_url": "http://example.com"},
+        ecr={"registry": "public.ecr.aws", "repository": "nulib-staging/treetop-iiif-fetcher", "tag": "latest"},
+        adaptive_concurrency={"enabled": True, "max": 20},
+    )
+    states = state_machine_definition(template)["States"]
+    iiif_map = states["IIIFDistributedMapWithItemReader"]
+
+    assert states["HasManifestChanges"]["Choices"][0]["Next"] == "SplitIiifWaves"
+    assert iiif_map["MaxConcurrencyPath"] == "$.waves.concurrency" and "MaxConcurrency" not in iiif_map
+    assert iiif_map["ItemReader"]["Parameters"]["Key.$"] == "$.waves.Key"
+    assert iiif_map["Next"] == "RecordFailedManifests"
+    assert states["RecordFailedManifests"]["Parameters"]["wave.$"] == "$.waves.index"
+    assert states["RecordFailedManifests"]["Next"] == "TuneIiifConcurrency"
+    assert states["TuneIiifConcurrency"]["Next"] == "MoreIiifWaves"
+    assert states["MoreIiifWaves"]["Choices"][0]["Next"] == "IIIFDistributedMapWithItemReader"
+    assert states["IiifWavesDone"]["Next"] == "CommitManifestState"
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {"Environment": {"Variables": assertions.Match.object_like({"MAX_CONCURRENCY": "20", "WAVE_SIZE": "2000"})}},
+    )
+
+
+def adaptive_environment(template):
+    environments = [
+        function["Properties"].get("Environment", {}).get("Variables", {})
+        for function in template.find_resources("AWS::Lambda::Function").values()
+    ]
+    return next(variables for variables in environments if "WAVE_SIZE" in variables)
+
+
+def test_adaptive_error_rate_below_tolerated_failures():
+    data = {"type": "ead", "s3": {"bucket": "test-bucket", "prefix": "test-prefix/"}}
+
+    default = adaptive_environment(build_template(data, adaptive_concurrency={"enabled": True}))
+    derived = adaptive_environment(
+        build_template(data, adaptive_concurrency={"enabled": True}, retries={"tolerated_failure_percentage": 10})
+    )
+
+    assert float(default["MAX_ERROR_RATE"]) == 0.025
+    assert float(derived["MAX_ERROR_RATE"]) == 0.05
+    with pytest.raises(ValueError, match="max_error_rate"):
+        build_template(data, adaptive_concurrency={"enabled": True, "max_error_rate": 0.05})
+
+
+def test_adaptive_concurrency_ead_reads_waves():
+    template = build_template(
+        {"type": "ead", "s3": {"bucket": "test-bucket", "prefix": "test-prefix/"}},
+        adaptive_concurrency={"enabled": True},
+    )
+    states = state_machine_definition(template)["States"]
+    ead_map = states["EadDistributedMapWithItemReader"]
+
+    assert states["ReconcileEadDocuments"]["Next"] == "SplitEadWaves"
+    assert ead_map["ItemReader"]["ReaderConfig"] == {"InputType": "JSONL"}
+    assert ead_map["Next"] == "TuneEadConcurrency"
+    assert states["EadWavesDone"]["Next"] == "DetectDocumentChanges"
+
+
+def test_ingestion_polled_until_finished_then_reported(ead_template):
+    states = state_machine_definition(ead_template)["States"]
+
+    assert states["IngestDataSources"]["ItemsPath"] == "$.changes.dataSources"
+    assert states["IngestDataSources"]["ResultPath"] == "$.ingestion"
+    assert states["IngestDataSources"]["Next"] == "WriteRunReport"
+    ingest = states["IngestDataSources"]["ItemProcessor"]["States"]
+    assert ingest["StartBedrockIngestion"]["Parameters"]["DataSourceId.$"] == "$.dataSource.dataSourceId"
+    assert ingest["StartBedrockIngestion"]["ResultPath"] == "$.ingestion"
+    assert ingest["StartBedrockIngestion"]["Next"] == "StartIngestionPolling"
+    assert ingest["StartIngestionPolling"]["Result"] == {"seconds": 15}
+    assert ingest["WaitForIngestion"]["SecondsPath"] == "$.poll.seconds"
+    assert ingest["GetIngestionJob"]["Resource"].endswith("bedrockagent:getIngestionJob")
+    assert ingest["IngestionFinished"]["Choices"][0]["Next"] == "IngestionJobFinished"
+    assert ingest["IngestionFinished"]["Default"] == "BackOffIngestionPolling"
+    assert ingest["BackOffIngestionPolling"]["Choices"][0]["NumericLessThanEquals"] == 150
+    assert ingest["DoublePollInterval"]["Next"] == "WaitForIngestion"
+    assert states["WriteRunReport"]["Next"] == "IngestionSucceeded"
+    assert states["IngestionSucceeded"]["Choices"][0]["Variable"] == "$.report.status"
+    assert states["IngestionSucceeded"]["Default"] == "IngestionFailed"
+    assert states["IngestionComplete"]["Next"] == "TaskCompleted"
+
+
+def test_ead_events_disabled_by_default(ead_template):
+    ead_template.resource_count_is("AWS::SQS::Queue", 0)
+    ead_template.resource_count_is("AWS::Events::Rule", 0)
+
+
+def test_ead_events_queue_source_changes():
+    template = build_template(
+        {"type": "ead", "s3": {"bucket": "test-bucket", "prefix": "test-prefix/"}},
+        ead_events={"enabled": True, "quiet_seconds": 120},
+    )
+
+    template.has_resource_properties(
+        "AWS::Events::Rule",
+        {
+            "EventPattern": {
+                "source": ["aws.s3"],
+                "detail-type": ["Object Created", "Object Deleted"],
+                "detail": {"bucket": {"name": ["test-bucket"]}, "object": {"key": [{"prefix": "test-prefix/"}]}},
+            }
+        },
+    )
+    template.resource_count_is("AWS::SQS::Queue", 3)
+    template.has_resource_properties(
+        "AWS::Lambda::EventSourceMapping",
+        {
+            "BatchSize": 1,
+            "FunctionResponseTypes": ["ReportBatchItemFailures"],
+            "ScalingConfig": {"MaximumConcurrency": 5},
+        },
+    )
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Handler": "index.sync_handler",
+            "Environment": {"Variables": assertions.Match.object_like({"QUIET_SECONDS": "120"})},
+        },
+    )
+
+
+def test_incremental_runs_ingest_only_changes(ead_template):
+    definition = state_machine_definition(ead_template)
+    states = definition["States"]
+
+    assert definition["StartAt"] == "HasRunMode"
+    assert states["DefaultRunMode"]["Result"] == "full"
+    assert states["DefaultRunMode"]["Next"] == "HasForce"
+    assert states["DefaultForce"]["Next"] == "DataTypeChoice"
+    assert states["EadDistributedMapWithItemReader"]["Parameters"]["mode.$"] == "$.mode"
+    assert states["EadDistributedMapWithItemReader"]["Next"] == "DetectDocumentChanges"
+    detect_changes = states["DetectDocumentChanges"]["Parameters"]
+    assert detect_changes["mode.$"] == "$.mode"
+    assert [source["type"] for source in detect_changes["dataSources"]] == ["ead"]
+    assert detect_changes["dataSources"][0]["prefix"] == "data/ead/"
+    assert states["HasDocumentChanges"]["Choices"][0]["Next"] == "IngestDataSources"
+    assert states["NothingToIngest"]["Next"] == "TaskCompleted"
+    ead_template.resource_count_is("AWS::Events::Rule", 0)
+
+
+def test_force_forwarded_to_reconciliation(iiif_template, ead_template):
+    iiif_states = state_machine_definition(iiif_template)["States"]
+    ead_states = state_machine_definition(ead_template)["States"]
+
+    assert iiif_states["DefaultForce"]["Result"] is False
+    assert iiif_states["HasForce"]["Choices"][0]["Next"] == "DefaultForce"
+    assert iiif_states["ReconcileIiifDocuments"]["Parameters"]["force.$"] == "$.force"
+    assert ead_states["ReconcileEadDocuments"]["Parameters"]["force.$"] == "$.force"
+
+
+def test_schedule_starts_incremental_runs():
+    template = build_template(
+        {"type": "ead", "s3": {"bucket": "test-bucket", "prefix": "test-prefix/"}},
+        schedule={"expression": "rate(6 hours)"},
+    )
+
+    template.has_resource_properties(
+        "AWS::Events::Rule",
+        {
+            "ScheduleExpression": "rate(6 hours)",
+            "Targets": [assertions.Match.object_like({"Input": '{"mode":"incremental"}'})],
+        },
+    )
+
+
+def test_multiple_sources_run_in_parallel():
+    template = build_template(
+        [
+            {"type": "iiif", "collection_url": "http://example.com"},
+            {"type": "ead", "s3": {"bucket": "test-bucket", "prefix": "test-prefix/"}},
+        ],
+        crawler={"mode": "lambda"},
+    )
+    states = state_machine_definition(template)["States"]
+
+    assert states["DefaultForce"]["Next"] == "RunSourcePipelines"
+    assert "DataTypeChoice" not in states
+    pipelines = states["RunSourcePipelines"]
+    assert pipelines["Next"] == "DetectDocumentChanges"
+    assert pipelines["ResultSelector"]["reconciliation.$"] == "$[*].reconciliation"
+    assert [branch["StartAt"] for branch in pipelines["Branches"]] == ["HasIiifSource", "HasEadSource"]
+    ead_branch = pipelines["Branches"][1]["States"]
+    assert ead_branch["SelectEadSource"]["Parameters"] == {"source.$": "States.JsonMerge($, $.sources.ead, false)"}
+    assert ead_branch["SelectEadSource"]["Next"] == "ReconcileEadDocuments"
+    assert "End" in ead_branch["EadDistributedMapWithItemReader"]
+    assert find_state(states, "DetectDocumentChanges")["Parameters"]["reconciliation.$"] == "$.pipelines.reconciliation"
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {"Environment": {"Variables": assertions.Match.object_like({"WORKFLOW_TYPE": "iiif,ead"})}},
+    )
+
+
+def test_sharded_data_sources_ingested_together():
+    template = build_template(
+        {"type": "ead", "s3": {"bucket": "test-bucket", "prefix": "test-prefix/"}}, ingestion={"shards": 3}
+    )
+    states = state_machine_definition(template)["States"]
+
+    template.resource_count_is("AWS::Bedrock::DataSource", 3)
+    template.has_resource_properties(
+        "AWS::Bedrock::DataSource",
+        {
+            "Name": "TreetopEadShard02S3DataSource",
+            "DataSourceConfiguration": {
+                "S3Configuration": assertions.Match.object_like({"InclusionPrefixes": ["data/ead/shard-02/"]}),
+                "Type": "S3",
+            },
+        },
+    )
+    template.has_resource_properties(
+        "AWS::Bedrock::DataSource",
+        {
+            "Name": "TreetopS3DataSource",
+            "DataSourceConfiguration": assertions.Match.object_like(
+                {"S3Configuration": assertions.Match.object_like({"InclusionPrefixes": ["data/ead/shard-00/"]})}
+            ),
+        },
+    )
+    data_sources = states["DetectDocumentChanges"]["Parameters"]["dataSources"]
+    assert [source["prefix"] for source in data_sources] == [f"data/ead/shard-{shard:02d}/" for shard in range(3)]
+    assert states["IngestDataSources"]["ItemsPath"] == "$.changes.dataSources"
+    assert states["IngestDataSources"].get("MaxConcurrency", 0) == 0
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Handler": "index.handler",
+            "Environment": {"Variables": assertions.Match.object_like({"DEST_PREFIX": "data/ead/", "SHARDS": "3"})},
+        },
+    )
+
+
+def test_data_sources_must_fit_knowledge_base_quota():
+    data = [
+        {"type": "iiif", "collection_url": "http://example.com"},
+        {"type": "ead", "s3": {"bucket": "test-bucket", "prefix": "test-prefix/"}},
+    ]
+
+    with pytest.raises(ValueError, match="6 data sources, more than the 5 allowed"):
+        build_template(data, ingestion={"shards": 3})
+    template = build_template(data, ingestion={"shards": 3, "max_data_sources": 6})
+
+    template.resource_count_is("AWS::Bedrock::DataSource", 6)
+
+
+def test_functions_keep_default_profile(ead_template):
+    ead_template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Handler": "index.handler",
+            "Runtime": "python3.11",
+            "Architectures": ["x86_64"],
+            "MemorySize": 512,
+            "Timeout": 180,
+            "Environment": {"Variables": assertions.Match.object_like({"DEST_PREFIX": "data/ead/"})},
+        },
+    )
+    # The deployment trigger included; CDK's own providers run on Node.js
+    runtimes = {
+        resource["Properties"].get("Runtime", "")
+        for resource in ead_template.find_resources("AWS::Lambda::Function").values()
+    }
+    assert {runtime for runtime in runtimes if runtime.startswith("python")} == {"python3.11"}
+
+
+def test_performance_profiles_configurable():
+    template = build_template(
+        {"type": "ead", "s3": {"bucket": "test-bucket", "prefix": "test-prefix/"}},
+        performance={
+            "architecture": "arm64",
+            "process_ead": {
+                "memory": 1024,
+                "timeout_seconds": 120,
+                "ephemeral_storage": 2048,
+                "reserved_concurrency": 10,
+                "runtime": "python3.12",
+            },
+        },
+    )
+    states = state_machine_definition(template)["States"]
+
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Runtime": "python3.12",
+            "Architectures": ["arm64"],
+            "MemorySize": 1024,
+            "Timeout": 120,
+            "EphemeralStorage": {"Size": 2048},
+            "ReservedConcurrentExecutions": 10,
+            "Environment": {"Variables": assertions.Match.object_like({"CACHE_PREFIX": "cache/ead/"})},
+        },
+    )
+    # The top-level architecture applies to the other functions, which keep their own sizes
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {"Handler": "index.changes_handler", "Architectures": ["arm64"], "MemorySize": 512, "Timeout": 300},
+    )
+    template.has_resource_properties("AWS::Lambda::LayerVersion", {"CompatibleArchitectures": ["x86_64", "arm64"]})
+    task = find_state(states, "ProcessEadFile")
+    assert task["TimeoutSeconds"] == 140
+
+
+@pytest.mark.parametrize(
+    "performance",
+    [
+        {"process_eads": {"memory": 1024}},
+        {"process_ead": {"memory_mb": 1024}},
+        {"architecture": "sparc"},
+        {"process_ead": {"timeout_seconds": 600}},
+    ],
+)
+def test_performance_profile_validated(performance):
+    with pytest.raises(ValueError):
+        build_template(
+            {"type": "ead", "s3": {"bucket": "test-bucket", "prefix": "test-prefix/"}}, performance=performance
+        )
@@ -0,0 +1,34 @@
+"""Unit tests for the embedded metric format helpers."""
+
+import json
+
+from shared import telemetry
+
+
+def test_metric_document_shape():
+    document = telemetry.metric_document(
+        {"ChunkCount": 3, "ParseTime": (12.5, "Milliseconds")},
+        dimensions={"Function": "ProcessEad"},
+        properties={"Source": "s3://bucket/file.xml"},
+    )
+
+    directive = document["_aws"]["CloudWatchMetrics"][0]
+    assert directive["Namespace"] == telemetry.NAMESPACE
+    assert directive["Dimensions"] == [["Function"]]
+    assert directive["Metrics"] == [
+        {"Name": "ChunkCount", "Unit": "None"},
+        {"Name": "ParseTime", "Unit": "Milliseconds"},
+    ]
+    assert document["ChunkCount"] == 3
+    assert document["ParseTime"] == 12.5
+    assert document["Function"] == "ProcessEad"
+    assert document["Source"] == "s3://bucket/file.xml"
+    assert isinstance(document["_aws"]["Timestamp"], int)
+
+
+def test_emit_metrics_prints_single_json_line(capsys):
+    telemetry.emit_metrics({"BytesWritten": (10, "Bytes")}, dimensions={"Function": "ProcessEad"})
+
+    output = capsys.readouterr().out.strip().splitlines()
+    assert len(output) == 1
+    assert json.loads(output[0])["BytesWritten"] == 10